@@ -0,0 +1,60 @@
+"""
+apps/api/bench/bench_columnar.py
+────────────────────────────────
+Benchmark: DataFrame construction for a chart-sized result.
+
+  inferred : pd.DataFrame(rows) + pandas dtype inference (the old path)
+  typed    : columnar.to_frame from the Postgres column types
+
+Run from apps/api:  python -m bench.bench_columnar [rows]
+"""
+
+import datetime as dt
+import decimal
+import sys
+import time
+
+import pandas as pd
+
+from services.columnar import to_frame
+from services.executor import QueryResult
+
+
+def synthetic_result(n: int) -> QueryResult:
+    start = dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc)
+    rows = [
+        (start + dt.timedelta(minutes=i), i, decimal.Decimal(i) / 100, f"plan{i % 7}")
+        for i in range(n)
+    ]
+    return QueryResult(
+        ["ts", "n", "amount", "plan"], rows, types=["timestamptz", "int8", "numeric", "text"]
+    )
+
+
+def _best_ms(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def main(n: int = 100_000) -> dict:
+    result = synthetic_result(n)
+    inferred = pd.DataFrame(result.rows, columns=result.columns)
+    typed = to_frame(result)
+    results = {
+        "rows": n,
+        "inferred_ms": _best_ms(lambda: pd.DataFrame(result.rows, columns=result.columns)),
+        "typed_ms": _best_ms(lambda: to_frame(result)),
+        "inferred_mb": inferred.memory_usage(deep=True).sum() / 2**20,
+        "typed_mb": typed.memory_usage(deep=True).sum() / 2**20,
+    }
+    for k, v in results.items():
+        print(f"{k:>12}: {v:10.1f}" if isinstance(v, float) else f"{k:>12}: {v:10d}")
+    return results
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
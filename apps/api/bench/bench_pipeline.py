@@ -0,0 +1,110 @@
+"""
+apps/api/bench/bench_pipeline.py
+────────────────────────────────
+Micro-benchmarks for the CPU-bound steps of /ask and /chart, with a JSON
+baseline for regression checks.
+
+  validate_*  : validate_sql, new SQL text (cold) and repeated SQL (warm)
+  schema_*    : catalog → prompt text (what fetch_tables_schema returns),
+                whole schema and a pruned 12-table render
+  template_*  : template fast path on a 200-table catalog, for a question
+                it answers (hit) and one it leaves to the models (miss)
+  preview_*   : /ask preview text for a 20-row page
+  downsample_*: chart point budget applied to a 100k-point series
+  png_*       : df_to_png end to end (needs kaleido; skipped without it)
+
+Needs the API's environment (FERNET_KEY) because the preview formatter
+lives in main.py.
+
+Run from apps/api:  python -m bench.bench_pipeline [--save] [--baseline PATH]
+"""
+
+import argparse
+import datetime as dt
+import decimal
+import importlib.util
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bench.bench_schema_index import synthetic_catalog
+from bench.common import best_ms, compare, per_call_us, print_results
+from services.catalog import Table
+from services.templates import match as template_match
+from services.validator import validate_sql
+from services.viz import df_to_png, downsample
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+QUERIES = [
+    "SELECT * FROM payments;",
+    "SELECT status, COUNT(*) FROM payments GROUP BY status;",
+    "SELECT a.id, b.amount FROM payments a JOIN payments b ON b.id = a.id LIMIT 5;",
+]
+
+
+def _preview_rows(n: int = 20) -> list[tuple]:
+    start = dt.datetime(2024, 1, 1)
+    return [
+        (i, f"user{i}@example.com", decimal.Decimal(i * 7) / 100, start + dt.timedelta(days=i), None)
+        for i in range(n)
+    ]
+
+
+def _series(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "day": pd.date_range("2020-01-01", periods=n, freq="min"),
+        "amount": np.random.default_rng(7).normal(size=n).cumsum(),
+    })
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    from main import format_preview
+
+    catalog = synthetic_catalog(200, 12)
+    # the table the benchmark queries run against
+    catalog.tables["payments"] = Table(
+        "payments", ("id", "status", "amount"), ("int4", "text", "numeric"), ("id",), (), 1e6
+    )
+    names = list(catalog.tables)[:12]
+    rows = _preview_rows()
+    big = _series(100_000)
+
+    results = {
+        "validate_cold_us": per_call_us(
+            lambda i: validate_sql(f"/* {i} */ " + QUERIES[i % len(QUERIES)], catalog), 200
+        ),
+        "validate_warm_us": per_call_us(lambda i: validate_sql(QUERIES[i % len(QUERIES)], catalog), 5000),
+        "schema_prompt_us": per_call_us(lambda i: catalog.to_prompt(sizes=True), 200),
+        "schema_pruned_us": per_call_us(lambda i: catalog.render(names, sizes=True), 2000),
+        "template_hit_us": per_call_us(
+            lambda i: template_match("Show number of payments by status.", catalog), 2000
+        ),
+        "template_miss_us": per_call_us(
+            lambda i: template_match("Which users churned after the price change?", catalog), 2000
+        ),
+        "preview_20_rows_us": per_call_us(lambda i: format_preview(rows), 5000),
+        "downsample_100k_ms": best_ms(lambda: downsample(big)),
+    }
+    if importlib.util.find_spec("kaleido") is not None:
+        small = _series(500)
+        df_to_png(small)  # first call starts kaleido's browser
+        results["png_500_points_ms"] = best_ms(lambda: df_to_png(small))
+        results["png_100k_points_ms"] = best_ms(lambda: df_to_png(big))
+    else:
+        print("kaleido not installed: skipping png_*")
+
+    print_results(results)
+    return compare(results, args.baseline, args.tolerance, args.save)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+apps/api/bench/bench_schema_index.py
+────────────────────────────────────
+Benchmark: schema pruning on synthetic schemas with 10k+ columns.
+
+  build    : index a fresh catalog from scratch
+  update   : re-index after one table is added (incremental path)
+  select   : rank + FK expansion + budget fill for one question
+  prompt   : full schema vs pruned prompt size, in estimated tokens
+
+Run from apps/api:  python -m bench.bench_schema_index [tables] [cols]
+"""
+
+import random
+import sys
+import time
+
+from services.catalog import SchemaCatalog, Table
+from services.schema_index import SchemaIndex, estimate_tokens
+
+WORDS = (
+    "user account order payment invoice plan subscription product item price "
+    "amount status event session device region team project task note tag "
+    "refund coupon shipment warehouse vendor ledger balance rate score"
+).split()
+
+QUESTIONS = [
+    "total revenue by month",
+    "active subscriptions per plan",
+    "top 10 customers by order amount",
+    "refunds issued last week by region",
+]
+
+
+def synthetic_catalog(n_tables: int, n_cols: int, seed: int = 7) -> SchemaCatalog:
+    rnd = random.Random(seed)
+    tables = {}
+    for i in range(n_tables):
+        name = f"{rnd.choice(WORDS)}_{rnd.choice(WORDS)}_{i}"
+        cols = ["id"] + [f"{rnd.choice(WORDS)}_{rnd.choice(WORDS)}_{j}" for j in range(n_cols - 1)]
+        fks = ()
+        if tables and rnd.random() < 0.5:
+            ref = rnd.choice(list(tables))
+            fks = (((f"{ref}_id",), ref, ("id",)),)
+        tables[name] = Table(
+            name, tuple(cols), ("text",) * n_cols, ("id",), fks, float(rnd.randint(10, 10**7))
+        )
+    return SchemaCatalog(tables)
+
+
+def _ms(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1e3
+
+
+def main(n_tables: int = 1000, n_cols: int = 12, budget: int = 1500) -> dict:
+    catalog = synthetic_catalog(n_tables, n_cols)
+    index = SchemaIndex()
+    build_ms = _ms(lambda: index.update(catalog))
+
+    grown = SchemaCatalog(dict(catalog.tables))
+    extra = Table("refund_ledger_new", ("id", "refund_amount", "region"), ("text",) * 3)
+    grown.tables[extra.name] = extra
+    update_ms = _ms(lambda: index.update(grown))
+
+    select_ms = min(
+        _ms(lambda q=q: index.select(q, budget)) for q in QUESTIONS for _ in range(5)
+    )
+    pruned = grown.render(index.select(QUESTIONS[0], budget), sizes=True)
+
+    results = {
+        "columns": n_tables * n_cols,
+        "build_ms": build_ms,
+        "update_ms": update_ms,
+        "select_ms": select_ms,
+        "full_tokens": estimate_tokens(grown.to_prompt(sizes=True)),
+        "pruned_tokens": estimate_tokens(pruned),
+    }
+    for k, v in results.items():
+        print(f"{k:>14}: {v:12.1f}" if isinstance(v, float) else f"{k:>14}: {v:12d}")
+    return results
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,69 @@
+"""
+apps/api/bench/bench_validator.py
+─────────────────────────────────
+Micro-benchmark: per-call cost of SQL validation.
+
+  before : what validate_sql used to do on every call
+           (split the schema, parse_one, Guard.from_pydantic, guard.parse)
+  cold   : CompiledValidator, SQL text it has not seen before
+  warm   : CompiledValidator, repeated SQL (verdict LRU hit)
+
+Run from apps/api:  python -m bench.bench_validator
+"""
+
+import time
+
+import sqlglot
+from guardrails import Guard
+
+from services.validator import _SQL, CompiledValidator
+
+SCHEMA = "\n".join(
+    f"table_{i}(id, name, created_at, amount, status)" for i in range(200)
+) + "\nplans(id, name, price)\nusers(id, email, name, created_at)"
+
+QUERIES = [
+    "SELECT * FROM plans;",
+    "SELECT email FROM users ORDER BY created_at LIMIT 5;",
+    "SELECT status, COUNT(*) FROM table_7 GROUP BY status;",
+    "SELECT u.email, p.name FROM users u JOIN plans p ON p.id = u.id;",
+]
+
+
+def _before(sql: str, schema: str) -> str:
+    sql = sql.strip().strip("`")
+    parsed = sqlglot.parse_one(sql, dialect="postgres")
+    allowed = {line.split("(")[0] for line in schema.splitlines() if line.strip()}
+    unknown = {t.name for t in parsed.find_all(sqlglot.expressions.Table)} - allowed
+    assert not unknown
+    outcome = Guard.from_pydantic(_SQL).parse(sql)
+    return outcome.validated_output["sql"] if outcome.validated_output else sql
+
+
+def _per_call_us(fn, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main(n: int = 200) -> dict:
+    before = _per_call_us(lambda i: _before(QUERIES[i % len(QUERIES)], SCHEMA), n)
+
+    # new SQL text every call: parse + whitelist + (reused) Guard
+    compiled = CompiledValidator(SCHEMA)
+    cold_us = _per_call_us(
+        lambda i: compiled.validate(f"/* {i} */ " + QUERIES[i % len(QUERIES)]),
+        n,
+    )
+
+    warm_us = _per_call_us(lambda i: compiled.validate(QUERIES[i % len(QUERIES)]), n * 50)
+
+    results = {"before_us": before, "cold_us": cold_us, "warm_us": warm_us}
+    for k, v in results.items():
+        print(f"{k:>10}: {v:10.1f} µs/call")
+    return results
+
+
+if __name__ == "__main__":
+    main()
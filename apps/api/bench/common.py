@@ -0,0 +1,91 @@
+"""
+apps/api/bench/common.py
+────────────────────────
+Timing, percentile and baseline helpers shared by the bench suite.
+
+Baselines are flat JSON {metric: number}. A metric regresses when it moves
+the wrong way by more than the tolerance: names ending in `_per_s` are
+throughputs (higher is better), everything else is a cost (lower is
+better). Baselines are machine-specific; regenerate them with --save on
+the machine that runs the comparison.
+"""
+
+import json
+import math
+import time
+from pathlib import Path
+
+
+def per_call_us(fn, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def best_ms(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100) of *samples*."""
+    if not samples:
+        return math.nan
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def print_results(results: dict, unit: str = "") -> None:
+    for k, v in results.items():
+        text = f"{v:12.1f}" if isinstance(v, float) else f"{v:>12}"
+        print(f"{k:>32}: {text} {unit}".rstrip())
+
+
+def load_baseline(path: str | Path) -> dict:
+    path = Path(path)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_baseline(path: str | Path, results: dict) -> None:
+    numeric = {
+        k: round(v, 3) for k, v in results.items()
+        if isinstance(v, (int, float)) and not math.isnan(v)
+    }
+    Path(path).write_text(json.dumps(numeric, indent=2, sort_keys=True) + "\n")
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Human-readable lines for every metric that got worse than *tolerance*."""
+    out = []
+    for name, before in sorted(baseline.items()):
+        now = results.get(name)
+        if not isinstance(now, (int, float)) or math.isnan(now) or not before:
+            continue
+        change = (now - before) / before
+        worse = -change if name.endswith("_per_s") else change
+        if worse > tolerance:
+            out.append(f"{name}: {before:.1f} → {now:.1f} ({change:+.0%})")
+    return out
+
+
+def compare(results: dict, baseline_path: str | Path, tolerance: float, save: bool) -> int:
+    """Print regressions against the baseline (or save it); returns an exit code."""
+    if save:
+        save_baseline(baseline_path, results)
+        print(f"baseline written to {baseline_path}")
+        return 0
+    baseline = load_baseline(baseline_path)
+    if not baseline:
+        print(f"no baseline at {baseline_path} (run with --save to create one)")
+        return 0
+    worse = regressions(results, baseline, tolerance)
+    for line in worse:
+        print(f"⚠️ regression  {line}")
+    if not worse:
+        print(f"✅ within {tolerance:.0%} of {baseline_path}")
+    return 1 if worse else 0
@@ -0,0 +1,117 @@
+"""
+apps/api/bench/fake_llm.py
+──────────────────────────
+Local stand-in for the HF SQLCoder endpoint and the OpenAI chat API, for
+load tests that should measure AskDB rather than the model providers.
+
+  POST /hf                   : HF inference format, [{"generated_text": ...}]
+  POST /v1/chat/completions  : OpenAI chat-completion format
+
+Both answer with canned SQL for the sample SaaS schema
+(data/sample_saas_dump.sql), picked by keywords in the question, after
+FAKE_LLM_LATENCY_MS ± FAKE_LLM_JITTER_MS (per-backend overrides
+FAKE_HF_LATENCY_MS / FAKE_OPENAI_LATENCY_MS). FAKE_LLM_ERROR_RATE of the
+calls fail with a 503, to exercise hedging and the circuit breaker.
+
+Run from apps/api:  uvicorn bench.fake_llm:app --port 9000
+and start the API with
+  HF_ENDPOINT_URL=http://127.0.0.1:9000/hf
+  OPENAI_BASE_URL=http://127.0.0.1:9000/v1  OPENAI_API_KEY=fake
+"""
+
+import asyncio
+import os
+import random
+import re
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+
+FAKE_LLM_LATENCY_MS    = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+FAKE_LLM_JITTER_MS     = float(os.getenv("FAKE_LLM_JITTER_MS", "100"))
+FAKE_HF_LATENCY_MS     = float(os.getenv("FAKE_HF_LATENCY_MS", str(FAKE_LLM_LATENCY_MS)))
+FAKE_OPENAI_LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", str(FAKE_LLM_LATENCY_MS)))
+FAKE_LLM_ERROR_RATE    = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+
+# (keywords that must all appear in the question, SQL); first match wins
+CANNED_SQL: list[tuple[tuple[str, ...], str]] = [
+    (("revenue", "month"),
+     "SELECT date_trunc('month', paid_at) AS month, SUM(amount) AS revenue "
+     "FROM payments WHERE status = 'paid' GROUP BY 1 ORDER BY 1"),
+    (("revenue", "plan"),
+     "SELECT p.name, SUM(pay.amount) AS revenue FROM payments pay "
+     "JOIN subscriptions s ON s.user_id = pay.user_id JOIN plans p ON p.id = s.plan_id "
+     "GROUP BY p.name ORDER BY revenue DESC"),
+    (("signups", "day"),
+     "SELECT date_trunc('day', created_at) AS day, COUNT(*) AS signups "
+     "FROM users GROUP BY 1 ORDER BY 1"),
+    (("subscriptions", "status"),
+     "SELECT status, COUNT(*) AS subscriptions FROM subscriptions GROUP BY status"),
+    (("payments",),
+     "SELECT id, user_id, amount, status, paid_at FROM payments ORDER BY paid_at DESC"),
+    (("projects",),
+     "SELECT u.email, COUNT(p.id) AS projects FROM users u "
+     "LEFT JOIN projects p ON p.user_id = u.id GROUP BY u.email ORDER BY projects DESC"),
+    (("users",),
+     "SELECT id, email, name, created_at FROM users ORDER BY created_at DESC"),
+]
+DEFAULT_SQL = "SELECT id, name, price FROM plans ORDER BY price"
+
+_QUESTION = re.compile(r"\[QUESTION\](.*?)\[/QUESTION\]|Question:\s*(.*)", re.DOTALL)
+
+app = FastAPI()
+calls = {"hf": 0, "openai": 0, "errors": 0}
+
+
+def canned_sql(question: str) -> str:
+    words = question.lower()
+    for keywords, sql in CANNED_SQL:
+        if all(k in words for k in keywords):
+            return sql
+    return DEFAULT_SQL
+
+
+def _question(text: str) -> str:
+    match = _QUESTION.search(text)
+    return (match.group(1) or match.group(2)).strip() if match else text
+
+
+async def _respond(backend: str, latency_ms: float) -> None:
+    calls[backend] += 1
+    delay = max(0.0, latency_ms + random.uniform(-FAKE_LLM_JITTER_MS, FAKE_LLM_JITTER_MS))
+    await asyncio.sleep(delay / 1000)
+    if random.random() < FAKE_LLM_ERROR_RATE:
+        calls["errors"] += 1
+        raise HTTPException(503, "fake upstream error")
+
+
+@app.post("/hf")
+async def hf(request: Request):
+    prompt = (await request.json())["inputs"]
+    await _respond("hf", FAKE_HF_LATENCY_MS)
+    # like the real endpoint: the prompt (ending in [SQL]) plus the generation
+    return [{"generated_text": f"{prompt} {canned_sql(_question(prompt))}"}]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await _respond("openai", FAKE_OPENAI_LATENCY_MS)
+    sql = canned_sql(_question(body["messages"][-1]["content"]))
+    return {
+        "id": f"chatcmpl-fake-{calls['openai']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": sql},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+@app.get("/stats")
+def stats():
+    return calls
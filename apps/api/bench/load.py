@@ -0,0 +1,207 @@
+"""
+apps/api/bench/load.py
+──────────────────────
+Async load generator for /ask and /chart against a running API.
+
+C concurrent clients send N requests in total (a --chart-ratio share of
+them to /chart) and the report gives:
+
+  throughput_per_s         : completed requests per second
+  {ask,chart}_p50/95/99_ms : end-to-end latency seen by the client
+  {ask,chart}_errors       : non-2xx responses
+  stage_*_p50/95/99_ms     : per-stage latency, estimated from the
+                             askdb_stage_seconds histograms on /metrics
+                             (scraped before and after the run)
+
+Questions repeat by default, which exercises the NL→SQL, result and PNG
+caches; --unique adds a nonce so every request takes the cold path.
+--save stores the numbers as the JSON baseline, later runs report every
+metric that is more than --tolerance worse (exit code 1).
+
+Local setup (Postgres + Redis from docker-compose.services.yml):
+  python -m bench.seed --users 10000 --flush-redis
+  uvicorn bench.fake_llm:app --port 9000
+  HF_ENDPOINT_URL=http://127.0.0.1:9000/hf OPENAI_BASE_URL=http://127.0.0.1:9000/v1 \\
+    OPENAI_API_KEY=fake CLERK_DEV_BYPASS=1 uvicorn main:app --port 8001
+Run from apps/api:  python -m bench.load --team <seeded team> [--requests N] [--concurrency C]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import secrets
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from bench.common import compare, percentile, print_results
+
+BASELINE = Path(__file__).with_name("load_baseline.json")
+
+ASK_QUESTIONS = [
+    "Show monthly revenue by month",
+    "Show revenue per plan",
+    "How many subscriptions by status?",
+    "List the latest payments",
+    "Which users have the most projects?",
+    "Show all plans",
+]
+CHART_QUESTIONS = [
+    "Chart revenue by month",
+    "Chart signups per day",
+    "Chart subscriptions by status",
+]
+
+_SAMPLE = re.compile(r'^(\w+)\{(.*)\}\s+(\S+)$')
+_LABEL  = re.compile(r'(\w+)="([^"]*)"')
+
+
+# ── /metrics histograms ─────────────────────────────────────────────────────
+def parse_histograms(text: str, name: str = "askdb_stage_seconds") -> dict[tuple, dict[float, float]]:
+    """{labels without le: {upper bound: cumulative count}} for one histogram."""
+    out: dict[tuple, dict[float, float]] = defaultdict(dict)
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match or match.group(1) != f"{name}_bucket":
+            continue
+        labels = dict(_LABEL.findall(match.group(2)))
+        le = float(labels.pop("le"))  # float("+Inf") == inf
+        out[tuple(sorted(labels.items()))][le] = float(match.group(3))
+    return out
+
+
+def histogram_quantile(q: float, buckets: dict[float, float]) -> float:
+    """Prometheus-style quantile estimate: linear within the matching bucket."""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if not total:
+        return float("nan")
+    rank = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float("inf"):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def stage_report(before: str, after: str) -> dict:
+    start = parse_histograms(before)
+    results = {}
+    for labels, buckets in sorted(parse_histograms(after).items()):
+        delta = {le: n - start.get(labels, {}).get(le, 0) for le, n in buckets.items()}
+        if not delta.get(float("inf")):
+            continue
+        rest = dict(labels)
+        name = "_".join(["stage", rest.pop("stage", "")] + [v for _, v in sorted(rest.items())])
+        for q in (50, 95, 99):
+            results[f"{name}_p{q}_ms"] = histogram_quantile(q / 100, delta) * 1e3
+    return results
+
+
+# ── load ─────────────────────────────────────────────────────────────────────
+async def _scrape(client: httpx.AsyncClient, metrics_token: str | None) -> str:
+    headers = {"Authorization": f"Bearer {metrics_token}"} if metrics_token else {}
+    resp = await client.get("/metrics", headers=headers)
+    resp.raise_for_status()
+    return resp.text
+
+
+async def run(args) -> dict:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    remaining = args.requests
+    rnd = random.Random(args.seed)
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            endpoint = "chart" if rnd.random() < args.chart_ratio else "ask"
+            question = rnd.choice(CHART_QUESTIONS if endpoint == "chart" else ASK_QUESTIONS)
+            if args.unique:
+                question = f"{question} ({secrets.token_hex(4)})"
+            start = time.perf_counter()
+            try:
+                resp = await client.post(
+                    f"/{endpoint}", json={"user_id": args.user, "question": question}
+                )
+                ok = resp.is_success
+            except httpx.HTTPError:
+                ok = False
+            latencies[endpoint].append((time.perf_counter() - start) * 1e3)
+            if not ok:
+                errors[endpoint] += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=args.timeout,
+        headers={"x-slack-team": args.team, "Authorization": args.token},
+    ) as client:
+        before = await _scrape(client, args.metrics_token)
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        after = await _scrape(client, args.metrics_token)
+
+    results = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": elapsed,
+        "throughput_per_s": args.requests / elapsed,
+    }
+    for endpoint in ("ask", "chart"):
+        samples = latencies.get(endpoint)
+        if not samples:
+            continue
+        results[f"{endpoint}_requests"] = len(samples)
+        results[f"{endpoint}_errors"] = errors[endpoint]
+        for q in (50, 95, 99):
+            results[f"{endpoint}_p{q}_ms"] = percentile(samples, q)
+    results.update(stage_report(before, after))
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test /ask and /chart.")
+    parser.add_argument("--url", default="http://127.0.0.1:8001")
+    parser.add_argument("--team", required=True, help="Slack team id of the seeded workspace")
+    parser.add_argument("--user", default="bench")
+    parser.add_argument("--token", default="", help="Authorization header (not needed with CLERK_DEV_BYPASS=1)")
+    parser.add_argument("--metrics-token", default=None)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--chart-ratio", type=float, default=0.2)
+    parser.add_argument("--unique", action="store_true", help="defeat the caches with a nonce per question")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", help="also write the full results as JSON")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+    # error counts and the run's own shape are not regressions to compare
+    comparable = {
+        k: v for k, v in results.items()
+        if k.endswith(("_ms", "_per_s"))
+    }
+    return compare(comparable, args.baseline, args.tolerance, args.save)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
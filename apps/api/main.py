@@ -1,41 +1,73 @@
+import asyncio
 import asyncpg
-from apps.api.services.nl2sql import to_sql
-from services.validator import validate_sql
+from services.nl2sql import to_sql, router as nl2sql_router
+from services.validator import avalidate_sql, parse_sql
 #from services.validator import _tables_schema
-from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Callable
+from fastapi import FastAPI, Request, Depends, HTTPException, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Callable, Literal
 import redis.asyncio as redis
 import os
 from jose import jwt, JWTError
 #from utils import get_database_url  # or wherever you place it
 
 from fastapi.concurrency import run_in_threadpool
-from fastapi import FastAPI, Depends, HTTPException, Response
-import pandas as pd
+import math
 import time
-
-from services.workspace import get_user_conn
-from services.viz import df_to_png, cache_key
-#from services.cache import get_png, set_png
-from services.schema_introspection import fetch_tables_schema,get_cached_schema
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+
+from services.workspace import get_user_conn, resolve_tenant, resolve_workspace
+from services.pools import registry as pool_registry
+from services import tenant_cache, sql_cache, http_clients
+from contextlib import aclosing
+import json
+from services.executor import run_query, fetch_result, stream_rows
+from services import followup, result_handles
+from services.router import AllBackendsFailed
+from services import cost_guard
+from services.cost_guard import QueryRejected
+from utils import close_control_pool
+from services.viz import cache_key
+from services.columnar import to_frame
+from services import render_pool, jobs, rate_limit, telemetry, batch
+from services.render_pool import RenderBusy
+from services.cache import get_png, set_png
+from services.schema_introspection import get_cached_catalog
+from services.catalog import SchemaCatalog
 #from services.schema_introspection import get_cached_schema
 
-import pandas as pd, duckdb
-
-import posthog
-posthog.project_api_key = os.getenv("POSTHOG_API_KEY")
-posthog.host = os.getenv("POSTHOG_HOST")
-
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # customer-DB pools are created lazily; start the idle reaper
+    pool_registry.start()
+    # evict cached tenants on control-plane NOTIFY
+    tenant_cache.listener.start()
+    # warm chart renderers before taking traffic
+    await render_pool.pool.start()
+    # background /jobs workers (JOB_WORKERS=0 on web-only nodes)
+    jobs.workers.start()
+    # PostHog batches go out from a background task
+    telemetry.exporter.start()
+    try:
+        yield
+    finally:
+        await jobs.workers.close()
+        await tenant_cache.listener.close()
+        await telemetry.exporter.close()
+        await http_clients.close()
+        await render_pool.pool.close()
+        await pool_registry.close()
+        await close_control_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Clerk Settings
 CLERK_PUBLISHABLE_KEY = os.getenv("CLERK_PUBLISHABLE_KEY")
 CLERK_JWT_ISSUER = "https://clerk."  # Adjust if needed
-
-# Redis Connection
-rds = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+# GET /metrics requires "Authorization: Bearer <token>" when set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 
 
@@ -44,47 +76,55 @@ class AskPayload(BaseModel):
     user_id: str
     question: str
 
-# Rate Limit Middleware: 5 queries per minute per user
-async def rate_limit(request: Request, call_next: Callable):
-    if request.url.path != "/ask":
-        return await call_next(request)
+class JobPayload(AskPayload):
+    kind: Literal["ask", "chart"] = "ask"
 
-    auth = request.headers.get("authorization", "")
-    user = auth or "anon"
-    key = f"rate:{user}"
+class FilterSpec(BaseModel):
+    column: str                     # output column, or [table.]column it reads
+    op: Literal["=", "!=", "<", "<=", ">", ">=", "in", "between", "is_null", "not_null"]
+    value: Any = None
 
-    current = await rds.incr(key)
-    if current == 1:
-        await rds.expire(key, 60)
+class RefinePayload(BaseModel):
+    filters: list[FilterSpec] = []
+    limit: int | None = Field(default=None, ge=1)
 
-    if current > 5:
-        return JSONResponse(
-            status_code=429,
-            content={"detail": "Rate limit 5 QPM"},
-        )
+class BatchPayload(BaseModel):
+    user_id: str
+    questions: list[str] = Field(min_length=1, max_length=batch.ASK_BATCH_MAX)
 
-    return await call_next(request)
+ASK_PREVIEW_ROWS = 20
+PAGE_SIZE_MAX    = int(os.getenv("PAGE_SIZE_MAX", "500"))
+STREAM_MAX_ROWS  = int(os.getenv("STREAM_MAX_ROWS", "1000000"))
+STREAM_MAX_BYTES = int(os.getenv("STREAM_MAX_BYTES", str(512 << 20)))
 
-app.middleware("http")(rate_limit)
 
 async def clerk_guard(request: Request) -> str:
-    # 1) auth bypass for local dev
-    if os.getenv("CLERK_DEV_BYPASS") == "1":
-        uid = "dev-user"
-    else:
-        token = request.headers.get("authorization")
-        if not token:
-            raise HTTPException(status_code=401, detail="Missing bearer token")
-        try:
-            payload = jwt.decode(
-                token,
-                CLERK_PUBLISHABLE_KEY,
-                issuer=CLERK_JWT_ISSUER,
-                options={"verify_aud": False}
-            )
+    with telemetry.stage("auth"):
+        # 1) auth bypass for local dev
+        if os.getenv("CLERK_DEV_BYPASS") == "1":
+            uid = "dev-user"
+        else:
+            token = request.headers.get("authorization")
+            if not token:
+                raise HTTPException(status_code=401, detail="Missing bearer token")
+            key = tenant_cache.token_key(token)
+            payload = tenant_cache.claims.get(key)
+            if payload is None:
+                try:
+                    payload = jwt.decode(
+                        token,
+                        CLERK_PUBLISHABLE_KEY,
+                        issuer=CLERK_JWT_ISSUER,
+                        options={"verify_aud": False}
+                    )
+                except JWTError:
+                    raise HTTPException(status_code=401, detail="Invalid Clerk token")
+                # never cache past the token's own expiry
+                exp = payload.get("exp")
+                ttl = exp - time.time() if exp else None
+                if ttl is None or ttl > 0:
+                    tenant_cache.claims.set(key, payload, ttl)
             uid = payload["sub"]
-        except JWTError:
-            raise HTTPException(status_code=401, detail="Invalid Clerk token")
 
     # 2) stash the Clerk user ID for downstream dependencies:
     request.state.uid = uid
@@ -95,10 +135,105 @@ async def clerk_guard(request: Request) -> str:
     return uid
 
 
+async def rate_limited(request: Request, clerk_sub: str = Depends(clerk_guard)) -> str:
+    """clerk_guard plus the workspace/user token buckets; returns the user id."""
+    workspace, _ = await resolve_tenant(request)
+    await charge_rate_limit(workspace, clerk_sub)
+    return clerk_sub
+
+
+async def charge_rate_limit(workspace, clerk_sub: str, cost: float = 1) -> None:
+    """Debit *cost* requests from the token buckets, or answer 429."""
+    decision = await rate_limit.limiter.take(
+        workspace["id"], clerk_sub, rate_limit.quota_for(workspace), cost=cost
+    )
+    if not decision.allowed:
+        retry_after = max(1, math.ceil(decision.retry_after))
+        raise HTTPException(
+            status_code=429,
+            detail=f"⏳ Rate limit exceeded. Try again in {retry_after}s.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+async def generate_sql(workspace, question: str, catalog: SchemaCatalog) -> tuple[str, str]:
+    """NL → validated SQL, served from the NL→SQL cache when possible."""
+    async def _generate() -> tuple[str, str]:
+        raw_sql, source = await to_sql(question, catalog, str(workspace["id"]))
+        with telemetry.stage("validate"):
+            return await avalidate_sql(raw_sql, catalog), source
+
+    try:
+        sql, source, _hit = await sql_cache.get_or_generate(
+            str(workspace["id"]), question, catalog.to_prompt(), _generate
+        )
+    except ValueError as e:
+        # guardrails or syntax failure
+        raise HTTPException(status_code=400, detail=str(e))
+    except (AllBackendsFailed, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return sql, source
+
+
+def guard_flags(result) -> dict:
+    """What the cost guard did to the query, for the response body."""
+    return {"limited": result.limited, "downgraded": result.downgraded}
+
+
+def format_preview(rows) -> str:
+    """Slack-ready text for an /ask preview page."""
+    if not rows:
+        return "∅ No rows."
+    body = "\n".join(" | ".join(str(v) for v in row) for row in rows)
+    return f"```\n{body}\n```"
+
+
+def freshness(result) -> str | None:
+    """ISO time of the replica snapshot that answered, None for live data."""
+    if result.as_of is None:
+        return None
+    return datetime.fromtimestamp(result.as_of, timezone.utc).isoformat(timespec="seconds")
+
+
+@app.exception_handler(QueryRejected)
+async def query_rejected_handler(request: Request, exc: QueryRejected):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+
+@app.exception_handler(RenderBusy)
+async def render_busy_handler(request: Request, exc: RenderBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "❌ Chart renderer is busy. Try again shortly."},
+        headers={"Retry-After": "2"},
+    )
+
+
+@app.exception_handler(asyncpg.exceptions.QueryCanceledError)
+async def query_canceled_handler(request: Request, exc: asyncpg.exceptions.QueryCanceledError):
+    return JSONResponse(
+        status_code=422,
+        content={"detail": "❌ Query exceeded the statement timeout. Try a narrower question."},
+    )
+
+
 # Healthcheck
 @app.get("/healthz")
 def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "pools": pool_registry.stats(),
+        "tenant_cache": tenant_cache.stats(),
+        "sql_cache": sql_cache.stats(),
+        "router": nl2sql_router.snapshot(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    """Stage latency histograms and event counters, Prometheus text format."""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Missing or invalid metrics token")
+    return PlainTextResponse(telemetry.metrics_text(), media_type="text/plain; version=0.0.4")
 
 # Main /ask endpoint
 #@app.post("/ask")
@@ -108,95 +243,403 @@ def health_check():
 async def ask(
     payload: AskPayload,
     request: Request,
-    clerk_sub: str               = Depends(clerk_guard),
-    conn:     asyncpg.Connection = Depends(get_user_conn),
+    clerk_sub: str               = Depends(rate_limited),
     ):     # bring in the Request
-    start = time.perf_counter()
+    workspace, dsn = await resolve_tenant(request)
+    return await answer_question(workspace, dsn, clerk_sub, payload.question)
 
-    # 0) Introspect the customer's schema once per request (or use your TTL cache)
-    #schema_str = await fetch_tables_schema(conn)
-    dsn = request.state.dsn
-    schema_str = await get_cached_schema(conn, dsn)
-    # 1) NL → SQL with the live schema
-    raw_sql, source = await to_sql(payload.question, schema_str)
 
-    # 2) Validate against that same schema
-    try:
-        sql = validate_sql(raw_sql, schema_str)
-    except ValueError as e:
-        # guardrails or syntax failure
-        raise HTTPException(status_code=400, detail=str(e))
+async def answer_question(workspace, dsn: str, clerk_sub: str, question: str) -> dict:
+    """The /ask pipeline, shared by the endpoint and background jobs."""
+    start = time.perf_counter()
 
-    # 3) Run the query on the injected connection
-    rows = await conn.fetch(sql)
+    # 0) Cached schema before borrowing a customer connection: a cold
+    #    schema refresh needs one of its own from the same pool
+    with telemetry.stage("schema"):
+        catalog = await get_cached_catalog(dsn)
+    # 1+2) NL → SQL with the live schema, validated against that same schema
+    sql, source = await generate_sql(workspace, question, catalog)
+    return await answer_sql(workspace, dsn, clerk_sub, sql, source, catalog, start)
+
+
+async def answer_sql(
+    workspace, dsn: str, clerk_sub: str, sql: str, source: str,
+    catalog: SchemaCatalog, start: float,
+) -> dict:
+    """Run validated *sql* and answer like /ask, with a handle for follow-ups."""
+    # 3) Result cache, else cost guard + a pooled connection;
+    #    only the preview page is read from the cursor
+    with telemetry.stage("query"):
+        async with pool_registry.connection(dsn) as conn:
+            result, cached = await run_query(
+                conn, sql, dsn, workspace, max_rows=ASK_PREVIEW_ROWS,
+                catalog=catalog,
+            )
 
     # 4) Build a <=20-row preview
-    if not rows:
-        answer = "∅ No rows."
-    else:
-        lines = [" | ".join(str(v) for v in rec.values()) for rec in rows[:20]]
-        answer = f"```\n{'\n'.join(lines)}\n```"
+    answer = format_preview(result.rows)
+
+    # a handle for /results/{handle} (more pages, refinements) without the LLM
+    handle = cursor = None
+    if result.sql is not None:
+        keys = followup.order_keys(parse_sql(result.sql), result.columns, result.types)
+        handle = await result_handles.create(
+            workspace["id"], clerk_sub, result.sql, result.columns,
+            types=result.types, keys=keys, tree=parse_sql(sql),
+        )
+        if handle and keys and result.truncated:
+            cursor = followup.next_cursor(result.rows, keys, None)
 
-    # 5) Telemetry
+    # 5) Telemetry (queued; sent in batches off the request path)
     lat_ms = (time.perf_counter() - start) * 1000
-    posthog.capture(
-        clerk_sub,
-        "query_executed",
-        {"lat_ms": lat_ms, "cached": False, "source": source},
+    event = {"lat_ms": lat_ms, "cached": cached, "source": source}
+    telemetry.capture(clerk_sub, "query_executed", event)
+    telemetry.log.info("ask", extra={"fields": {"workspace": str(workspace["id"]), **event}})
+
+    return {
+        "answer": answer,
+        "handle": handle,
+        "has_more": result.truncated,
+        "next_cursor": cursor,
+        "as_of": freshness(result),
+        **guard_flags(result),
+    }
+
+
+async def _load_handle(handle: str, request: Request, clerk_sub: str) -> dict:
+    data = await result_handles.load(handle, request.state.workspace["id"], clerk_sub)
+    if data is None:
+        raise HTTPException(404, "Unknown or expired result handle")
+    return data
+
+
+@app.get("/results/{handle}")
+async def result_page(
+    handle: str,
+    request: Request,
+    page: int = 2,
+    page_size: int = ASK_PREVIEW_ROWS,
+    cursor: str | None = None,
+    clerk_sub: str               = Depends(clerk_guard),
+    conn:     asyncpg.Connection = Depends(get_user_conn),
+):
+    """
+    Fetch a further page of a previous /ask result without regenerating SQL:
+    after *cursor* (keyset, from next_cursor) when given, else by *page* number.
+    """
+    data = await _load_handle(handle, request, clerk_sub)
+    if page < 1 or not 1 <= page_size <= PAGE_SIZE_MAX:
+        raise HTTPException(400, f"page must be >= 1 and page_size in 1..{PAGE_SIZE_MAX}")
+    budget = cost_guard.budget_for(request.state.workspace)
+
+    if cursor is None:
+        result = await fetch_result(
+            conn, data["sql"], offset=(page - 1) * page_size, max_rows=page_size,
+            settings=budget.session_settings(),
+        )
+        return {
+            "columns": result.columns,
+            "types": result.types,
+            "rows": result.rows,
+            "page": page,
+            "has_more": result.truncated,
+            "next_cursor": None,
+        }
+
+    keys = data.get("keys")
+    if not keys:
+        raise HTTPException(400, "❌ This result only supports paging by page number")
+    try:
+        prev = followup.decode_cursor(cursor, keys, data["types"])
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    sql, args = followup.page_query(parse_sql(data["sql"]), keys, prev, page_size, budget.max_limit)
+    if sql is None:
+        return {"columns": data["columns"], "types": data["types"], "rows": [],
+                "page": None, "has_more": False, "next_cursor": None}
+    result = await fetch_result(
+        conn, sql, max_rows=page_size, settings=budget.session_settings(), args=args,
     )
+    return {
+        "columns": result.columns,
+        "types": result.types,
+        "rows": result.rows,
+        "page": None,
+        "has_more": result.truncated,
+        "next_cursor": followup.next_cursor(result.rows, keys, prev) if result.truncated else None,
+    }
+
+
+@app.post("/results/{handle}/refine")
+async def refine_result(
+    handle: str,
+    payload: RefinePayload,
+    request: Request,
+    clerk_sub: str = Depends(rate_limited),
+):
+    """
+    Re-run a previous /ask query with extra filters and/or a new LIMIT,
+    edited on its stored AST: no LLM call. Answers like /ask.
+    """
+    start = time.perf_counter()
+    workspace, dsn = await resolve_tenant(request)
+    data = await _load_handle(handle, request, clerk_sub)
+    tree = result_handles.tree_of(data)
+    if tree is None:
+        raise HTTPException(400, "❌ This result can't be refined")
+    with telemetry.stage("schema"):
+        catalog = await get_cached_catalog(dsn)
+    try:
+        sql = followup.refine(
+            tree, [f.model_dump() for f in payload.filters], payload.limit, catalog
+        )
+        with telemetry.stage("validate"):
+            sql = await avalidate_sql(sql, catalog)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await answer_sql(workspace, dsn, clerk_sub, sql, "refine", catalog, start)
 
-    return {"answer": answer}
 
+@app.post("/ask/stream")
+async def ask_stream(
+    payload: AskPayload,
+    request: Request,
+    clerk_sub: str = Depends(rate_limited),
+):
+    """
+    NDJSON for programmatic clients: a {"columns": [...]} line, one JSON
+    array per row, then {"done": true, "rows": n, "limited": .., "downgraded": ..}.
+    """
+    _, dsn = await resolve_tenant(request)
+    with telemetry.stage("schema"):
+        catalog = await get_cached_catalog(dsn)
+    sql, source = await generate_sql(request.state.workspace, payload.question, catalog)
+    budget = cost_guard.budget_for(request.state.workspace)
+    async with pool_registry.connection(dsn) as conn:
+        admission = await cost_guard.admit(conn, sql, budget, stream=True, catalog=catalog)
+
+    async def _lines():
+        # own connection: it must outlive this handler while the body streams
+        async with pool_registry.connection(dsn) as conn:
+            n = 0
+            async with aclosing(stream_rows(
+                conn, admission.sql, max_rows=STREAM_MAX_ROWS, max_bytes=STREAM_MAX_BYTES,
+                settings=budget.session_settings(),
+            )) as it:
+                columns = await anext(it)
+                yield json.dumps({"columns": columns, "source": source}) + "\n"
+                async for row in it:
+                    n += 1
+                    yield json.dumps(row, default=str) + "\n"
+            yield json.dumps({
+                "done": True, "rows": n, **guard_flags(admission),
+            }) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
+@app.post("/ask/batch")
+async def ask_batch(
+    payload: BatchPayload,
+    request: Request,
+    clerk_sub: str = Depends(clerk_guard),
+):
+    """
+    Up to ASK_BATCH_MAX questions with one tenant lookup, schema fetch and
+    rate-limit charge. NDJSON, one line per question as it completes:
+    {"index": i, "question": .., <the /ask response>} or {"index": i,
+    "question": .., "error": .., "status": ..}, then {"done": true, ...}.
+    """
+    workspace, dsn = await resolve_tenant(request)
+    groups = batch.distinct(payload.questions)
+    await charge_rate_limit(workspace, clerk_sub, cost=batch.cost(groups))
+    with telemetry.stage("schema"):
+        catalog = await get_cached_catalog(dsn)
+
+    async def _answer(question: str) -> dict:
+        start = time.perf_counter()
+        sql, source = await generate_sql(workspace, question, catalog)
+        return await answer_sql(workspace, dsn, clerk_sub, sql, source, catalog, start)
+
+    async def _lines():
+        failed = 0
+        async with aclosing(batch.run(groups, _as_job_error(_answer))) as outcomes:
+            async for indexes, outcome in outcomes:
+                failed += len(indexes) if "error" in outcome else 0
+                for i in indexes:
+                    line = {"index": i, "question": payload.questions[i], **outcome}
+                    yield json.dumps(line, default=str) + "\n"
+        yield json.dumps({
+            "done": True, "questions": len(payload.questions),
+            "distinct": len(groups), "failed": failed,
+        }) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
 
 
 @app.post("/chart")
 async def chart(
     payload: AskPayload,
     request: Request,
-    clerk_sub: str             = Depends(clerk_guard),
-    conn:     asyncpg.Connection = Depends(get_user_conn),
+    clerk_sub: str             = Depends(rate_limited),
 ):
+    workspace, dsn = await resolve_tenant(request)
+    png, headers = await render_chart(
+        workspace, dsn, clerk_sub, payload.question,
+        if_none_match=request.headers.get("if-none-match", ""),
+    )
+    if png is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
+
+
+async def render_chart(
+    workspace, dsn: str, clerk_sub: str, question: str, if_none_match: str = ""
+) -> tuple[bytes | None, dict]:
+    """
+    The /chart pipeline, shared by the endpoint and background jobs:
+    (PNG, response headers), or (None, headers) when *if_none_match*
+    already names this chart.
+    """
     t0 = time.perf_counter()
-    print("⚡ Step 1: received", time.perf_counter() - t0)
 
-    # ← fetch the live schema for this customer
-    dsn = request.state.dsn
-    schema_str = await get_cached_schema(conn, dsn)
+    # ← fetch the live schema for this customer (no connection held yet)
+    with telemetry.stage("schema"):
+        catalog = await get_cached_catalog(dsn)
 
-    # 1) NL → SQL against the dynamic schema
-    raw_sql, source = await to_sql(payload.question, schema_str)
-    # 2) Validate against that same schema
-    try:
-        sql = validate_sql(raw_sql, schema_str)
-    except ValueError as e:
-        # guardrails or syntax failure
-        raise HTTPException(status_code=400, detail=str(e))
-    print("⚡ Step 2: to_sql done", time.perf_counter() - t0)
+    # 1+2) NL → SQL against the dynamic schema, validated against it
+    sql, source = await generate_sql(workspace, question, catalog)
 
-    # 3) Run it on the injected connection
-    print("⚡ Step 3: executing query", time.perf_counter() - t0)
-    rows = await conn.fetch(sql)
-    print("⚡ Step 4: Fetched rows", time.perf_counter() - t0)
+    # 3) Run it on a pooled connection
+    with telemetry.stage("query"):
+        async with pool_registry.connection(dsn) as conn:
+            result, cached = await run_query(
+                conn, sql, dsn, workspace, catalog=catalog
+            )
 
-    if not rows:
+    if not result.rows:
         raise HTTPException(404, "No data to plot")
 
-    df = pd.DataFrame(rows)
-    print("⚡ Step 5: DataFrame built", time.perf_counter() - t0)
+    with telemetry.stage("dataframe"):
+        df = to_frame(result)
+
+    # 4) Same data + spec → same PNG: honour If-None-Match, then the PNG cache
+    etag = f'"{cache_key(df)}"'
+    if etag in if_none_match:
+        return None, {"ETag": etag}
 
-    # 4) Generate the PNG in a threadpool
-    png = await run_in_threadpool(df_to_png, df)
-    print("⚡ Step 6: PNG generated", time.perf_counter() - t0)
+    digest = etag.strip('"')
+    png = await get_png(digest)
+    if png is None:
+        # Render in a warm worker process (downsampled to the point budget)
+        with telemetry.stage("render"):
+            png = await render_pool.pool.render(df)
+        await set_png(digest, png)
 
-    # 5) Telemetry
+    # 5) Telemetry (queued; sent in batches off the request path)
     lat_ms = (time.perf_counter() - t0) * 1000
-    posthog.capture(clerk_sub, "query_executed", {
-        "lat_ms": lat_ms,
-        "cached": False,
-        "source": source,
-    })
+    event = {"lat_ms": lat_ms, "cached": cached, "source": source}
+    telemetry.capture(clerk_sub, "query_executed", event)
+    telemetry.log.info("chart", extra={"fields": {
+        "workspace": str(workspace["id"]), "rows": len(result.rows), **event,
+    }})
+
+    return png, {
+        "ETag": etag,
+        "X-AskDB-Limited": str(result.limited).lower(),
+        "X-AskDB-Downgraded": str(result.downgraded).lower(),
+        **({"X-AskDB-As-Of": freshness(result)} if result.as_of is not None else {}),
+    }
 
-    return Response(content=png, media_type="image/png")
+# ── background jobs ─────────────────────────────────────────────────────────
+JOB_WAIT_MAX = float(os.getenv("JOB_WAIT_MAX", "30"))
+
+
+async def _ask_job(job: dict) -> tuple[dict, None]:
+    workspace, dsn = await resolve_workspace(job["slack_team_id"], job["clerk_sub"])
+    return await answer_question(workspace, dsn, job["clerk_sub"], job["question"]), None
+
+
+async def _chart_job(job: dict) -> tuple[dict, bytes]:
+    workspace, dsn = await resolve_workspace(job["slack_team_id"], job["clerk_sub"])
+    try:
+        png, headers = await render_chart(workspace, dsn, job["clerk_sub"], job["question"])
+    except RenderBusy:
+        raise jobs.Retry()
+    return {"headers": headers}, png
+
+
+def _as_job_error(run):
+    """Map the API's own exception types onto HTTP errors for job records and batches."""
+    async def wrapped(job):
+        try:
+            return await run(job)
+        except QueryRejected as e:
+            raise HTTPException(422, str(e))
+        except asyncpg.exceptions.QueryCanceledError:
+            raise HTTPException(422, "❌ Query exceeded the statement timeout. Try a narrower question.")
+    return wrapped
+
+
+jobs.runners.update(ask=_as_job_error(_ask_job), chart=_as_job_error(_chart_job))
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    payload: JobPayload,
+    request: Request,
+    response: Response,
+    clerk_sub: str = Depends(rate_limited),
+):
+    """Queue an /ask or /chart question; poll GET /jobs/{job_id} for the outcome."""
+    workspace, _ = await resolve_tenant(request)
+    job_id, deduplicated = await jobs.submit(
+        payload.kind, workspace["id"], request.state.slack_team_id, clerk_sub, payload.question
+    )
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return {"job_id": job_id, "deduplicated": deduplicated}
+
+
+async def _owned_job(job_id: str, request: Request, clerk_sub: str, wait: float = 0) -> dict:
+    workspace, _ = await resolve_tenant(request)
+    job = await jobs.wait(job_id, workspace["id"], clerk_sub, min(max(wait, 0), JOB_WAIT_MAX))
+    if job is None:
+        raise HTTPException(404, "Unknown or expired job")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(
+    job_id: str,
+    request: Request,
+    wait: float = 0,
+    clerk_sub: str = Depends(clerk_guard),
+):
+    """Job status (and an /ask job's answer); ?wait=N long-polls up to N seconds."""
+    return jobs.public(await _owned_job(job_id, request, clerk_sub, wait))
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(
+    job_id: str,
+    request: Request,
+    clerk_sub: str = Depends(clerk_guard),
+):
+    """The finished job's response, exactly as /ask or /chart would have sent it."""
+    job = await _owned_job(job_id, request, clerk_sub)
+    if job["status"] == "failed":
+        raise HTTPException(int(job.get("status_code", 500)), job.get("error"))
+    if job["status"] != "done":
+        return JSONResponse(
+            status_code=202, content=jobs.public(job), headers={"Retry-After": "1"}
+        )
+    result = json.loads(job["result"])
+    if job["kind"] == "ask":
+        return result
+    png = await jobs.blob(job_id)
+    if png is None:
+        raise HTTPException(404, "Unknown or expired job")
+    return Response(content=png, media_type="image/png", headers=result["headers"])
 
 # from cryptography.fernet import Fernet
 
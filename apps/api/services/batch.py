@@ -0,0 +1,79 @@
+"""
+apps/api/services/batch.py
+──────────────────────────
+Many questions in one request (POST /ask/batch), for digests and
+dashboards that ask the same workspace 20-50 things in a row.
+
+• the caller resolves auth, tenant and schema once for the whole batch,
+• questions that only differ in case, spacing or trailing punctuation
+  (sql_cache.normalize_question) are answered once,
+• at most ASK_BATCH_CONCURRENCY questions of a batch are in flight; each
+  borrows a pooled connection only while its query runs,
+• outcomes are yielded as they complete, not in request order; a failed
+  question becomes {"error", "status"} and the rest carry on,
+• the rate limiter is charged once, ASK_BATCH_QUESTION_COST per distinct
+  question, before any work starts.
+"""
+
+import asyncio
+import os
+from typing import AsyncIterator, Awaitable, Callable
+
+from fastapi import HTTPException
+
+from .sql_cache import normalize_question
+from .telemetry import log
+
+ASK_BATCH_MAX           = int(os.getenv("ASK_BATCH_MAX", "50"))
+ASK_BATCH_CONCURRENCY   = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
+ASK_BATCH_QUESTION_COST = float(os.getenv("ASK_BATCH_QUESTION_COST", "1.0"))
+
+
+def distinct(questions: list[str]) -> dict[str, list[int]]:
+    """{question as first asked: indexes of every question equivalent to it}."""
+    groups: dict[str, list[int]] = {}
+    first: dict[str, str] = {}
+    for i, question in enumerate(questions):
+        key = normalize_question(question)
+        groups.setdefault(first.setdefault(key, question), []).append(i)
+    return groups
+
+
+def cost(groups: dict[str, list[int]]) -> float:
+    """Rate-limit tokens for a batch of *groups* distinct questions."""
+    return len(groups) * ASK_BATCH_QUESTION_COST
+
+
+async def run(
+    groups: dict[str, list[int]],
+    answer: Callable[[str], Awaitable[dict]],
+    concurrency: int = ASK_BATCH_CONCURRENCY,
+) -> AsyncIterator[tuple[list[int], dict]]:
+    """
+    Async generator of (indexes, outcome) per distinct question, as each one
+    completes. Closing it early (e.g. the client went away) cancels the
+    questions still in flight.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(question: str) -> dict:
+        async with semaphore:
+            try:
+                return await answer(question)
+            except HTTPException as e:
+                return {"error": str(e.detail), "status": e.status_code}
+            except Exception as e:
+                log.warning("batch question failed", extra={"fields": {"error": repr(e)}})
+                return {"error": "❌ Question failed.", "status": 500}
+
+    pending = {asyncio.ensure_future(one(q)): indexes for q, indexes in groups.items()}
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield pending.pop(task), task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
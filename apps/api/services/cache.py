@@ -0,0 +1,59 @@
+"""
+apps/api/services/cache.py
+──────────────────────────
+Content-addressed PNG cache for /chart.
+
+Keys come from viz.cache_key (hash of the result data + chart spec), so
+identical data always maps to the same image and the key doubles as the
+HTTP ETag. PNGs live in Redis with an LRU index: reads refresh an entry's
+recency (and ttl), and once CHART_CACHE_MAX_BYTES is exceeded the least
+recently used charts are dropped. Byte accounting happens atomically in
+services.lru.lru_put.
+"""
+
+import os
+import time
+
+import redis.asyncio as redis
+
+from utils import get_redis_bytes
+from .lru import lru_put
+
+CHART_CACHE_TTL             = int(os.getenv("CHART_CACHE_TTL", "86400"))
+CHART_CACHE_MAX_BYTES       = int(os.getenv("CHART_CACHE_MAX_BYTES", str(256 << 20)))
+CHART_CACHE_MAX_ENTRY_BYTES = int(os.getenv("CHART_CACHE_MAX_ENTRY_BYTES", str(4 << 20)))
+
+_IDX   = "png:idx"
+_SIZES = "png:sz"
+_TOTAL = "png:bytes"
+
+
+def _key(digest: str) -> str:
+    return f"png:{digest}"
+
+
+async def get_png(digest: str) -> bytes | None:
+    r = get_redis_bytes()
+    try:
+        png = await r.get(_key(digest))
+        if png is not None:
+            async with r.pipeline(transaction=False) as pipe:
+                pipe.zadd(_IDX, {_key(digest): time.time()})
+                pipe.expire(_key(digest), CHART_CACHE_TTL)
+                await pipe.execute()
+    except redis.RedisError:
+        return None
+    return png
+
+
+async def set_png(digest: str, png: bytes) -> None:
+    if len(png) > CHART_CACHE_MAX_ENTRY_BYTES:
+        return
+    try:
+        await lru_put(
+            get_redis_bytes(), _key(digest), png,
+            ttl=CHART_CACHE_TTL, idx=_IDX, sizes=_SIZES, total=_TOTAL,
+            budget=CHART_CACHE_MAX_BYTES,
+        )
+    except redis.RedisError:
+        pass  # cache is best-effort
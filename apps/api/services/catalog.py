@@ -0,0 +1,206 @@
+"""
+apps/api/services/catalog.py
+────────────────────────────
+Structured view of a customer schema, built from one catalog query.
+
+Per table: column names and types (parallel tuples), primary key, foreign
+keys and the planner's row estimate (pg_class.reltuples). Everything is
+slotted tuples so catalogs with thousands of columns stay small, and the
+whole thing round-trips through plain JSON lists for caching.
+
+`to_prompt()` renders the familiar "users(id, email, ...)" text used for
+the NL→SQL cache fingerprint; `to_prompt(sizes=True)` adds approximate row
+counts for the model prompt. Both are built once per catalog.
+"""
+
+import json
+
+import asyncpg
+
+_CATALOG_SQL = """
+SELECT c.relname                                   AS table_name,
+       c.reltuples::float8                         AS row_estimate,
+       cols.names                                  AS columns,
+       cols.types                                  AS types,
+       coalesce(pk.cols, '{}')                     AS pk,
+       coalesce(fk.defs, '[]')::text               AS fks
+  FROM pg_class c
+  JOIN pg_namespace n ON n.oid = c.relnamespace
+ CROSS JOIN LATERAL (
+        SELECT array_agg(a.attname::text ORDER BY a.attnum)                         AS names,
+               array_agg(format_type(a.atttypid, a.atttypmod) ORDER BY a.attnum)    AS types
+          FROM pg_attribute a
+         WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+       ) cols
+  LEFT JOIN LATERAL (
+        SELECT array_agg(a.attname::text ORDER BY k.ord) AS cols
+          FROM pg_constraint con
+         CROSS JOIN unnest(con.conkey) WITH ORDINALITY k(attnum, ord)
+          JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+         WHERE con.conrelid = c.oid AND con.contype = 'p'
+       ) pk ON true
+  LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_array(
+                 (SELECT array_agg(a.attname::text ORDER BY k.ord)
+                    FROM unnest(con.conkey) WITH ORDINALITY k(attnum, ord)
+                    JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum),
+                 rc.relname::text,
+                 (SELECT array_agg(a.attname::text ORDER BY k.ord)
+                    FROM unnest(con.confkey) WITH ORDINALITY k(attnum, ord)
+                    JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum)
+               )) AS defs
+          FROM pg_constraint con
+          JOIN pg_class rc ON rc.oid = con.confrelid
+         WHERE con.conrelid = c.oid AND con.contype = 'f'
+       ) fk ON true
+ WHERE n.nspname = 'public'
+   AND c.relkind IN ('r', 'v', 'm', 'p', 'f')
+   AND has_table_privilege(c.oid, 'SELECT')
+   AND cols.names IS NOT NULL
+ ORDER BY c.relname
+"""
+
+# just the planner estimates, for refreshing sizes without re-introspecting
+_ESTIMATES_SQL = """
+SELECT c.relname AS table_name, c.reltuples::float8 AS row_estimate
+  FROM pg_class c
+  JOIN pg_namespace n ON n.oid = c.relnamespace
+ WHERE n.nspname = 'public'
+   AND c.relkind IN ('r', 'v', 'm', 'p', 'f')
+   AND has_table_privilege(c.oid, 'SELECT')
+"""
+
+
+class Table:
+    __slots__ = ("name", "columns", "types", "pk", "fks", "row_estimate")
+
+    def __init__(
+        self,
+        name: str,
+        columns: tuple[str, ...],
+        types: tuple[str, ...],
+        pk: tuple[str, ...] = (),
+        fks: tuple[tuple[tuple[str, ...], str, tuple[str, ...]], ...] = (),
+        row_estimate: float | None = None,
+    ):
+        self.name = name
+        self.columns = columns
+        self.types = types
+        self.pk = pk
+        self.fks = fks  # ((local cols), referenced table, (referenced cols))
+        self.row_estimate = row_estimate
+
+    def to_list(self) -> list:
+        return [self.name, self.columns, self.types, self.pk,
+                [[list(c), t, list(r)] for c, t, r in self.fks], self.row_estimate]
+
+    @classmethod
+    def from_list(cls, data: list) -> "Table":
+        name, columns, types, pk, fks, rows = data
+        return cls(
+            name, tuple(columns), tuple(types), tuple(pk),
+            tuple((tuple(c), t, tuple(r)) for c, t, r in fks), rows,
+        )
+
+
+def _approx(n: float) -> str:
+    for unit, scale in (("B", 1e9), ("M", 1e6), ("k", 1e3)):
+        if n >= scale:
+            return f"{n / scale:.1f}".rstrip("0").rstrip(".") + unit
+    return str(int(n))
+
+
+def _line(t: Table, sizes: bool) -> str:
+    line = f"{t.name}({', '.join(t.columns)})"
+    if sizes and t.row_estimate is not None:
+        line += f"  -- ~{_approx(t.row_estimate)} rows"
+    return line
+
+
+class SchemaCatalog:
+    __slots__ = ("tables", "_prompts", "_column_names")
+
+    def __init__(self, tables: dict[str, Table]):
+        self.tables = tables
+        self._prompts: dict[bool, str] = {}
+        self._column_names: frozenset[str] | None = None
+
+    def to_prompt(self, sizes: bool = False) -> str:
+        prompt = self._prompts.get(sizes)
+        if prompt is None:
+            prompt = self._prompts[sizes] = "\n".join(
+                _line(t, sizes) for t in sorted(self.tables.values(), key=lambda t: t.name)
+            )
+        return prompt
+
+    def render(self, names, sizes: bool = False) -> str:
+        """Prompt text for just the tables in *names*, in alphabetical order."""
+        return "\n".join(_line(self.tables[n], sizes) for n in sorted(names))
+
+    @property
+    def column_names(self) -> frozenset[str]:
+        """Every column name of every table (for unqualified references)."""
+        if self._column_names is None:
+            self._column_names = frozenset(
+                c for t in self.tables.values() for c in t.columns
+            )
+        return self._column_names
+
+    def row_estimate(self, table: str) -> float | None:
+        t = self.tables.get(table)
+        return t.row_estimate if t is not None else None
+
+    def with_row_estimates(self, estimates: dict[str, float | None]) -> "SchemaCatalog":
+        """
+        This catalog with *estimates* applied; `self` when none of them
+        changed. A new catalog (not an in-place update) so the cached prompts
+        stay consistent for whoever still holds the old one.
+        """
+        changed = {
+            name: estimates[name]
+            for name, t in self.tables.items()
+            if name in estimates and estimates[name] != t.row_estimate
+        }
+        if not changed:
+            return self
+        tables = dict(self.tables)
+        for name, estimate in changed.items():
+            t = tables[name]
+            tables[name] = Table(t.name, t.columns, t.types, t.pk, t.fks, estimate)
+        return SchemaCatalog(tables)
+
+    def to_list(self) -> list:
+        return [t.to_list() for t in self.tables.values()]
+
+    @classmethod
+    def from_list(cls, data: list) -> "SchemaCatalog":
+        tables = (Table.from_list(d) for d in data)
+        return cls({t.name: t for t in tables})
+
+
+async def fetch_catalog(conn: asyncpg.Connection) -> SchemaCatalog:
+    """Build the catalog for the public schema in one round trip."""
+    tables: dict[str, Table] = {}
+    for r in await conn.fetch(_CATALOG_SQL):
+        tables[r["table_name"]] = Table(
+            r["table_name"],
+            tuple(r["columns"]),
+            tuple(r["types"]),
+            tuple(r["pk"]),
+            tuple(
+                (tuple(cols or ()), ref, tuple(ref_cols or ()))
+                for cols, ref, ref_cols in json.loads(r["fks"])
+            ),
+            _estimate(r["row_estimate"]),
+        )
+    return SchemaCatalog(tables)
+
+
+async def fetch_row_estimates(conn: asyncpg.Connection) -> dict[str, float | None]:
+    """{table: planner row estimate} for the public schema; no column work."""
+    return {r["table_name"]: _estimate(r["row_estimate"]) for r in await conn.fetch(_ESTIMATES_SQL)}
+
+
+def _estimate(reltuples: float | None) -> float | None:
+    # -1 (PG14+) / 0: never analyzed, so unknown
+    return reltuples if reltuples and reltuples > 0 else None
@@ -0,0 +1,198 @@
+"""
+apps/api/services/cost_guard.py
+───────────────────────────────
+Pre-execution admission for validated SQL.
+
+1. inject a LIMIT, or clamp an existing one, to the workspace's row cap
+   (a separate, larger cap for NDJSON streaming),
+2. EXPLAIN (FORMAT JSON) the query; over the cost threshold it is first
+   downgraded to a smaller LIMIT, and rejected if that still isn't enough,
+3. hand the executor the per-workspace `statement_timeout` / `work_mem`
+   it sets with SET LOCAL inside its read-only transaction.
+
+Thresholds come from the workspace row (NULL → env default). When the
+schema catalog says every table the query reads is small (planner row
+estimates), the EXPLAIN round trip is skipped altogether.
+Rejections raise QueryRejected, which the API maps to HTTP 422; otherwise
+an Admission says what ran and whether it was limited or downgraded, so
+callers can tell the user.
+"""
+
+import json
+import os
+
+import asyncpg
+from sqlglot import exp
+
+from .catalog import SchemaCatalog
+from .validator import parse_sql
+
+COST_GUARD_MAX_COST        = float(os.getenv("COST_GUARD_MAX_COST", "1e7"))
+COST_GUARD_MAX_PLAN_ROWS   = float(os.getenv("COST_GUARD_MAX_PLAN_ROWS", "1e8"))
+COST_GUARD_MAX_LIMIT       = int(os.getenv("COST_GUARD_MAX_LIMIT", os.getenv("RESULT_MAX_ROWS", "10000")))
+COST_GUARD_MAX_STREAM_ROWS = int(os.getenv("COST_GUARD_MAX_STREAM_ROWS", os.getenv("STREAM_MAX_ROWS", "1000000")))
+COST_GUARD_DOWNGRADE_LIMIT = int(os.getenv("COST_GUARD_DOWNGRADE_LIMIT", "500"))
+COST_GUARD_SMALL_ROWS      = float(os.getenv("COST_GUARD_SMALL_ROWS", "10000"))
+STATEMENT_TIMEOUT_MS       = int(os.getenv("STATEMENT_TIMEOUT_MS", "15000"))
+WORK_MEM                   = os.getenv("WORK_MEM", "16MB")
+
+
+class QueryRejected(Exception):
+    pass
+
+
+class Budget:
+    """Per-workspace execution limits."""
+
+    __slots__ = (
+        "max_cost", "max_plan_rows", "max_limit", "max_stream_rows",
+        "statement_timeout_ms", "work_mem",
+    )
+
+    def __init__(
+        self,
+        max_cost: float = COST_GUARD_MAX_COST,
+        max_plan_rows: float = COST_GUARD_MAX_PLAN_ROWS,
+        max_limit: int = COST_GUARD_MAX_LIMIT,
+        max_stream_rows: int = COST_GUARD_MAX_STREAM_ROWS,
+        statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+        work_mem: str = WORK_MEM,
+    ):
+        self.max_cost = max_cost
+        self.max_plan_rows = max_plan_rows
+        self.max_limit = max_limit
+        self.max_stream_rows = max_stream_rows
+        self.statement_timeout_ms = statement_timeout_ms
+        self.work_mem = work_mem
+
+    def session_settings(self) -> dict[str, str]:
+        return {
+            "statement_timeout": str(self.statement_timeout_ms),
+            "work_mem": self.work_mem,
+        }
+
+    def tag(self) -> str:
+        """Everything that changes what admit() lets through (for cache keys)."""
+        return f"{self.max_cost}:{self.max_plan_rows}:{self.max_limit}"
+
+
+class Admission:
+    """Outcome of admit(): the SQL to run and what the guard did to it."""
+
+    __slots__ = ("sql", "limited", "downgraded")
+
+    def __init__(self, sql: str, limited: bool = False, downgraded: bool = False):
+        self.sql = sql
+        self.limited = limited        # a LIMIT was injected or lowered
+        self.downgraded = downgraded  # cut to COST_GUARD_DOWNGRADE_LIMIT for cost
+
+
+def budget_for(workspace) -> Budget:
+    ws = dict(workspace) if workspace is not None else {}
+    b = Budget()
+    if ws.get("max_query_cost") is not None:
+        b.max_cost = float(ws["max_query_cost"])
+    if ws.get("max_result_rows") is not None:
+        b.max_limit = int(ws["max_result_rows"])
+    if ws.get("statement_timeout_ms") is not None:
+        b.statement_timeout_ms = int(ws["statement_timeout_ms"])
+    if ws.get("work_mem") is not None:
+        b.work_mem = ws["work_mem"]
+    return b
+
+
+# ── LIMIT injection ──────────────────────────────────────────────────────────
+def _literal_limit(tree: exp.Expression) -> int | None:
+    limit = tree.args.get("limit")
+    if limit is None:
+        return None
+    value = limit.expression
+    if isinstance(value, exp.Literal) and value.is_int:
+        return int(value.this)
+    return -1  # non-literal LIMIT: treat as unbounded
+
+
+def clamp_limit(tree: exp.Expression, max_rows: int) -> exp.Expression:
+    """Return a copy of *tree* whose LIMIT is at most *max_rows*."""
+    current = _literal_limit(tree)
+    if current is not None and 0 <= current <= max_rows:
+        return tree
+    return tree.limit(max_rows, copy=True)
+
+
+# ── EXPLAIN-based admission ─────────────────────────────────────────────────
+def _all_small(tree: exp.Expression, catalog: SchemaCatalog | None) -> bool:
+    """
+    True if the catalog knows every table read and even their cross product
+    is tiny: a join can't produce more rows than that, whatever it joins on.
+    """
+    if catalog is None:
+        return False
+    bound = 1.0
+    for t in tree.find_all(exp.Table):
+        rows = catalog.row_estimate(t.name)
+        if rows is None:
+            return False
+        bound *= max(rows, 1.0)
+        if bound > COST_GUARD_SMALL_ROWS:
+            return False
+    return True
+
+
+
+async def explain(conn: asyncpg.Connection, sql: str) -> tuple[float, float]:
+    """Return (total cost, largest row estimate of any plan node)."""
+    raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql.rstrip().rstrip(';')}")
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+
+    # the root's row estimate is capped by LIMIT; a cross join hides below it
+    max_rows, stack = 0.0, [plan]
+    while stack:
+        node = stack.pop()
+        max_rows = max(max_rows, node.get("Plan Rows", 0))
+        stack.extend(node.get("Plans", ()))
+    return plan["Total Cost"], max_rows
+
+
+async def admit(
+    conn: asyncpg.Connection,
+    sql: str,
+    budget: Budget,
+    *,
+    stream: bool = False,
+    catalog: SchemaCatalog | None = None,
+) -> Admission:
+    """
+    Return the Admission for *sql* (LIMIT injected/clamped, possibly
+    downgraded), or raise QueryRejected if the planner's estimate is over
+    budget. *stream* clamps to the streaming cap instead of max_limit.
+    """
+    tree = parse_sql(sql)
+    if not isinstance(tree, exp.Select):
+        raise QueryRejected("❌ Only SELECT statements are allowed")
+
+    cap = budget.max_stream_rows if stream else budget.max_limit
+    limited = clamp_limit(tree, cap)
+    admission = Admission(limited.sql(dialect="postgres"), limited is not tree)
+    if _all_small(tree, catalog):
+        return admission
+    cost, rows = await explain(conn, admission.sql)
+
+    if cost > budget.max_cost and cap > COST_GUARD_DOWNGRADE_LIMIT:
+        # a smaller LIMIT often lets the planner stop early; try that first
+        admission = Admission(
+            clamp_limit(tree, COST_GUARD_DOWNGRADE_LIMIT).sql(dialect="postgres"),
+            limited=True, downgraded=True,
+        )
+        cost, rows = await explain(conn, admission.sql)
+
+    if cost > budget.max_cost:
+        raise QueryRejected(
+            f"❌ Query too expensive (estimated cost {cost:,.0f} > {budget.max_cost:,.0f}). "
+            "Try narrowing it with a filter or time range."
+        )
+    if rows > budget.max_plan_rows:
+        raise QueryRejected(
+            f"❌ Query would scan too many rows (estimated {rows:,.0f})."
+        )
+    return admission
@@ -0,0 +1,187 @@
+"""
+apps/api/services/executor.py
+─────────────────────────────
+Run validated SQL against a customer database and hand back a compact,
+cache-friendly QueryResult (column names + row tuples) instead of raw
+asyncpg Records.
+
+Rows are read through a server-side cursor inside a read-only transaction
+and stop at a hard row and byte budget, so memory per request is bounded
+and time-to-first-row does not depend on the size of the full result.
+"""
+
+import os
+from contextlib import aclosing
+
+import asyncpg
+
+from . import cost_guard, result_cache
+from .catalog import SchemaCatalog
+
+RESULT_MAX_ROWS  = int(os.getenv("RESULT_MAX_ROWS", "10000"))
+RESULT_MAX_BYTES = int(os.getenv("RESULT_MAX_BYTES", str(16 << 20)))
+FETCH_BATCH      = int(os.getenv("FETCH_BATCH", "500"))
+
+
+class QueryResult:
+    __slots__ = (
+        "columns", "rows", "truncated", "sql", "limited", "downgraded", "types", "as_of",
+    )
+
+    def __init__(
+        self,
+        columns: list[str],
+        rows: list[tuple],
+        truncated: bool = False,
+        sql: str | None = None,
+        limited: bool = False,
+        downgraded: bool = False,
+        types: list[str] | None = None,
+        as_of: float | None = None,
+    ):
+        self.columns = columns
+        self.rows = rows
+        self.truncated = truncated
+        self.sql = sql                # what actually ran (after the cost guard)
+        self.limited = limited
+        self.downgraded = downgraded
+        self.types = types            # Postgres type name per column, if known
+        self.as_of = as_of            # replica snapshot time; None = live data
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+
+def _row_bytes(row: tuple) -> int:
+    """Cheap size estimate: payload length for str/bytes, 8 bytes otherwise."""
+    return sum(
+        len(v) if isinstance(v, (str, bytes)) else 8
+        for v in row
+    )
+
+
+async def stream_rows(
+    conn: asyncpg.Connection,
+    sql: str,
+    *,
+    offset: int = 0,
+    max_rows: int = RESULT_MAX_ROWS,
+    max_bytes: int = RESULT_MAX_BYTES,
+    settings: dict[str, str] | None = None,
+    types: list[str] | None = None,
+    args: tuple = (),
+):
+    """
+    Async generator: yields the column names first, then row tuples, until
+    the result, *max_rows* or *max_bytes* runs out. *args* bind the
+    query's $n parameters. *settings* (e.g.
+    statement_timeout, work_mem) are applied with SET LOCAL semantics for
+    this transaction only. If *types* is given, the Postgres type name of
+    each column is appended to it before the names are yielded. Use with
+    aclosing() so an early stop ends the transaction promptly.
+    """
+    async with conn.transaction(readonly=True):
+        if settings:
+            # set_config(..., true) == SET LOCAL, in one round trip
+            await conn.execute(
+                "SELECT " + ", ".join(
+                    f"set_config(${2 * i + 1}, ${2 * i + 2}, true)"
+                    for i in range(len(settings))
+                ),
+                *[x for kv in settings.items() for x in kv],
+            )
+        stmt = await conn.prepare(sql)
+        attributes = stmt.get_attributes()
+        if types is not None:
+            types.extend(a.type.name for a in attributes)
+        yield [a.name for a in attributes]
+
+        cur = await stmt.cursor(*args)
+        if offset:
+            await cur.forward(offset)
+        sent = size = 0
+        while sent < max_rows and size < max_bytes:
+            batch = await cur.fetch(min(FETCH_BATCH, max_rows - sent))
+            if not batch:
+                return
+            for rec in batch:
+                row = tuple(rec)
+                size += _row_bytes(row)
+                sent += 1
+                yield row
+                if size >= max_bytes:
+                    return
+
+
+async def fetch_result(
+    conn: asyncpg.Connection,
+    sql: str,
+    *,
+    offset: int = 0,
+    max_rows: int = RESULT_MAX_ROWS,
+    max_bytes: int = RESULT_MAX_BYTES,
+    settings: dict[str, str] | None = None,
+    args: tuple = (),
+) -> QueryResult:
+    """Collect up to *max_rows* rows; `truncated` says whether more were left."""
+    rows: list[tuple] = []
+    types: list[str] = []
+    size = 0
+    async with aclosing(stream_rows(
+        conn, sql, offset=offset, max_rows=max_rows + 1, max_bytes=max_bytes,
+        settings=settings, types=types, args=args,
+    )) as it:
+        columns = await anext(it)
+        async for row in it:
+            rows.append(row)
+            size += _row_bytes(row)
+    truncated = len(rows) > max_rows or size >= max_bytes
+    return QueryResult(columns, rows[:max_rows], truncated, types=types)
+
+
+async def run_query(
+    conn: asyncpg.Connection,
+    sql: str,
+    dsn: str,
+    workspace,
+    max_rows: int = RESULT_MAX_ROWS,
+    budget: cost_guard.Budget | None = None,
+    catalog: SchemaCatalog | None = None,
+) -> tuple[QueryResult, bool]:
+    """
+    Admit *sql* through the cost guard and execute it, going through the
+    opt-in result cache for *workspace* first: a hit skips admission
+    (EXPLAIN) as well as execution; *catalog* lets admission skip EXPLAIN
+    for small tables. Aggregates over tables in the workspace's analytical
+    replica run there instead (result.as_of says how fresh it is).
+    Returns (result, served_from_cache).
+    """
+    from . import replica  # replica imports this module
+
+    budget = budget or cost_guard.budget_for(workspace)
+    policy = result_cache.policy_for(workspace)
+    key = None
+    if policy is not None:
+        key = await result_cache.make_key(conn, dsn, sql, policy, max_rows, budget.tag())
+        cached = await result_cache.get(key)
+        if cached is not None:
+            columns, rows, truncated, meta = cached
+            return QueryResult(columns, rows, truncated, **meta), True
+
+    result = await replica.try_run(workspace, dsn, sql, catalog, budget, max_rows)
+    if result is None:
+        admission = await cost_guard.admit(conn, sql, budget, catalog=catalog)
+        result = await fetch_result(
+            conn, admission.sql, max_rows=max_rows, settings=budget.session_settings()
+        )
+        result.sql = admission.sql
+        result.limited = admission.limited
+        result.downgraded = admission.downgraded
+
+    if key is not None:
+        await result_cache.put(
+            key, policy, result.columns, result.rows, result.truncated,
+            {"sql": result.sql, "limited": result.limited, "downgraded": result.downgraded,
+             "types": result.types, "as_of": result.as_of},
+        )
+    return result, False
@@ -0,0 +1,284 @@
+"""
+apps/api/services/followup.py
+─────────────────────────────
+Follow-up questions on a stored query, answered without the LLM.
+
+• keyset pages: the query's ORDER BY terms are resolved to output columns
+  once, when the handle is created; the next page adds "at or after the
+  last row's key" to the WHERE (or HAVING, for aggregates) of the
+  validated SQL and skips the rows already sent that tie with that key,
+  so page N costs an index seek instead of re-reading N-1 pages. NULLs
+  sort where Postgres puts them (ASC: last, DESC: first, or as written).
+  Queries the keys can't be resolved for (no ORDER BY, window functions,
+  set operations, OFFSET, SELECT * with expressions) keep OFFSET paging,
+• refinements: structured filters and a new LIMIT applied to the stored
+  AST, on output columns or on columns of the tables the query reads; the
+  result is re-validated and run like any other query.
+
+Cursors are opaque to clients: base64 JSON of the last key, the number of
+rows sent that tie with it and the total sent. Their values are only ever
+bound as $n parameters, decoded by the column's Postgres type.
+"""
+
+import base64
+import binascii
+import datetime as dt
+import decimal
+import json
+import uuid
+
+from sqlglot import exp
+
+from .catalog import SchemaCatalog
+
+# Postgres type name → decoder for cursor values; other types: no keyset
+_DECODERS = {
+    "int2": int, "int4": int, "int8": int, "oid": int,
+    "float4": float, "float8": float,
+    "numeric": decimal.Decimal,
+    "bool": bool,
+    "text": str, "varchar": str, "bpchar": str, "name": str, "citext": str,
+    "uuid": uuid.UUID,
+    "date": dt.date.fromisoformat,
+    "time": dt.time.fromisoformat,
+    "timestamp": dt.datetime.fromisoformat,
+    "timestamptz": dt.datetime.fromisoformat,
+}
+
+FILTER_OPS = ("=", "!=", "<", "<=", ">", ">=", "in", "between", "is_null", "not_null")
+
+
+# ── ORDER BY → keyset keys ───────────────────────────────────────────────────
+def _is_aggregate(tree: exp.Select) -> bool:
+    return bool(tree.args.get("group")) or any(
+        p.find(exp.AggFunc) for p in tree.expressions
+    )
+
+
+def order_keys(tree: exp.Expression, columns: list[str], types: list[str] | None) -> list[dict] | None:
+    """
+    [{"expr": SQL, "index": output column, "desc": bool, "nulls_first": bool}]
+    for every ORDER BY term, or None if keyset paging can't be used.
+    """
+    order = tree.args.get("order") if isinstance(tree, exp.Select) else None
+    if order is None or tree.args.get("offset") is not None or not types:
+        return None
+    if tree.find(exp.Window) is not None:
+        return None
+
+    projections = tree.expressions
+    has_star = any(isinstance(p, exp.Star) or p.is_star for p in projections)
+    aliases = {p.alias_or_name: i for i, p in enumerate(projections)} if not has_star else {}
+    bodies = {p.unalias().sql(dialect="postgres"): i for i, p in enumerate(projections)} if not has_star else {}
+
+    keys = []
+    for term in order.expressions:
+        node = term.this
+        index, expr = None, node
+        if isinstance(node, exp.Literal) and node.is_int and not has_star:
+            index = int(node.this) - 1
+            if not 0 <= index < len(projections):
+                return None
+            expr = projections[index].unalias()
+        elif isinstance(node, exp.Column) and not node.table and node.name in aliases:
+            index = aliases[node.name]
+            expr = projections[index].unalias()
+        elif node.sql(dialect="postgres") in bodies:
+            index = bodies[node.sql(dialect="postgres")]
+        elif isinstance(node, exp.Column) and columns.count(node.name) == 1:
+            # SELECT *: the ordered column comes back under its own name
+            index = columns.index(node.name)
+        if index is None or index >= len(columns) or columns.count(columns[index]) != 1:
+            return None
+        if types[index] not in _DECODERS or expr.find(exp.Window) is not None:
+            return None
+        desc = bool(term.args.get("desc"))
+        nulls_first = term.args.get("nulls_first")
+        keys.append({
+            "expr": expr.sql(dialect="postgres"),
+            "index": index,
+            "desc": desc,
+            # Postgres default: NULLs are larger than any value
+            "nulls_first": desc if nulls_first is None else bool(nulls_first),
+        })
+    return keys
+
+
+# ── cursors ──────────────────────────────────────────────────────────────────
+def _encode_value(v):
+    if isinstance(v, (dt.date, dt.time, dt.datetime)):
+        return v.isoformat()
+    if isinstance(v, (decimal.Decimal, uuid.UUID)):
+        return str(v)
+    return v
+
+
+def encode_cursor(values: list, ties: int, sent: int) -> str:
+    raw = json.dumps({"v": [_encode_value(v) for v in values], "t": ties, "n": sent})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: list[dict], types: list[str]) -> tuple[list, int, int]:
+    """(key values, ties, rows sent); ValueError if *cursor* is malformed."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        raw, ties, sent = data["v"], int(data["t"]), int(data["n"])
+        if len(raw) != len(keys) or ties < 0 or sent < 0:
+            raise ValueError
+        values = [
+            None if v is None else _DECODERS[types[k["index"]]](v)
+            for k, v in zip(keys, raw)
+        ]
+    except (ValueError, TypeError, KeyError, binascii.Error, decimal.InvalidOperation) as e:
+        raise ValueError("❌ Invalid cursor") from e
+    return values, ties, sent
+
+
+def next_cursor(rows: list[tuple], keys: list[dict], prev: tuple[list, int, int] | None) -> str | None:
+    """Cursor after *rows*, the page that followed *prev* (None: the first page)."""
+    if not rows:
+        return None
+    last = [rows[-1][k["index"]] for k in keys]
+    ties = sum(1 for row in rows if [row[k["index"]] for k in keys] == last)
+    sent = len(rows)
+    if prev is not None:
+        prev_values, prev_ties, prev_sent = prev
+        sent += prev_sent
+        if prev_values == last:
+            ties += prev_ties
+    return encode_cursor(last, ties, sent)
+
+
+# ── keyset page SQL ──────────────────────────────────────────────────────────
+def _after(expr: exp.Expression, key: dict, value, param: exp.Expression | None) -> exp.Expression:
+    """Rows strictly after *value* on this key, in its sort order."""
+    if value is None:
+        # in the NULL group: only non-NULLs can follow, and only if NULLs sort first
+        return exp.not_(expr.is_(exp.null())) if key["nulls_first"] else exp.false()
+    cmp = exp.LT if key["desc"] else exp.GT
+    after = cmp(this=expr.copy(), expression=param)
+    if not key["nulls_first"]:
+        after = exp.or_(after, expr.copy().is_(exp.null()))
+    return exp.paren(after)
+
+
+def _equal(expr: exp.Expression, value, param: exp.Expression | None) -> exp.Expression:
+    return expr.copy().is_(exp.null()) if value is None else exp.EQ(this=expr.copy(), expression=param)
+
+
+def page_query(
+    tree: exp.Select,
+    keys: list[dict],
+    cursor: tuple[list, int, int],
+    page_size: int,
+    max_total: int,
+) -> tuple[str | None, tuple]:
+    """
+    (SQL, $n args) for the page after *cursor*, or (None, ()) when
+    *max_total* rows (the query's own LIMIT, or the cost guard's) are sent.
+    """
+    values, ties, sent = cursor
+    literal = tree.args.get("limit")
+    if literal is not None and isinstance(literal.expression, exp.Literal) and literal.expression.is_int:
+        max_total = min(max_total, int(literal.expression.this))
+    remaining = max_total - sent
+    if remaining <= 0:
+        return None, ()
+
+    args, params = [], []
+    for v in values:
+        if v is None:
+            params.append(None)
+        else:
+            args.append(v)
+            params.append(exp.Parameter(this=exp.Literal.number(len(args))))
+
+    exprs = [exp.maybe_parse(k["expr"], dialect="postgres") for k in keys]
+    # (k1 after v1) OR (k1 = v1 AND k2 after v2) OR ... OR (all equal)
+    branches, prefix = [], []
+    for expr, key, v, p in zip(exprs, keys, values, params):
+        branches.append(exp.and_(*prefix, _after(expr, key, v, p)) if prefix else _after(expr, key, v, p))
+        prefix.append(_equal(expr, v, p))
+    branches.append(exp.and_(*prefix))
+    condition = exp.paren(exp.or_(*branches))
+
+    page = tree.copy()
+    if _is_aggregate(page):
+        page.having(condition, copy=False)
+    else:
+        page.where(condition, copy=False)
+    page.limit(min(page_size + 1, remaining), copy=False)
+    if ties:
+        page.offset(ties, copy=False)
+    return page.sql(dialect="postgres"), tuple(args)
+
+
+# ── refinements ──────────────────────────────────────────────────────────────
+def _source_column(tree: exp.Select, name: str, catalog: SchemaCatalog) -> exp.Column:
+    """`col` or `table.col` of a table the query reads, qualified by its alias."""
+    table_name, _, column = name.rpartition(".")
+    matches = []
+    for t in tree.find_all(exp.Table):
+        if table_name and table_name not in (t.name, t.alias_or_name):
+            continue
+        known = catalog.tables.get(t.name)
+        if known is not None and column in known.columns:
+            matches.append(t.alias_or_name)
+    if len(set(matches)) != 1:
+        problem = "Ambiguous" if matches else "Unknown"
+        raise ValueError(f"❌ {problem} column: {name}")
+    return exp.column(column, table=matches[0])
+
+
+def _condition(expr: exp.Expression, op: str, value) -> exp.Expression:
+    if op == "is_null":
+        return expr.is_(exp.null())
+    if op == "not_null":
+        return exp.not_(expr.is_(exp.null()))
+    if op == "in":
+        if not isinstance(value, list) or not value:
+            raise ValueError("❌ 'in' needs a non-empty list")
+        return expr.isin(*[exp.convert(v) for v in value])
+    if op == "between":
+        if not isinstance(value, list) or len(value) != 2:
+            raise ValueError("❌ 'between' needs [low, high]")
+        return expr.between(exp.convert(value[0]), exp.convert(value[1]))
+    if isinstance(value, (list, dict)) or value is None:
+        raise ValueError(f"❌ '{op}' needs a single value")
+    cls = {"=": exp.EQ, "!=": exp.NEQ, "<": exp.LT, "<=": exp.LTE, ">": exp.GT, ">=": exp.GTE}[op]
+    return cls(this=expr, expression=exp.convert(value))
+
+
+def refine(
+    tree: exp.Expression,
+    filters: list[dict],
+    limit: int | None,
+    catalog: SchemaCatalog,
+) -> str:
+    """
+    SQL for *tree* with *filters* ({"column", "op", "value"}) ANDed in and
+    LIMIT replaced by *limit*. A filter on an aggregate output column goes
+    into HAVING; anything else filters the rows before grouping.
+    """
+    if not isinstance(tree, exp.Select):
+        raise ValueError("❌ This query can't be refined")
+    out = tree.copy()
+    projections = {p.alias_or_name: p for p in out.expressions if not isinstance(p, exp.Star)}
+    for f in filters:
+        if f["op"] not in FILTER_OPS:
+            raise ValueError(f"❌ Unknown filter op: {f['op']}")
+        projection = projections.get(f["column"])
+        if projection is not None and not isinstance(projection.unalias(), exp.Star):
+            expr = projection.unalias().copy()
+            having = expr.find(exp.AggFunc) is not None
+        else:
+            expr = _source_column(out, f["column"], catalog)
+            having = False
+        condition = _condition(expr, f["op"], f.get("value"))
+        if having:
+            out.having(condition, copy=False)
+        else:
+            out.where(condition, copy=False)
+    if limit is not None:
+        out.limit(limit, copy=False)
+    return out.sql(dialect="postgres")
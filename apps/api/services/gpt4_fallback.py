@@ -1,7 +1,5 @@
 import os, textwrap
-from openai import AsyncOpenAI
-
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from .http_clients import openai_client
 
 _SYSTEM = """
 You are an API that strictly outputs one and only one valid, complete SQL query for each input.
@@ -25,7 +23,7 @@ async def gpt4_to_sql(question: str, schema: str) -> str:
             "content": f"Schema:\n{schema}\n\nQuestion: {question}",
         },
     ]
-    resp = await client.chat.completions.create(
+    resp = await openai_client().chat.completions.create(
         model="gpt-4.1-nano",
         messages=chat,
         max_tokens=128,
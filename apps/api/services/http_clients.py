@@ -0,0 +1,112 @@
+"""
+apps/api/services/http_clients.py
+─────────────────────────────────
+Application-scoped HTTP clients for the model endpoints and telemetry.
+
+One keep-alive httpx pool per upstream (HF inference endpoint, OpenAI,
+PostHog),
+HTTP/2 when the `h2` package is available, and a timeout profile per
+endpoint. Clients are created lazily and closed from the FastAPI lifespan.
+"""
+
+import os
+
+import httpx
+from openai import AsyncOpenAI
+
+try:
+    import h2  # noqa: F401  (enables httpx HTTP/2)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE   = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_TTL   = float(os.getenv("HTTP_KEEPALIVE_TTL", "60"))
+
+HF_READ_TIMEOUT     = float(os.getenv("HF_READ_TIMEOUT", "120"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "30"))
+
+# per-endpoint timeout profiles: connect fast, allow slow generations; a
+# burst waits up to a generation's length for a pooled connection rather
+# than failing with PoolTimeout
+HF_TIMEOUT = httpx.Timeout(
+    connect=5.0,
+    read=HF_READ_TIMEOUT,
+    write=10.0,
+    pool=HF_READ_TIMEOUT,
+)
+OPENAI_TIMEOUT = httpx.Timeout(
+    connect=5.0,
+    read=OPENAI_READ_TIMEOUT,
+    write=10.0,
+    pool=OPENAI_READ_TIMEOUT,
+)
+# telemetry is best effort: give up quickly and drop the batch
+POSTHOG_TIMEOUT = httpx.Timeout(connect=2.0, read=5.0, write=5.0, pool=5.0)
+
+_hf: httpx.AsyncClient | None = None
+_openai: AsyncOpenAI | None = None
+_posthog: httpx.AsyncClient | None = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_TTL,
+    )
+
+
+def hf_client() -> httpx.AsyncClient:
+    global _hf
+    if _hf is None or _hf.is_closed:
+        _hf = httpx.AsyncClient(
+            timeout=HF_TIMEOUT,
+            limits=_limits(),
+            http2=HTTP2,
+            headers={
+                "Accept": "application/json",
+                "Authorization": f"Bearer {os.getenv('HF_ACCESS_TOKEN')}",
+                "Content-Type": "application/json",
+            },
+        )
+    return _hf
+
+
+def openai_client() -> AsyncOpenAI:
+    global _openai
+    if _openai is None:
+        _openai = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT,
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "1")),
+            http_client=httpx.AsyncClient(
+                timeout=OPENAI_TIMEOUT, limits=_limits(), http2=HTTP2
+            ),
+        )
+    return _openai
+
+
+def posthog_client() -> httpx.AsyncClient:
+    global _posthog
+    if _posthog is None or _posthog.is_closed:
+        _posthog = httpx.AsyncClient(
+            timeout=POSTHOG_TIMEOUT,
+            limits=httpx.Limits(max_connections=2, keepalive_expiry=HTTP_KEEPALIVE_TTL),
+            http2=HTTP2,
+        )
+    return _posthog
+
+
+async def close() -> None:
+    global _hf, _openai, _posthog
+    if _hf is not None:
+        await _hf.aclose()
+        _hf = None
+    if _openai is not None:
+        await _openai.close()
+        _openai = None
+    if _posthog is not None:
+        await _posthog.aclose()
+        _posthog = None
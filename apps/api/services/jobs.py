@@ -0,0 +1,334 @@
+"""
+apps/api/services/jobs.py
+─────────────────────────
+Background jobs for the slow /ask and /chart pipelines.
+
+POST /jobs answers 202 with a job id right away; the work goes through a
+Redis queue to JOB_WORKERS worker tasks, and the client polls (or
+long-polls with ?wait=) GET /jobs/{id} and fetches GET /jobs/{id}/result.
+
+• a job is a Redis hash `job:{id}` (plus `job:{id}:blob` for chart PNGs)
+  kept for JOB_TTL seconds; every worker process shares the queue, so
+  running the API with JOB_WORKERS=0 on web nodes and >0 elsewhere gives
+  separate worker processes,
+• the same question, kind, workspace and user while an earlier job is
+  queued, running or done within JOB_DEDUPE_TTL gets that job back,
+• at most JOB_WORKSPACE_CONCURRENCY jobs of one workspace run at a time;
+  a worker that pops a job of a busy workspace puts it back at the end of
+  the queue (slots older than JOB_TIMEOUT are reclaimed, so a crashed
+  worker cannot hold one forever),
+• delivery is at-least-once: a worker BLMOVEs a job id from the queue into
+  its own processing list and only drops it once the job is recorded;
+  a reaper in every worker process requeues entries claimed more than
+  JOB_TIMEOUT ago, i.e. jobs whose worker died mid-run,
+• the pipelines themselves are registered in `runners` by main.py.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import time
+from typing import Awaitable, Callable
+
+import redis.asyncio as redis
+from fastapi import HTTPException
+
+from utils import get_redis, get_redis_bytes
+from .sql_cache import normalize_question
+from .telemetry import log
+
+JOB_WORKERS               = int(os.getenv("JOB_WORKERS", "4"))
+JOB_WORKSPACE_CONCURRENCY = int(os.getenv("JOB_WORKSPACE_CONCURRENCY", "2"))
+JOB_TTL                   = int(os.getenv("JOB_TTL", "3600"))
+JOB_DEDUPE_TTL            = int(os.getenv("JOB_DEDUPE_TTL", "300"))
+JOB_TIMEOUT               = float(os.getenv("JOB_TIMEOUT", "300"))
+JOB_REQUEUE_DELAY         = float(os.getenv("JOB_REQUEUE_DELAY", "0.5"))
+JOB_REAP_INTERVAL         = float(os.getenv("JOB_REAP_INTERVAL", "60"))
+
+QUEUE      = "jobs:queue"
+PROCESSING = "jobs:processing"          # set of every worker's processing list
+FINISHED   = ("done", "failed")
+
+# kind → async fn(job record) → (JSON-able result, optional binary payload)
+Runner = Callable[[dict], Awaitable[tuple[dict, bytes | None]]]
+runners: dict[str, Runner] = {}
+
+
+class Retry(Exception):
+    """Raised by a runner to put its job back on the queue (e.g. back-pressure)."""
+
+
+def _key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def _blob_key(job_id: str) -> str:
+    return f"job:{job_id}:blob"
+
+
+def _dedupe_key(kind: str, workspace_id: str, clerk_sub: str, question: str) -> str:
+    digest = hashlib.sha256(
+        "\x00".join((workspace_id, clerk_sub, normalize_question(question))).encode()
+    ).hexdigest()[:32]
+    return f"jobs:dedupe:{kind}:{digest}"
+
+
+# ── submit / read ────────────────────────────────────────────────────────────
+async def submit(
+    kind: str, workspace_id, slack_team_id: str, clerk_sub: str, question: str
+) -> tuple[str, bool]:
+    """Queue a job; returns (job id, True if an existing job was reused)."""
+    r = get_redis()
+    workspace_id = str(workspace_id)
+    dedupe = _dedupe_key(kind, workspace_id, clerk_sub, question)
+    job_id = secrets.token_urlsafe(12)
+
+    if not await r.set(dedupe, job_id, nx=True, ex=JOB_DEDUPE_TTL):
+        existing = await r.get(dedupe)
+        if existing and await r.hget(_key(existing), "status") not in (None, "failed"):
+            return existing, True
+        await r.set(dedupe, job_id, ex=JOB_DEDUPE_TTL)
+
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(_key(job_id), mapping={
+            "id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "workspace_id": workspace_id,
+            "slack_team_id": slack_team_id,
+            "clerk_sub": clerk_sub,
+            "question": question,
+            "created_at": time.time(),
+        })
+        pipe.expire(_key(job_id), JOB_TTL)
+        pipe.lpush(QUEUE, job_id)
+        await pipe.execute()
+    return job_id, False
+
+
+async def get(job_id: str, workspace_id, clerk_sub: str) -> dict | None:
+    """The job record, or None if unknown/expired/not owned by the caller."""
+    job = await get_redis().hgetall(_key(job_id))
+    if not job or job["workspace_id"] != str(workspace_id) or job["clerk_sub"] != clerk_sub:
+        return None
+    return job
+
+
+async def wait(job_id: str, workspace_id, clerk_sub: str, timeout: float) -> dict | None:
+    """get(), but wait up to *timeout* seconds for the job to finish."""
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        job = await get(job_id, workspace_id, clerk_sub)
+        if job is None or job["status"] in FINISHED or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 1.0)
+
+
+async def blob(job_id: str) -> bytes | None:
+    return await get_redis_bytes().get(_blob_key(job_id))
+
+
+def public(job: dict) -> dict:
+    """What a client may see of a job record."""
+    out = {"job_id": job["id"], "kind": job["kind"], "status": job["status"]}
+    if job["status"] == "failed":
+        out["error"] = job.get("error")
+    if job["status"] == "done" and job["kind"] == "ask":
+        out["result"] = json.loads(job["result"])
+    return out
+
+
+# ── per-workspace slots ──────────────────────────────────────────────────────
+# KEYS[1] running zset (job id → start time); ARGV: job id, now, timeout, cap
+_ACQUIRE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[2]) - tonumber(ARGV[3]))
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) then
+  return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])) * 2)
+return 1
+"""
+
+
+_ACQUIRE_SCRIPT = get_redis().register_script(_ACQUIRE)     # no I/O until first call
+
+
+def _running_key(workspace_id: str) -> str:
+    return f"jobs:running:{workspace_id}"
+
+
+async def _acquire(r: redis.Redis, job: dict) -> bool:
+    return bool(await _ACQUIRE_SCRIPT(
+        keys=[_running_key(job["workspace_id"])],
+        args=[job["id"], time.time(), JOB_TIMEOUT, JOB_WORKSPACE_CONCURRENCY],
+        client=r,
+    ))
+
+
+# ── processing lists ─────────────────────────────────────────────────────────
+def _processing_key(worker: str) -> str:
+    return f"jobs:processing:{worker}"
+
+
+# KEYS: processing list, job hash, queue; ARGV: job id, now, timeout
+# 0 = left alone, 1 = requeued; finished or expired jobs are just dropped
+_REAP = """
+local status = redis.call('HGET', KEYS[2], 'status')
+if not status or status == 'done' or status == 'failed' then
+  redis.call('LREM', KEYS[1], 1, ARGV[1])
+  return 0
+end
+local claimed = tonumber(redis.call('HGET', KEYS[2], 'claimed_at'))
+if not claimed then
+  -- the worker died between BLMOVE and recording the claim: start the clock
+  redis.call('HSET', KEYS[2], 'claimed_at', ARGV[2])
+  return 0
+end
+if claimed > tonumber(ARGV[2]) - tonumber(ARGV[3]) then
+  return 0
+end
+redis.call('LREM', KEYS[1], 1, ARGV[1])
+redis.call('HSET', KEYS[2], 'status', 'queued')
+redis.call('HDEL', KEYS[2], 'claimed_at')
+redis.call('LPUSH', KEYS[3], ARGV[1])
+return 1
+"""
+
+# KEYS: processing set, processing list — forget lists that are empty
+_FORGET = """
+if redis.call('LLEN', KEYS[2]) == 0 then
+  redis.call('SREM', KEYS[1], KEYS[2])
+end
+return 0
+"""
+
+_REAP_SCRIPT   = get_redis().register_script(_REAP)
+_FORGET_SCRIPT = get_redis().register_script(_FORGET)
+
+
+async def _requeue(r: redis.Redis, processing: str, job_id: str) -> None:
+    """Hand a claimed job back: out of *processing*, onto the queue."""
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(_key(job_id), "status", "queued")
+        pipe.hdel(_key(job_id), "claimed_at")
+        pipe.lrem(processing, 1, job_id)
+        pipe.lpush(QUEUE, job_id)
+        await pipe.execute()
+
+
+async def reap(r: redis.Redis, timeout: float = JOB_TIMEOUT) -> int:
+    """Requeue jobs claimed more than *timeout* seconds ago; returns how many."""
+    requeued = 0
+    now = time.time()
+    for processing in await r.smembers(PROCESSING):
+        for job_id in await r.lrange(processing, 0, -1):
+            requeued += await _REAP_SCRIPT(
+                keys=[processing, _key(job_id), QUEUE], args=[job_id, now, timeout], client=r
+            )
+        await _FORGET_SCRIPT(keys=[PROCESSING, processing], client=r)
+    return requeued
+
+
+# ── workers ──────────────────────────────────────────────────────────────────
+async def _finish(r: redis.Redis, job_id: str, **fields) -> None:
+    fields["finished_at"] = time.time()
+    await r.hset(_key(job_id), mapping=fields)
+
+
+async def run_one(r: redis.Redis, job: dict, processing: str) -> None:
+    """Run a claimed job whose workspace slot is held, and record the outcome."""
+    job_id = job["id"]
+    await r.hset(_key(job_id), mapping={"status": "running", "started_at": time.time()})
+    try:
+        result, payload = await asyncio.wait_for(runners[job["kind"]](job), JOB_TIMEOUT)
+    except (Retry, asyncio.CancelledError) as e:
+        # back-pressure, or this worker is shutting down: someone else's turn
+        await _requeue(r, processing, job_id)
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        await asyncio.sleep(JOB_REQUEUE_DELAY)
+    except HTTPException as e:
+        await _finish(r, job_id, status="failed", error=str(e.detail), status_code=e.status_code)
+    except asyncio.TimeoutError:
+        await _finish(r, job_id, status="failed", error="❌ Job timed out.", status_code=504)
+    except Exception as e:
+        log.warning("job failed", extra={"fields": {"job_id": job_id, "error": repr(e)}})
+        await _finish(r, job_id, status="failed", error="❌ Job failed.", status_code=500)
+    else:
+        if payload is not None:
+            await get_redis_bytes().set(_blob_key(job_id), payload, ex=JOB_TTL)
+        await _finish(r, job_id, status="done", result=json.dumps(result, default=str))
+
+
+async def _work_once(r: redis.Redis, pop_timeout: float, processing: str) -> bool:
+    """Claim and handle one job; False if the queue stayed empty."""
+    job_id = await r.blmove(QUEUE, processing, pop_timeout, "RIGHT", "LEFT")
+    if job_id is None:
+        return False
+    job = await r.hgetall(_key(job_id))
+    if not job or job["status"] in FINISHED:
+        await r.lrem(processing, 1, job_id)
+        return True  # expired, or a duplicate queue entry
+
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.hset(_key(job_id), "claimed_at", time.time())
+        pipe.sadd(PROCESSING, processing)
+        await pipe.execute()
+    if not await _acquire(r, job):
+        # workspace at its cap: back of the line, and don't spin on it
+        await _requeue(r, processing, job_id)
+        await asyncio.sleep(JOB_REQUEUE_DELAY)
+        return True
+    try:
+        await run_one(r, job, processing)
+    finally:
+        await r.zrem(_running_key(job["workspace_id"]), job_id)
+        # recorded (or handed back): safe to forget the claim
+        await r.lrem(processing, 1, job_id)
+    return True
+
+
+class WorkerPool:
+    """N worker tasks draining the shared job queue, plus the reaper."""
+
+    def __init__(self, size: int = JOB_WORKERS):
+        self.size = size
+        self._tasks: list[asyncio.Task] = []
+
+    async def _run(self, processing: str) -> None:
+        while True:
+            try:
+                await _work_once(get_redis(), pop_timeout=5, processing=processing)
+            except redis.RedisError as exc:
+                log.warning("job worker redis error", extra={"fields": {"error": str(exc)}})
+                await asyncio.sleep(1)
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(JOB_REAP_INTERVAL)
+            try:
+                await reap(get_redis())
+            except redis.RedisError as exc:
+                log.warning("job reaper redis error", extra={"fields": {"error": str(exc)}})
+
+    def start(self) -> None:
+        if not self._tasks and self.size > 0:
+            self._tasks = [
+                asyncio.create_task(self._run(_processing_key(secrets.token_urlsafe(9))))
+                for _ in range(self.size)
+            ]
+            self._tasks.append(asyncio.create_task(self._reap()))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+workers = WorkerPool()
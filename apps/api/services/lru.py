@@ -0,0 +1,133 @@
+"""
+apps/api/services/lru.py
+────────────────────────
+Tiny in-process LRU with per-entry expiry and hit/miss counters, shared by
+the tenant, NL→SQL and other L1 caches, plus the byte-budget eviction
+helper used by the Redis-backed result and chart caches (single-node
+Redis only, see _LRU_PUT).
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any
+
+import redis.asyncio as redis
+
+from utils import get_redis_bytes
+
+
+class TTLCache:
+    """Small LRU with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Any, tuple[Any, float]] = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def discard_where(self, predicate) -> None:
+        for key in [k for k in self._data if predicate(k)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+# ── Redis byte-budget LRU ───────────────────────────────────────────────────
+# One round trip, atomic: trim index members whose payload already expired,
+# replace the entry (subtracting its previous size), then evict the least
+# recently used entries until the byte total fits the budget.
+#   KEYS: payload, idx (zset member → last use), sizes (hash), total (counter)
+#   ARGV: value, size, ttl, now, budget, meta_ttl
+#
+# Single-node Redis only (a primary with replicas/Sentinel is fine, Redis
+# Cluster is not): the EXISTS/DEL on older payloads use key names read from
+# the index, not passed in KEYS, so they may live in another hash slot. The
+# payloads stay plain string keys because each needs its own expiry.
+_LRU_PUT = """
+local payload, idx, sizes, total = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local size, ttl, now = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local budget, meta_ttl = tonumber(ARGV[5]), tonumber(ARGV[6])
+local used = tonumber(redis.call('GET', total) or '0')
+
+local function forget(member)
+  used = used - tonumber(redis.call('HGET', sizes, member) or '0')
+  redis.call('ZREM', idx, member)
+  redis.call('HDEL', sizes, member)
+end
+
+for _, m in ipairs(redis.call('ZRANGEBYSCORE', idx, '-inf', now - ttl, 'LIMIT', 0, 64)) do
+  if redis.call('EXISTS', m) == 0 then forget(m) end
+end
+
+forget(payload)
+redis.call('SET', payload, ARGV[1], 'EX', ttl)
+redis.call('ZADD', idx, now, payload)
+redis.call('HSET', sizes, payload, size)
+used = used + size
+
+while used > budget do
+  local oldest = redis.call('ZRANGE', idx, 0, 0)[1]
+  if not oldest or oldest == payload then break end
+  redis.call('DEL', oldest)
+  forget(oldest)
+end
+
+if used < 0 then used = 0 end
+redis.call('SET', total, used)
+if meta_ttl > 0 then
+  for _, k in ipairs({idx, sizes, total}) do redis.call('EXPIRE', k, meta_ttl) end
+end
+return used
+"""
+
+_LRU_PUT_SCRIPT = get_redis_bytes().register_script(_LRU_PUT)    # no I/O until first call
+
+
+async def lru_put(
+    r: redis.Redis,
+    key: str,
+    value: bytes,
+    *,
+    ttl: int,
+    idx: str,
+    sizes: str,
+    total: str,
+    budget: int,
+    meta_ttl: int = 0,
+) -> int:
+    """
+    Store *value* under *key* (expiring after *ttl* seconds) and account for
+    it in the zset *idx*, the size hash *sizes* and the byte counter *total*,
+    evicting least recently used members beyond *budget* bytes. Returns the
+    bytes in use afterwards. Readers should refresh the member's score (and
+    the payload's ttl) so expiry and recency stay in step.
+    """
+    used = await _LRU_PUT_SCRIPT(
+        keys=[key, idx, sizes, total],
+        args=[value, len(value), ttl, time.time(), budget, meta_ttl],
+        client=r,
+    )
+    return int(used)
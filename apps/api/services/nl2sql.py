@@ -1,34 +1,56 @@
-import os, httpx, backoff
+import os, httpx
 import re
-from .validator import validate_sql
+from .validator import avalidate_sql
 from .gpt4_fallback import gpt4_to_sql
+from .http_clients import hf_client
+from .router import ModelRouter
+from .catalog import SchemaCatalog
+from . import schema_index, templates
+from .telemetry import log, stage
 
 HF_URL = os.getenv("HF_ENDPOINT_URL")
-HF_TOKEN = os.getenv("HF_ACCESS_TOKEN")
 GPT4_DEV_MODE = os.getenv("GPT4_DEV") == "1"
 
+# Routing policy: backend preference order. GPT4_DEV=1 keeps its old meaning
+# (GPT-4 first) unless NL2SQL_ROUTING is set explicitly.
+ROUTING_POLICY = [
+    b.strip()
+    for b in os.getenv(
+        "NL2SQL_ROUTING", "gpt4,sqlcoder" if GPT4_DEV_MODE else "sqlcoder,gpt4"
+    ).split(",")
+    if b.strip()
+]
+
+router = ModelRouter(["sqlcoder", "gpt4"])
+
+# Prompt-schema token budget per backend ("name:tokens,..."); SQLCoder's
+# context is much smaller than GPT-4's.
+SCHEMA_TOKEN_BUDGETS = {
+    name.strip(): int(tokens)
+    for name, tokens in (
+        part.split(":")
+        for part in os.getenv("NL2SQL_SCHEMA_TOKENS", "sqlcoder:1500,gpt4:6000").split(",")
+        if part.strip()
+    )
+}
+
 async def _sqlcoder(prompt: str) -> str:
-    async with httpx.AsyncClient(timeout=120) as c:
-        r = await c.post(
-            HF_URL,
-            headers={
-                "Accept": "application/json",
-                "Authorization": f"Bearer {HF_TOKEN}",
-                "Content-Type": "application/json",
-            },
-            json={"inputs": prompt, "parameters": {}},
-        )
+    # shared keep-alive client; auth headers and timeouts live in http_clients
+    r = await hf_client().post(
+        HF_URL,
+        json={"inputs": prompt, "parameters": {}},
+    )
     try:
         r.raise_for_status()
     except Exception:
-        print("📥 HF response content (error):")
-        print(r.text)
+        log.warning("sqlcoder error response", extra={"fields": {
+            "status": r.status_code, "body": r.text[:2000],
+        }})
         raise
 
-    # Raw response from HF
+    # Raw response from HF (debug level: full model output is large)
     raw_output = r.json()[0]["generated_text"]
-    print("📤 SQLCoder raw output:")
-    print(raw_output)
+    log.debug("sqlcoder output", extra={"fields": {"output": raw_output}})
 
     # Extract SQL only from [SQL] ... marker
     match = re.search(r"\[SQL\](.*)", raw_output, re.DOTALL)
@@ -37,42 +59,69 @@ async def _sqlcoder(prompt: str) -> str:
 
     return match.group(1).strip()
 
-@backoff.on_exception(backoff.expo, httpx.HTTPError, max_time=30)
-async def to_sql(question: str, schema: str) -> tuple[str, str]:
+async def _is_valid(raw: str, schema: "str | SchemaCatalog") -> bool:
+    try:
+        await avalidate_sql(raw, schema)
+        return True
+    except Exception:
+        return False
+
+def _schema_for(backend: str, question: str, schema, workspace: str | None) -> str:
+    """Prompt schema text: pruned to the backend's token budget when we have a catalog."""
+    if not isinstance(schema, SchemaCatalog):
+        return schema
+    budget = SCHEMA_TOKEN_BUDGETS.get(backend)
+    if budget is None:
+        return schema.to_prompt(sizes=True)
+    return schema_index.prune(schema, question, budget, workspace)
+
+
+async def to_sql(
+    question: str,
+    schema: "str | SchemaCatalog",
+    workspace: str | None = None,
+    policy: list[str] | None = None,
+    use_templates: bool = templates.NL2SQL_TEMPLATES,
+) -> tuple[str, str]:
+    """
+    (raw SQL, source) for *question*: source "template" when a common
+    question shape answers it directly, else the model backend.
+    *policy* overrides ROUTING_POLICY.
+    """
+    # the catalog's names and types are what make a template answer safe
+    if use_templates and isinstance(schema, SchemaCatalog):
+        with stage("template"):
+            raw = templates.match(question, schema)
+        if raw is not None and await _is_valid(raw, schema):
+            log.info("nl2sql", extra={"fields": {"backend": "template"}})
+            return raw, "template"
+
+    # with a catalog the model sees only the relevant tables (with
+    # approximate sizes), and the validator checks columns as well as tables
+    schema_text = _schema_for("sqlcoder", question, schema, workspace)
     prompt = f"""### Task
     Generate a SQL query to answer [QUESTION]{question}[/QUESTION]
 
     ### Database Schema
     The query will run on a database with the following schema:
-    {schema}
+    {schema_text}
 
     ### Answer
     Given the database schema, here is the SQL query that [QUESTION]{question}[/QUESTION]
     [SQL]
     """
 
-    try:
-        if GPT4_DEV_MODE:
-            # Dev: Try GPT-4 first, fallback to HF if it fails
-            raw = await gpt4_to_sql(question, schema)
-            print("GPT4 used")
-            return raw, "gpt4"
-        else:
-            # Prod: Try HF first, fallback to GPT-4   
-            raw = await _sqlcoder(prompt)
-            print("hs_sqlcoder used")
-            return raw, "sqlcoder"
-    except Exception as e:
-        print(f"⚠️ Primary model failed: {e}")
-        try:
-            if GPT4_DEV_MODE:
-                raw = await _sqlcoder(prompt)
-                print("hs_sqlcoder used")
-                return raw, "sqlcoder"
-            else:
-                raw = await gpt4_to_sql(question, schema)
-                print("GPT4 used")
-                return raw, "gpt4"
-        except Exception as final:
-            print("❌ Both models failed.")
-            raise final
+    # Preferred backend first; hedge to the other once it passes its p95,
+    # first valid SQL wins. Backends with an open breaker are skipped.
+    raw, source = await router.route(
+        policy or ROUTING_POLICY,
+        {
+            "sqlcoder": lambda: _sqlcoder(prompt),
+            "gpt4":     lambda: gpt4_to_sql(
+                question, _schema_for("gpt4", question, schema, workspace)
+            ),
+        },
+        lambda raw: _is_valid(raw, schema),
+    )
+    log.info("nl2sql", extra={"fields": {"backend": source}})
+    return raw, source
@@ -0,0 +1,169 @@
+"""
+apps/api/services/pools.py
+──────────────────────────
+Registry of asyncpg pools for customer databases, keyed by decrypted DSN.
+
+• one pool per DSN, created lazily on first use,
+• LRU eviction once more than POOL_MAX_OPEN pools are open,
+• idle pools (unused for POOL_IDLE_TTL seconds) are closed by a reaper task,
+• a cheap health check before a pool is reused after sitting idle.
+
+Started and stopped from the FastAPI lifespan in main.py.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+POOL_MIN_SIZE        = int(os.getenv("POOL_MIN_SIZE", "0"))
+POOL_MAX_SIZE        = int(os.getenv("POOL_MAX_SIZE", "5"))
+POOL_MAX_OPEN        = int(os.getenv("POOL_MAX_OPEN", "200"))
+POOL_IDLE_TTL        = float(os.getenv("POOL_IDLE_TTL", "600"))
+POOL_HEALTH_AGE      = float(os.getenv("POOL_HEALTH_AGE", "30"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("POOL_ACQUIRE_TIMEOUT", "30"))
+
+
+class _Entry:
+    __slots__ = ("pool", "last_used", "in_use")
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+
+class PoolRegistry:
+    """LRU of asyncpg pools, one per customer DSN."""
+
+    def __init__(
+        self,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        max_open: int = POOL_MAX_OPEN,
+        idle_ttl: float = POOL_IDLE_TTL,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_open = max_open
+        self.idle_ttl = idle_ttl
+        self._pools: OrderedDict[str, _Entry] = OrderedDict()
+        self._creating: dict[str, asyncio.Future] = {}
+        self._reaper: asyncio.Task | None = None
+
+    # ── pool lookup ──────────────────────────────────────────────────────────
+    async def get(self, dsn: str) -> asyncpg.Pool:
+        """Return the pool for *dsn*, creating it (once) if needed."""
+        entry = self._pools.get(dsn)
+        if entry is not None:
+            self._pools.move_to_end(dsn)
+            if time.monotonic() - entry.last_used > POOL_HEALTH_AGE:
+                if not await self._healthy(entry.pool):
+                    await self._drop(dsn)
+                    return await self.get(dsn)
+            entry.last_used = time.monotonic()
+            return entry.pool
+
+        # single-flight: concurrent first requests share one create_pool(),
+        # run as its own task so a cancelled caller can't fail the others
+        task = self._creating.get(dsn)
+        if task is None:
+            task = asyncio.create_task(self._create(dsn))
+            self._creating[dsn] = task
+            task.add_done_callback(lambda t: self._created(dsn, t))
+        return await asyncio.shield(task)
+
+    async def _create(self, dsn: str) -> asyncpg.Pool:
+        pool = await asyncpg.create_pool(
+            dsn, min_size=self.min_size, max_size=self.max_size
+        )
+        self._pools[dsn] = _Entry(pool)
+        await self._evict_overflow(keep=dsn)
+        return pool
+
+    def _created(self, dsn: str, task: asyncio.Task) -> None:
+        self._creating.pop(dsn, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller went away
+
+    @asynccontextmanager
+    async def connection(self, dsn: str):
+        """
+        Borrow a connection from the pool for *dsn*. Waiting longer than
+        POOL_ACQUIRE_TIMEOUT raises asyncio.TimeoutError instead of hanging.
+        """
+        pool = await self.get(dsn)
+        entry = self._pools.get(dsn)
+        if entry is not None:
+            entry.in_use += 1
+        try:
+            async with pool.acquire(timeout=POOL_ACQUIRE_TIMEOUT) as conn:
+                yield conn
+        finally:
+            if entry is not None:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    # ── health / eviction ────────────────────────────────────────────────────
+    @staticmethod
+    async def _healthy(pool: asyncpg.Pool) -> bool:
+        try:
+            await asyncio.wait_for(pool.fetchval("SELECT 1"), timeout=5)
+            return True
+        except Exception:
+            return False
+
+    async def _drop(self, dsn: str) -> None:
+        entry = self._pools.pop(dsn, None)
+        if entry is None:
+            return
+        try:
+            await asyncio.wait_for(entry.pool.close(), timeout=10)
+        except Exception:
+            entry.pool.terminate()
+
+    async def _evict_overflow(self, keep: str | None = None) -> None:
+        # oldest first; skip pools that still have checked-out connections
+        # and the one just created for the caller
+        for dsn in list(self._pools):
+            if len(self._pools) <= self.max_open:
+                return
+            if dsn != keep and self._pools[dsn].in_use == 0:
+                await self._drop(dsn)
+
+    async def _evict_idle(self) -> None:
+        now = time.monotonic()
+        for dsn, entry in list(self._pools.items()):
+            if entry.in_use == 0 and now - entry.last_used > self.idle_ttl:
+                await self._drop(dsn)
+
+    async def _reap_forever(self) -> None:
+        interval = max(self.idle_ttl / 4, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            await self._evict_idle()
+
+    # ── lifecycle ────────────────────────────────────────────────────────────
+    def start(self) -> None:
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_forever())
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for dsn in list(self._pools):
+            await self._drop(dsn)
+
+    def stats(self) -> dict:
+        return {
+            "open_pools": len(self._pools),
+            "in_use": sum(e.in_use for e in self._pools.values()),
+        }
+
+
+# process-wide registry used by services.workspace
+registry = PoolRegistry()
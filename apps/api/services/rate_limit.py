@@ -0,0 +1,145 @@
+"""
+apps/api/services/rate_limit.py
+───────────────────────────────
+Token-bucket rate limiter for the question endpoints.
+
+Two buckets per request, one for the user and one for the whole workspace,
+both refilled continuously at their plan's rate. One Lua script refills,
+checks and debits both in a single round trip, using the Redis clock (so
+API hosts can disagree about the time), and gives every key a TTL of a
+full refill, so an idle bucket simply disappears.
+
+Quotas come from the workspace's `plan` (RATE_LIMIT_PLANS, requests per
+minute for a user / for the whole workspace), or from
+`workspaces.rate_limit_per_min` when set. A denied caller is remembered
+in-process until its Retry-After passes, so retry storms are turned away
+without touching Redis. If Redis is down the limiter fails open.
+"""
+
+import os
+import time
+
+import redis.asyncio as redis
+
+from utils import get_redis
+from .lru import TTLCache
+from .telemetry import log
+
+# plan=user_per_min/workspace_per_min,...
+RATE_LIMIT_PLANS        = os.getenv("RATE_LIMIT_PLANS", "free=5/20,team=60/300,enterprise=600/3000")
+RATE_LIMIT_DEFAULT_PLAN = os.getenv("RATE_LIMIT_DEFAULT_PLAN", "free")
+RATE_LIMIT_BURST        = float(os.getenv("RATE_LIMIT_BURST", "1.0"))   # bucket size, in minutes of quota
+RATE_LIMIT_LOCAL_SIZE   = int(os.getenv("RATE_LIMIT_LOCAL_SIZE", "10000"))
+
+
+def _parse_plans(spec: str) -> dict[str, tuple[float, float]]:
+    plans = {}
+    for item in spec.split(","):
+        name, _, quotas = item.strip().partition("=")
+        user, _, workspace = quotas.partition("/")
+        plans[name] = (float(user), float(workspace or user))
+    return plans
+
+
+plans = _parse_plans(RATE_LIMIT_PLANS)
+
+
+class Quota:
+    __slots__ = ("user_per_min", "workspace_per_min")
+
+    def __init__(self, user_per_min: float, workspace_per_min: float):
+        self.user_per_min = user_per_min
+        self.workspace_per_min = workspace_per_min
+
+
+def quota_for(workspace) -> Quota:
+    ws = dict(workspace) if workspace is not None else {}
+    user, total = plans.get(ws.get("plan") or RATE_LIMIT_DEFAULT_PLAN, plans[RATE_LIMIT_DEFAULT_PLAN])
+    if ws.get("rate_limit_per_min") is not None:
+        user = float(ws["rate_limit_per_min"])
+        total = max(total, user)
+    return Quota(user, total)
+
+
+class Decision:
+    __slots__ = ("allowed", "retry_after")
+
+    def __init__(self, allowed: bool, retry_after: float = 0.0):
+        self.allowed = allowed
+        self.retry_after = retry_after  # seconds until `cost` tokens are available
+
+
+# KEYS: user bucket, workspace bucket (hashes: tokens, ts in ms)
+# ARGV: user rate, user capacity, workspace rate, workspace capacity (per ms), cost
+# → {allowed, retry after in ms}
+# A cost above a bucket's capacity is taken from a full bucket and leaves it
+# in debt (negative tokens), repaid at the refill rate like any other use;
+# the key lives until it is full again, so the debt can't expire early.
+_TAKE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cost = tonumber(ARGV[5])
+local tokens, wait = {}, 0
+
+for i = 1, 2 do
+  local rate, cap = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+  local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local level = tonumber(b[1]) or cap
+  local ts = tonumber(b[2]) or now
+  level = math.min(cap, level + math.max(0, now - ts) * rate)
+  tokens[i] = level
+  local need = math.min(cost, cap)
+  if level < need then
+    wait = math.max(wait, math.ceil((need - level) / rate))
+  end
+end
+
+if wait == 0 then
+  for i = 1, 2 do tokens[i] = tokens[i] - cost end
+end
+for i = 1, 2 do
+  local rate, cap = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+  redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i]), 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], math.ceil((cap - tokens[i]) / rate) + 1000)
+end
+return {wait == 0 and 1 or 0, wait}
+"""
+
+
+class RateLimiter:
+    def __init__(self, burst: float = RATE_LIMIT_BURST, local_size: int = RATE_LIMIT_LOCAL_SIZE):
+        self.burst = burst
+        # (workspace, user) → monotonic time before which a call can't succeed
+        self._blocked = TTLCache(3600, local_size)
+
+    async def take(self, workspace_id, user: str, quota: Quota, cost: float = 1) -> Decision:
+        """Debit *cost* requests from the user's and the workspace's buckets."""
+        local = (str(workspace_id), user)
+        until = self._blocked.get(local)
+        if until is not None and until > time.monotonic() + 0.001:
+            return Decision(False, until - time.monotonic())
+
+        user_rate = quota.user_per_min / 60_000
+        ws_rate = quota.workspace_per_min / 60_000
+        r = get_redis()
+        try:
+            allowed, wait_ms = await r.register_script(_TAKE)(
+                keys=[f"rl:{workspace_id}:u:{user}", f"rl:{workspace_id}:ws"],
+                args=[
+                    user_rate, quota.user_per_min * self.burst,
+                    ws_rate, quota.workspace_per_min * self.burst,
+                    cost,
+                ],
+            )
+        except redis.RedisError as exc:
+            log.warning("rate limiter unavailable, allowing", extra={"fields": {"error": str(exc)}})
+            return Decision(True)
+
+        if allowed:
+            return Decision(True)
+        retry_after = int(wait_ms) / 1000
+        self._blocked.set(local, time.monotonic() + retry_after, retry_after)
+        return Decision(False, retry_after)
+
+
+limiter = RateLimiter()
@@ -0,0 +1,132 @@
+"""
+apps/api/services/render_pool.py
+────────────────────────────────
+Dedicated pool of warm chart-render worker processes.
+
+• RENDER_WORKERS processes, each rendering a throw-away figure on start so
+  kaleido/Chromium is already up when the first real chart arrives,
+• at most RENDER_QUEUE_MAX charts queued or in flight; beyond that
+  `render()` raises RenderBusy at once instead of piling up work (the
+  /chart handler turns it into 503 + Retry-After),
+• workers are recycled every RENDER_MAX_TASKS charts so a leak in the
+  renderer cannot grow a process forever,
+• a crashed worker (e.g. OOM-killed) breaks the executor; it is replaced
+  and the chart retried once.
+
+Started (and warmed) and stopped from the FastAPI lifespan in main.py.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+RENDER_WORKERS     = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_QUEUE_MAX   = int(os.getenv("RENDER_QUEUE_MAX", "16"))
+RENDER_MAX_TASKS   = int(os.getenv("RENDER_MAX_TASKS", "200"))
+RENDER_TIMEOUT     = float(os.getenv("RENDER_TIMEOUT", "60"))
+
+
+class RenderBusy(Exception):
+    """The render queue is full; retry later."""
+
+
+def _warm() -> None:
+    # worker initializer: pay the plotly import + kaleido start-up now.
+    # Best effort: an initializer that raises breaks the whole executor,
+    # while a real render surfaces the same error to its caller.
+    from .viz import df_to_png
+    try:
+        df_to_png(pd.DataFrame({"x": ["a", "b"], "y": [1, 2]}))
+    except Exception as e:
+        print(f"⚠️ render worker warm-up failed: {e}")
+
+
+def _render(df: pd.DataFrame) -> bytes:
+    from .viz import df_to_png
+    return df_to_png(df)
+
+
+class RenderPool:
+    """Bounded front door to a ProcessPoolExecutor of warm renderers."""
+
+    def __init__(
+        self,
+        workers: int = RENDER_WORKERS,
+        queue_max: int = RENDER_QUEUE_MAX,
+        max_tasks: int = RENDER_MAX_TASKS,
+        timeout: float = RENDER_TIMEOUT,
+        render=_render,
+        warm=_warm,
+    ):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.max_tasks = max_tasks
+        self.timeout = timeout
+        self._render = render
+        self._warm = warm
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _spawn(self) -> ProcessPoolExecutor:
+        # spawn, not fork: forking a process that runs an event loop and
+        # open sockets is unsafe, and max_tasks_per_child requires it
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self._warm,
+            max_tasks_per_child=self.max_tasks or None,
+        )
+
+    async def start(self) -> None:
+        """Create the workers and wait until every one of them is warm."""
+        if self._executor is not None:
+            return
+        self._executor = self._spawn()
+        loop = asyncio.get_running_loop()
+        # one no-op per worker forces them all to start (and run _warm)
+        await asyncio.gather(*(
+            loop.run_in_executor(self._executor, os.getpid) for _ in range(self.workers)
+        ))
+
+    async def render(self, df: pd.DataFrame) -> bytes:
+        """PNG bytes for *df*, rendered in a worker process."""
+        if self._pending >= self.queue_max:
+            raise RenderBusy(f"{self._pending} charts already queued")
+        self._pending += 1
+        try:
+            if self._executor is None:
+                await self.start()
+            loop = asyncio.get_running_loop()
+            for attempt in (0, 1):
+                executor = self._executor
+                try:
+                    return await asyncio.wait_for(
+                        loop.run_in_executor(executor, self._render, df), self.timeout
+                    )
+                except BrokenProcessPool:
+                    if attempt:
+                        raise
+                    # a worker died; the executor is unusable from now on
+                    if self._executor is executor:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        self._executor = self._spawn()
+        finally:
+            self._pending -= 1
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: executor.shutdown(wait=True, cancel_futures=True)
+            )
+
+
+pool = RenderPool()
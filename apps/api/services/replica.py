@@ -0,0 +1,419 @@
+"""
+apps/api/services/replica.py
+────────────────────────────
+Optional per-workspace analytical replica: selected customer tables are
+snapshotted into local Parquet files and aggregate questions are answered
+from them by DuckDB instead of the customer's OLTP database.
+
+• off unless REPLICA_DIR is set, and per workspace unless
+  `workspaces.replica_tables` lists the tables to copy,
+• a table with an `updated_at` timestamp and a primary key syncs
+  incrementally (rows changed since the high-water mark, upserted by key);
+  one with an integer `id` primary key syncs append-only (id > mark);
+  anything else is reloaded whole. Every REPLICA_FULL_EVERY seconds each
+  table is reloaded whole anyway, which also drops deleted rows,
+• syncs run in the background once the replica is older than
+  REPLICA_REFRESH_INTERVAL, one per workspace per host (flock); table
+  files are replaced atomically, so every worker process can read them
+  while a sync is running,
+• a query is routed here when it aggregates (GROUP BY or an aggregate
+  function), reads only replicated tables, and the oldest of those
+  snapshots is within `workspaces.replica_max_lag`. It is transpiled to
+  the DuckDB dialect with sqlglot; the result carries `as_of`, the time
+  of that oldest snapshot. Anything else, including a DuckDB error, runs
+  on the customer database as before.
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import time
+from contextlib import aclosing
+
+import asyncpg
+import duckdb
+from sqlglot import exp
+
+from . import executor
+from .catalog import SchemaCatalog, Table
+from .columnar import to_frame
+from .cost_guard import Budget, clamp_limit
+from .pools import registry
+from .telemetry import log
+from .validator import parse_sql
+
+REPLICA_DIR              = os.getenv("REPLICA_DIR")
+REPLICA_REFRESH_INTERVAL = float(os.getenv("REPLICA_REFRESH_INTERVAL", "300"))
+REPLICA_FULL_EVERY       = float(os.getenv("REPLICA_FULL_EVERY", "86400"))
+REPLICA_MAX_LAG          = float(os.getenv("REPLICA_MAX_LAG", "900"))
+REPLICA_MAX_ROWS         = int(os.getenv("REPLICA_MAX_ROWS", "5000000"))
+REPLICA_BATCH            = int(os.getenv("REPLICA_BATCH", "50000"))
+REPLICA_OVERLAP          = int(os.getenv("REPLICA_OVERLAP", "60"))
+REPLICA_THREADS          = int(os.getenv("REPLICA_THREADS", "2"))
+REPLICA_MEMORY_LIMIT     = os.getenv("REPLICA_MEMORY_LIMIT", "1GB")
+
+_META = "_sync.json"
+
+
+class Config:
+    __slots__ = ("workspace", "tables", "max_lag")
+
+    def __init__(self, workspace: str, tables: frozenset[str], max_lag: float):
+        self.workspace = workspace
+        self.tables = tables
+        self.max_lag = max_lag
+
+
+def config_for(workspace) -> Config | None:
+    """Read the replica settings from the control-plane workspace row."""
+    if REPLICA_DIR is None or workspace is None:
+        return None
+    ws = dict(workspace)
+    tables = ws.get("replica_tables")
+    if not tables:
+        return None
+    max_lag = ws.get("replica_max_lag")
+    return Config(
+        str(ws["id"]), frozenset(tables),
+        float(max_lag) if max_lag is not None else REPLICA_MAX_LAG,
+    )
+
+
+# ── local files ──────────────────────────────────────────────────────────────
+def _dir(workspace: str) -> str:
+    return os.path.join(REPLICA_DIR, workspace)
+
+
+def _path(workspace: str, table: str) -> str:
+    return os.path.join(_dir(workspace), f"{table}.parquet")
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+
+def load_state(workspace: str) -> dict:
+    """{table: {columns, mark, high, synced_at, full_at, rows}} of the last syncs."""
+    try:
+        with open(os.path.join(_dir(workspace), _META)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(workspace: str, state: dict) -> None:
+    path = os.path.join(_dir(workspace), _META)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+# ── Postgres → DuckDB types ──────────────────────────────────────────────────
+_DUCK_TYPES = {
+    "smallint": "SMALLINT",
+    "integer": "INTEGER",
+    "bigint": "BIGINT",
+    "real": "REAL",
+    "double precision": "DOUBLE",
+    "numeric": "DOUBLE",
+    "boolean": "BOOLEAN",
+    "date": "DATE",
+    "timestamp without time zone": "TIMESTAMP",
+    "timestamp with time zone": "TIMESTAMPTZ",
+}
+
+
+def _duck_type(pg_type: str) -> str:
+    """DuckDB column type for a format_type() string; text for the rest."""
+    base = pg_type.split("(")[0]
+    if base == "numeric" and "(" in pg_type:
+        precision = int(pg_type[pg_type.index("(") + 1:].split(",")[0].rstrip(")"))
+        if precision <= 38:
+            return "DECIMAL" + pg_type[len(base):]
+    return _DUCK_TYPES.get(base, "VARCHAR")
+
+
+def _mark_column(table: Table) -> tuple[str, str] | None:
+    """(column, kind) of the high-water mark for incremental syncs, if any."""
+    types = dict(zip(table.columns, table.types))
+    if table.pk and types.get("updated_at", "").startswith("timestamp"):
+        return "updated_at", "updated"
+    if table.pk == ("id",) and types["id"] in ("integer", "bigint", "smallint"):
+        return "id", "append"
+    return None
+
+
+# ── sync ─────────────────────────────────────────────────────────────────────
+def _staging(workspace: str) -> duckdb.DuckDBPyConnection:
+    # on-disk staging database: a full reload of a big table spills to disk
+    # instead of growing the API process
+    path = os.path.join(_dir(workspace), ".staging.duckdb")
+    for stale in (path, path + ".wal"):
+        if os.path.exists(stale):
+            os.remove(stale)
+    db = duckdb.connect(path)
+    db.execute(f"SET threads = {REPLICA_THREADS}")
+    db.execute(f"SET memory_limit = {_literal(REPLICA_MEMORY_LIMIT)}")
+    db.execute("SET TimeZone = 'UTC'")
+    return db
+
+
+def _insert(db: duckdb.DuckDBPyConnection, table: Table, batch: executor.QueryResult) -> None:
+    frame = to_frame(batch)
+    frame.columns = [f"c{i}" for i in range(len(table.columns))]
+    for i, kind in enumerate(frame.dtypes):
+        if kind == object:
+            # uuid, json, arrays, intervals …: stored as their text form
+            frame[f"c{i}"] = [None if v is None else str(v) for v in frame[f"c{i}"]]
+    db.register("batch", frame)
+    db.execute("INSERT INTO delta SELECT " + ", ".join(
+        f"CAST(c{i} AS {_duck_type(t)})" for i, t in enumerate(table.types)
+    ) + " FROM batch")
+    db.unregister("batch")
+
+
+def _publish(
+    db: duckdb.DuckDBPyConnection, workspace: str, table: Table, full: bool, mark: str | None
+) -> tuple[str | None, int]:
+    """Write the new table file (delta alone, or merged over the old file)."""
+    path = _path(workspace, table.name)
+    source = "SELECT * FROM delta"
+    if not full:
+        key = " AND ".join(f"d.{_quote(c)} = o.{_quote(c)}" for c in table.pk)
+        source = (
+            f"SELECT o.* FROM read_parquet({_literal(path)}) o "
+            f"WHERE NOT EXISTS (SELECT 1 FROM delta d WHERE {key}) "
+            f"UNION ALL {source}"
+        )
+    db.execute(f"COPY ({source}) TO {_literal(path + '.tmp')} (FORMAT parquet)")
+    os.replace(path + ".tmp", path)
+
+    high = None
+    if mark is not None:
+        high = db.execute(
+            f"SELECT max({_quote(mark)})::VARCHAR FROM read_parquet({_literal(path)})"
+        ).fetchone()[0]
+    rows = db.execute(f"SELECT count(*) FROM read_parquet({_literal(path)})").fetchone()[0]
+    return high, rows
+
+
+async def _sync_table(
+    conn: asyncpg.Connection, db: duckdb.DuckDBPyConnection, workspace: str,
+    table: Table, previous: dict | None,
+) -> dict | None:
+    """Sync one table; None if it turned out larger than REPLICA_MAX_ROWS."""
+    now = time.time()
+    marked = _mark_column(table)
+    mark, kind = marked if marked else (None, None)
+    full = (
+        previous is None
+        or mark is None
+        or previous["columns"] != list(table.columns)
+        or previous["high"] is None
+        or now - previous["full_at"] >= REPLICA_FULL_EVERY
+        or not os.path.exists(_path(workspace, table.name))
+    )
+
+    sql = f"SELECT {', '.join(_quote(c) for c in table.columns)} FROM {_quote(table.name)}"
+    args: tuple = ()
+    if not full:
+        pg_type = table.types[table.columns.index(mark)]
+        bound = f"CAST($1::text AS {pg_type})"
+        if kind == "updated":
+            # late commits can carry an updated_at just below the mark
+            sql += f" WHERE {_quote(mark)} >= {bound} - make_interval(secs => {REPLICA_OVERLAP})"
+        else:
+            sql += f" WHERE {_quote(mark)} > {bound}"
+        args = (previous["high"],)
+
+    await asyncio.to_thread(db.execute, "CREATE OR REPLACE TABLE delta (" + ", ".join(
+        f"{_quote(c)} {_duck_type(t)}" for c, t in zip(table.columns, table.types)
+    ) + ")")
+    types: list[str] = []
+    batch: list[tuple] = []
+    n = 0
+    async with aclosing(executor.stream_rows(
+        conn, sql, args=args, types=types,
+        max_rows=REPLICA_MAX_ROWS + 1, max_bytes=float("inf"),
+    )) as it:
+        columns = await anext(it)
+        async for row in it:
+            n += 1
+            if n > REPLICA_MAX_ROWS:
+                return None
+            batch.append(row)
+            if len(batch) >= REPLICA_BATCH:
+                await asyncio.to_thread(
+                    _insert, db, table, executor.QueryResult(columns, batch, types=types)
+                )
+                batch = []
+    if batch:
+        await asyncio.to_thread(
+            _insert, db, table, executor.QueryResult(columns, batch, types=types)
+        )
+
+    high, rows = await asyncio.to_thread(_publish, db, workspace, table, full, mark)
+    return {
+        "columns": list(table.columns),
+        "mark": mark,
+        "high": high if high is not None else (previous or {}).get("high"),
+        "synced_at": now,
+        "full_at": now if full else previous["full_at"],
+        "rows": rows,
+    }
+
+
+async def sync(conn: asyncpg.Connection, config: Config, catalog: SchemaCatalog) -> dict:
+    """
+    Bring the workspace's replica up to date; returns the new sync state.
+    Tables missing from the catalog or over REPLICA_MAX_ROWS are skipped.
+    Returns the current state untouched if another process is syncing.
+    """
+    os.makedirs(_dir(config.workspace), exist_ok=True)
+    lock = open(os.path.join(_dir(config.workspace), ".lock"), "w")
+    try:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return load_state(config.workspace)
+
+        state = load_state(config.workspace)
+        db = await asyncio.to_thread(_staging, config.workspace)
+        try:
+            for name in sorted(config.tables):
+                table = catalog.tables.get(name)
+                if table is None or (table.row_estimate or 0) > REPLICA_MAX_ROWS:
+                    state.pop(name, None)
+                    continue
+                entry = await _sync_table(conn, db, config.workspace, table, state.get(name))
+                if entry is None:
+                    state.pop(name, None)
+                else:
+                    state[name] = entry
+                _save_state(config.workspace, state)
+        finally:
+            db.close()
+        return state
+    finally:
+        lock.close()
+
+
+_inflight: dict[str, asyncio.Task] = {}
+
+
+async def _sync_with_pool(dsn: str, config: Config, catalog: SchemaCatalog) -> dict:
+    # own connection: the task outlives the request that started it
+    async with registry.connection(dsn) as conn:
+        return await sync(conn, config, catalog)
+
+
+def _log_sync_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("replica sync failed", extra={"fields": {"error": repr(task.exception())}})
+
+
+def _schedule_sync(dsn: str, config: Config, catalog: SchemaCatalog) -> None:
+    if config.workspace in _inflight:
+        return
+    task = asyncio.create_task(_sync_with_pool(dsn, config, catalog))
+    _inflight[config.workspace] = task
+    task.add_done_callback(lambda _t: _inflight.pop(config.workspace, None))
+    task.add_done_callback(_log_sync_error)
+
+
+# ── routing ──────────────────────────────────────────────────────────────────
+def eligible_tables(tree: exp.Expression) -> set[str] | None:
+    """Tables an aggregate SELECT reads, or None if it is not one."""
+    if not isinstance(tree, exp.Select):
+        return None
+    if tree.args.get("group") is None and tree.find(exp.AggFunc) is None:
+        return None
+    ctes = {cte.alias_or_name for cte in tree.find_all(exp.CTE)}
+    return {t.name for t in tree.find_all(exp.Table) if t.name not in ctes}
+
+
+_PG_TYPES = {
+    "BOOLEAN": "bool", "TINYINT": "int2", "SMALLINT": "int2", "INTEGER": "int4",
+    "BIGINT": "int8", "HUGEINT": "numeric", "UBIGINT": "numeric", "FLOAT": "float4",
+    "DOUBLE": "float8", "DATE": "date", "TIMESTAMP": "timestamp",
+    "TIMESTAMP WITH TIME ZONE": "timestamptz", "VARCHAR": "text",
+}
+
+
+def _pg_type(duck_type) -> str:
+    name = str(duck_type)
+    return "numeric" if name.startswith("DECIMAL") else _PG_TYPES.get(name, name.lower())
+
+
+def _query(workspace: str, tables: set[str], sql: str, max_rows: int):
+    db = duckdb.connect()
+    try:
+        db.execute(f"SET threads = {REPLICA_THREADS}")
+        db.execute(f"SET memory_limit = {_literal(REPLICA_MEMORY_LIMIT)}")
+        db.execute("SET TimeZone = 'UTC'")
+        for name in tables:
+            db.execute(
+                f"CREATE VIEW {_quote(name)} AS "
+                f"SELECT * FROM read_parquet({_literal(_path(workspace, name))})"
+            )
+        # the SQL came from a model: no file access (read_text, COPY, …)
+        # beyond this workspace's snapshots, and no way to turn that back on
+        db.execute(f"SET allowed_directories = [{_literal(_dir(workspace) + os.sep)}]")
+        db.execute("SET enable_external_access = false")
+        db.execute("SET lock_configuration = true")
+        cur = db.execute(sql)
+        columns = [d[0] for d in cur.description]
+        types = [_pg_type(d[1]) for d in cur.description]
+        return columns, types, cur.fetchmany(max_rows)
+    finally:
+        db.close()
+
+
+async def try_run(
+    workspace,
+    dsn: str,
+    sql: str,
+    catalog: SchemaCatalog | None,
+    budget: Budget,
+    max_rows: int,
+) -> "executor.QueryResult | None":
+    """
+    Answer *sql* from the replica if it is eligible and fresh enough, else
+    None. Also starts a background sync when the replica is getting old.
+    """
+    config = config_for(workspace)
+    if config is None or catalog is None:
+        return None
+
+    state = load_state(config.workspace)
+    synced = [state[t]["synced_at"] for t in config.tables if t in state]
+    if len(synced) < len(config.tables) or time.time() - min(synced) >= REPLICA_REFRESH_INTERVAL:
+        _schedule_sync(dsn, config, catalog)
+
+    tree = parse_sql(sql)
+    tables = eligible_tables(tree)
+    if not tables or not tables <= state.keys() or not tables <= config.tables:
+        return None
+    as_of = min(state[t]["synced_at"] for t in tables)
+    if time.time() - as_of > config.max_lag:
+        return None
+
+    limited = clamp_limit(tree, budget.max_limit)
+    try:
+        columns, types, rows = await asyncio.to_thread(
+            _query, config.workspace, tables, limited.sql(dialect="duckdb"), max_rows + 1
+        )
+    except duckdb.Error as e:
+        log.warning("replica query failed, using the customer database",
+                    extra={"fields": {"error": str(e)}})
+        return None
+    return executor.QueryResult(
+        columns, rows[:max_rows], len(rows) > max_rows,
+        sql=limited.sql(dialect="postgres"), limited=limited is not tree,
+        types=types, as_of=as_of,
+    )
@@ -0,0 +1,188 @@
+"""
+apps/api/services/result_cache.py
+─────────────────────────────────
+Opt-in cache of query results in Redis.
+
+    key = (workspace, DSN, canonical SQL, row budget, cost-guard budget
+           [, data version])
+
+The SQL is the validated query *before* cost-guard admission, so a hit
+costs the customer database nothing beyond the optional probe.
+
+Enabled per workspace through `workspaces.result_cache_ttl` (NULL = off).
+With `workspaces.result_cache_probe` set, the key also includes a data
+version read from pg_stat_user_tables (inserts + updates + deletes on the
+tables the query touches), so writes invalidate entries before the TTL.
+
+Payloads are zlib-compressed tagged JSON. Entries larger than
+RESULT_CACHE_MAX_ENTRY_BYTES are not stored, and each workspace keeps at
+most RESULT_CACHE_MAX_WORKSPACE_BYTES, evicting its oldest entries first.
+"""
+
+import datetime as dt
+import decimal
+import hashlib
+import json
+import os
+import uuid
+import zlib
+
+import asyncpg
+import redis.asyncio as redis
+import sqlglot
+from sqlglot import exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+from utils import get_redis_bytes
+from .lru import lru_put
+
+RESULT_CACHE_MAX_ENTRY_BYTES     = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(1 << 20)))
+RESULT_CACHE_MAX_WORKSPACE_BYTES = int(os.getenv("RESULT_CACHE_MAX_WORKSPACE_BYTES", str(32 << 20)))
+
+
+class Policy:
+    __slots__ = ("workspace", "ttl", "probe")
+
+    def __init__(self, workspace: str, ttl: int, probe: bool):
+        self.workspace = workspace
+        self.ttl = ttl
+        self.probe = probe
+
+
+def policy_for(workspace) -> Policy | None:
+    """Read the per-workspace cache settings from the control-plane row."""
+    if workspace is None:
+        return None
+    ws = dict(workspace)
+    ttl = ws.get("result_cache_ttl")
+    if not ttl:
+        return None
+    return Policy(str(ws["id"]), int(ttl), bool(ws.get("result_cache_probe")))
+
+
+# ── keys ─────────────────────────────────────────────────────────────────────
+def canonical_sql(sql: str) -> tuple[str, set[str]]:
+    """Whitespace/case-insensitive form of *sql* plus the tables it reads."""
+    tree = normalize_identifiers(sqlglot.parse_one(sql, read="postgres"), dialect="postgres")
+    tables = {t.name for t in tree.find_all(exp.Table)}
+    return tree.sql(dialect="postgres"), tables
+
+
+async def data_version(conn: asyncpg.Connection, tables: set[str]) -> str:
+    row = await conn.fetchrow(
+        """
+        SELECT coalesce(sum(n_tup_ins + n_tup_upd + n_tup_del), 0) AS writes,
+               count(*)                                             AS n
+          FROM pg_stat_user_tables
+         WHERE relname = ANY($1::text[])
+        """,
+        sorted(tables),
+    )
+    return f"{row['n']}:{row['writes']}"
+
+
+async def make_key(
+    conn: asyncpg.Connection,
+    dsn: str,
+    sql: str,
+    policy: Policy,
+    max_rows: int,
+    budget_tag: str = "",
+) -> str:
+    canonical, tables = canonical_sql(sql)
+    parts = [dsn, canonical, str(max_rows), budget_tag]
+    if policy.probe:
+        parts.append(await data_version(conn, tables))
+    digest = hashlib.sha256("\x00".join(parts).encode()).hexdigest()
+    return f"rc:{policy.workspace}:{digest}"
+
+
+# ── (de)serialisation ───────────────────────────────────────────────────────
+def _encode(value):
+    if isinstance(value, dt.datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, dt.date):
+        return {"$d": value.isoformat()}
+    if isinstance(value, dt.time):
+        return {"$t": value.isoformat()}
+    if isinstance(value, dt.timedelta):
+        return {"$td": value.total_seconds()}
+    if isinstance(value, decimal.Decimal):
+        return {"$dec": str(value)}
+    if isinstance(value, uuid.UUID):
+        return {"$uuid": str(value)}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$b": bytes(value).hex()}
+    return str(value)
+
+
+_DECODERS = {
+    "$dt":   dt.datetime.fromisoformat,
+    "$d":    dt.date.fromisoformat,
+    "$t":    dt.time.fromisoformat,
+    "$td":   lambda s: dt.timedelta(seconds=s),
+    "$dec":  decimal.Decimal,
+    "$uuid": uuid.UUID,
+    "$b":    bytes.fromhex,
+}
+
+
+def _decode(obj: dict):
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        decoder = _DECODERS.get(tag)
+        if decoder is not None:
+            return decoder(value)
+    return obj
+
+
+def dumps(
+    columns: list[str], rows: list[tuple], truncated: bool = False, meta: dict | None = None
+) -> bytes:
+    """*meta*: small JSON-able extras stored with the rows (e.g. the guarded SQL)."""
+    raw = json.dumps(
+        {"c": columns, "r": rows, "t": truncated, "m": meta or {}},
+        default=_encode, separators=(",", ":"),
+    ).encode()
+    return zlib.compress(raw, 3)
+
+
+def loads(blob: bytes) -> tuple[list[str], list[tuple], bool, dict]:
+    data = json.loads(zlib.decompress(blob), object_hook=_decode)
+    return data["c"], [tuple(r) for r in data["r"]], data.get("t", False), data.get("m", {})
+
+
+# ── Redis I/O ────────────────────────────────────────────────────────────────
+async def get(key: str) -> tuple[list[str], list[tuple], bool, dict] | None:
+    try:
+        blob = await get_redis_bytes().get(key)
+    except redis.RedisError:
+        return None
+    return loads(blob) if blob else None
+
+
+async def put(
+    key: str,
+    policy: Policy,
+    columns: list[str],
+    rows: list[tuple],
+    truncated: bool = False,
+    meta: dict | None = None,
+) -> bool:
+    blob = dumps(columns, rows, truncated, meta)
+    if len(blob) > RESULT_CACHE_MAX_ENTRY_BYTES:
+        return False
+
+    try:
+        await lru_put(
+            get_redis_bytes(), key, blob,
+            ttl=policy.ttl,
+            idx=f"rc:idx:{policy.workspace}",
+            sizes=f"rc:sz:{policy.workspace}",
+            total=f"rc:bytes:{policy.workspace}",
+            budget=RESULT_CACHE_MAX_WORKSPACE_BYTES,
+            meta_ttl=policy.ttl * 2,
+        )
+    except redis.RedisError:
+        return False
+    return True
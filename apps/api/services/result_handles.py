@@ -0,0 +1,75 @@
+"""
+apps/api/services/result_handles.py
+───────────────────────────────────
+Short-lived handles for follow-ups on a query result without
+regenerating its SQL. A handle is an opaque token mapping (in Redis) to the
+workspace/user it was issued to and
+
+• sql / columns / types: what ran (after the cost guard) and its shape,
+  for further pages,
+• keys: its ORDER BY resolved to output columns (services.followup), or
+  None when only OFFSET paging works,
+• ast: the validated SQL's sqlglot AST (sqlglot.serde), which refinements
+  edit instead of asking the LLM again.
+"""
+
+import json
+import os
+import secrets
+
+import redis.asyncio as redis
+from sqlglot import exp, serde
+
+from utils import get_redis
+
+RESULT_HANDLE_TTL = int(os.getenv("RESULT_HANDLE_TTL", "3600"))
+
+
+def _key(handle: str) -> str:
+    return f"handle:{handle}"
+
+
+async def create(
+    workspace_id,
+    clerk_sub: str,
+    sql: str,
+    columns: list[str],
+    types: list[str] | None = None,
+    keys: list[dict] | None = None,
+    tree: exp.Expression | None = None,
+) -> str | None:
+    """Store a handle; returns None (no follow-ups offered) if Redis is unavailable."""
+    handle = secrets.token_urlsafe(16)
+    try:
+        await get_redis().set(
+            _key(handle),
+            json.dumps({
+                "workspace_id": str(workspace_id),
+                "clerk_sub": clerk_sub,
+                "sql": sql,
+                "columns": columns,
+                "types": types,
+                "keys": keys,
+                "ast": serde.dump(tree) if tree is not None else None,
+            }),
+            ex=RESULT_HANDLE_TTL,
+        )
+    except redis.RedisError:
+        return None
+    return handle
+
+
+async def load(handle: str, workspace_id, clerk_sub: str) -> dict | None:
+    """Return the handle's record, or None if unknown/expired/not owned by caller."""
+    raw = await get_redis().get(_key(handle))
+    if not raw:
+        return None
+    data = json.loads(raw)
+    if data["workspace_id"] != str(workspace_id) or data["clerk_sub"] != clerk_sub:
+        return None
+    return data
+
+
+def tree_of(data: dict) -> exp.Expression | None:
+    """The stored AST of a handle's validated SQL (None for older handles)."""
+    return serde.load(data["ast"]) if data.get("ast") else None
@@ -0,0 +1,201 @@
+"""
+apps/api/services/router.py
+───────────────────────────
+Latency-aware, hedged routing across NL→SQL backends.
+
+• every backend keeps a rolling window of latencies and outcomes,
+• the preferred backend (per routing policy) is called first; once it runs
+  past its own p95 a hedge request goes to the next backend,
+• whichever *valid* SQL arrives first wins and the other call is cancelled,
+• a circuit breaker skips a backend after repeated failures and lets a
+  single probe through once its cool-down has elapsed.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from . import telemetry
+
+ROUTER_WINDOW           = int(os.getenv("ROUTER_WINDOW", "100"))
+ROUTER_MIN_SAMPLES      = int(os.getenv("ROUTER_MIN_SAMPLES", "10"))
+ROUTER_DEFAULT_HEDGE_S  = float(os.getenv("ROUTER_DEFAULT_HEDGE_S", "8"))
+ROUTER_DEADLINE_S       = float(os.getenv("ROUTER_DEADLINE_S", "90"))
+ROUTER_HEDGE            = os.getenv("ROUTER_HEDGE", "1") == "1"
+BREAKER_FAILURES        = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN_S      = float(os.getenv("BREAKER_COOLDOWN_S", "30"))
+
+
+class BackendStats:
+    """Rolling latency / error window for one backend."""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    def p95(self) -> float:
+        if len(self.latencies) < ROUTER_MIN_SAMPLES:
+            return ROUTER_DEFAULT_HEDGE_S
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+
+class CircuitBreaker:
+    """closed → open after N consecutive failures → half-open after cool-down."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN_S):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self.probing)
+
+    def start(self) -> None:
+        # only one in-flight probe while half-open
+        if self.state == "half-open":
+            self.probing = True
+
+    def success(self) -> None:
+        self.consecutive = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self) -> None:
+        self.consecutive += 1
+        self.probing = False
+        if self.consecutive >= self.failures or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class Backend:
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = BackendStats()
+        self.breaker = CircuitBreaker()
+
+    def snapshot(self) -> dict:
+        return {
+            "p95_s": round(self.stats.p95(), 3),
+            "error_rate": round(self.stats.error_rate(), 3),
+            "breaker": self.breaker.state,
+        }
+
+
+class AllBackendsFailed(Exception):
+    pass
+
+
+class ModelRouter:
+    """
+    Route one request across *backends* in *policy* order.
+
+    `calls` maps backend name → zero-arg coroutine factory for this request;
+    `await valid(raw_sql)` decides whether a backend's answer is usable.
+    """
+
+    def __init__(self, names: list[str]):
+        self.backends = {n: Backend(n) for n in names}
+
+    def order(self, policy: list[str]) -> list[Backend]:
+        ranked = [self.backends[n] for n in policy if n in self.backends]
+        allowed = [b for b in ranked if b.breaker.allow()]
+        # every breaker open: better to try than to fail outright
+        return allowed or ranked
+
+    async def route(
+        self,
+        policy: list[str],
+        calls: dict[str, Callable[[], Awaitable[str]]],
+        valid: Callable[[str], Awaitable[bool]],
+    ) -> tuple[str, str]:
+        queue = [b for b in self.order(policy) if b.name in calls]
+        running: dict[asyncio.Task, tuple[Backend, float]] = {}
+        last_exc: BaseException | None = None
+        deadline = time.monotonic() + ROUTER_DEADLINE_S
+
+        def launch() -> Backend | None:
+            if not queue:
+                return None
+            backend = queue.pop(0)
+            backend.breaker.start()
+            task = asyncio.create_task(calls[backend.name]())
+            running[task] = (backend, time.monotonic())
+            return backend
+
+        current = launch()
+        try:
+            while running:
+                # hedge once the newest backend passes its own p95
+                hedge_after = current.stats.p95() if (ROUTER_HEDGE and queue) else None
+                timeout = max(0.0, deadline - time.monotonic())
+                if hedge_after is not None:
+                    timeout = min(timeout, hedge_after)
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    if time.monotonic() >= deadline:
+                        raise asyncio.TimeoutError("NL→SQL routing deadline exceeded")
+                    current = launch() or current
+                    continue
+
+                for task in done:
+                    backend, started = running.pop(task)
+                    latency = time.monotonic() - started
+                    exc = task.exception()
+                    raw = None if exc else task.result()
+                    telemetry.stage_seconds.observe(latency, stage="llm", backend=backend.name)
+                    if exc is None and await valid(raw):
+                        backend.stats.record(latency, True)
+                        backend.breaker.success()
+                        return raw, backend.name
+                    backend.stats.record(latency, False)
+                    if exc is None:
+                        # answered, just badly: counts as an error, not an outage
+                        backend.breaker.success()
+                    else:
+                        backend.breaker.failure()
+                    last_exc = exc or ValueError(f"❌ {backend.name} returned invalid SQL")
+                    telemetry.log.warning(
+                        "nl2sql backend failed",
+                        extra={"fields": {"backend": backend.name, "error": str(last_exc)}},
+                    )
+
+                # a failure (not a slow call) moves straight on to the next backend
+                if not running:
+                    current = launch() or current
+        finally:
+            # cancel the losers; a cancelled probe proves nothing either way
+            for task, (backend, _) in running.items():
+                task.cancel()
+                backend.breaker.probing = False
+
+        raise AllBackendsFailed("❌ Both models failed.") from last_exc
+
+    def snapshot(self) -> dict:
+        return {n: b.snapshot() for n, b in self.backends.items()}
@@ -0,0 +1,269 @@
+"""
+apps/api/services/schema_index.py
+─────────────────────────────────
+Offline relevance index over a workspace's tables, used to prune the schema
+that goes into NL→SQL prompts.
+
+• one BM25 document per table: table-name tokens (weighted up) plus column
+  tokens; identifiers are split on `_`/camelCase and lightly stemmed,
+• question terms are expanded with a small synonym table
+  (SCHEMA_SYNONYMS_PATH can add a JSON {"term": ["synonym", ...]} file),
+• the best tables pull in their foreign-key neighbours so joins stay
+  possible,
+• tables are added until the backend's token budget is spent; a schema that
+  already fits is sent whole.
+
+Indexes are kept per workspace and updated incrementally: when the catalog
+changes only added, dropped or altered tables are re-tokenized.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from .catalog import SchemaCatalog, Table
+
+SCHEMA_TOP_K          = int(os.getenv("SCHEMA_TOP_K", "12"))
+SCHEMA_FK_DECAY       = float(os.getenv("SCHEMA_FK_DECAY", "0.5"))
+SCHEMA_NAME_WEIGHT    = int(os.getenv("SCHEMA_NAME_WEIGHT", "3"))
+SCHEMA_INDEXES_MAX    = int(os.getenv("SCHEMA_INDEXES_MAX", "512"))
+SCHEMA_SYNONYMS_PATH  = os.getenv("SCHEMA_SYNONYMS_PATH")
+
+_BM25_K1 = 1.2
+_BM25_B  = 0.75
+
+_SYNONYMS: dict[str, tuple[str, ...]] = {
+    "customer":     ("user", "client", "account"),
+    "user":         ("customer", "account", "member"),
+    "client":       ("customer", "user"),
+    "revenue":      ("payment", "amount", "price", "invoice", "mrr"),
+    "mrr":          ("revenue", "subscription", "payment", "amount"),
+    "money":        ("amount", "payment", "price"),
+    "paid":         ("payment", "status"),
+    "spend":        ("payment", "amount"),
+    "subscriber":   ("subscription", "user"),
+    "tier":         ("plan",),
+    "pricing":      ("plan", "price"),
+    "signup":       ("user", "created"),
+    "joined":       ("created",),
+    "active":       ("status",),
+    "cancel":       ("status", "end"),
+    "churn":        ("subscription", "status", "end"),
+    "trial":        ("plan", "subscription", "status"),
+    "order":        ("purchase", "sale"),
+    "purchase":     ("order", "payment"),
+    "sale":         ("order", "payment", "amount"),
+    "product":      ("item", "sku"),
+    "date":         ("created", "time", "day"),
+    "when":         ("created", "date", "time"),
+    "month":        ("created", "date"),
+    "email":        ("user", "mail"),
+}
+
+_STOPWORDS = frozenset("""
+a an and are as at be by count did do does each every for from get give how
+i in is it last list me most my number of on or per please show than that
+the their them there these this those to top total what which who with
+""".split())
+
+
+def _load_synonyms() -> dict[str, tuple[str, ...]]:
+    synonyms = dict(_SYNONYMS)
+    if SCHEMA_SYNONYMS_PATH:
+        with open(SCHEMA_SYNONYMS_PATH) as f:
+            for term, extra in json.load(f).items():
+                synonyms[term] = tuple(dict.fromkeys(synonyms.get(term, ()) + tuple(extra)))
+    return synonyms
+
+
+synonyms = _load_synonyms()
+
+
+# ── tokens ───────────────────────────────────────────────────────────────────
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_WORD  = re.compile(r"[a-z]+|\d+")
+
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ses", "xes", "ches", "shes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(_CAMEL.sub(" ", text).lower())
+
+
+def tokenize(text: str) -> list[str]:
+    """Identifier/question text → lower-case, stemmed word tokens."""
+    return [_stem(w) for w in _words(text)]
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for identifier-heavy schema text
+    return len(text) // 4 + 1
+
+
+def _table_terms(table: Table) -> Counter:
+    terms = Counter()
+    for _ in range(SCHEMA_NAME_WEIGHT):
+        terms.update(tokenize(table.name))
+    for col in table.columns:
+        terms.update(tokenize(col))
+    return terms
+
+
+# ── index ────────────────────────────────────────────────────────────────────
+class SchemaIndex:
+    """Incrementally maintained BM25 postings over one workspace's tables."""
+
+    def __init__(self):
+        self.catalog: SchemaCatalog | None = None
+        self._docs: dict[str, tuple[tuple, int, tuple]] = {}  # table → (columns, length, terms)
+        self._postings: dict[str, dict[str, int]] = {}        # term → {table: tf}
+        self._total_len = 0
+        self._neighbours: dict[str, set[str]] = {}            # FK graph, both directions
+        self._tokens: dict[str, int] = {}                     # table → prompt tokens
+
+    # ── maintenance ──────────────────────────────────────────────────────────
+    def update(self, catalog: SchemaCatalog) -> int:
+        """Bring the index in line with *catalog*; returns tables re-indexed."""
+        if catalog is self.catalog:
+            return 0
+        changed = 0
+        for name in [n for n in self._docs if n not in catalog.tables]:
+            self._remove(name)
+            changed += 1
+        for name, table in catalog.tables.items():
+            doc = self._docs.get(name)
+            if doc is None or doc[0] != table.columns:
+                if doc is not None:
+                    self._remove(name)
+                self._add(name, table)
+                changed += 1
+            # the row estimate is part of the prompt line, so always re-cost
+            self._tokens[name] = estimate_tokens(catalog.render([name], sizes=True))
+
+        self._neighbours = {}
+        for name, table in catalog.tables.items():
+            for _cols, ref, _ref_cols in table.fks:
+                if ref in catalog.tables and ref != name:
+                    self._neighbours.setdefault(name, set()).add(ref)
+                    self._neighbours.setdefault(ref, set()).add(name)
+        self.catalog = catalog
+        return changed
+
+    def _add(self, name: str, table: Table) -> None:
+        terms = _table_terms(table)
+        length = sum(terms.values())
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[name] = tf
+        self._docs[name] = (table.columns, length, tuple(terms))
+        self._total_len += length
+
+    def _remove(self, name: str) -> None:
+        _columns, length, terms = self._docs.pop(name)
+        self._total_len -= length
+        self._tokens.pop(name, None)
+        for term in terms:
+            posting = self._postings[term]
+            del posting[name]
+            if not posting:
+                del self._postings[term]
+
+    # ── queries ──────────────────────────────────────────────────────────────
+    def _query_terms(self, question: str) -> dict[str, float]:
+        weights: dict[str, float] = {}
+        for word in _words(question):
+            if word in _STOPWORDS:
+                continue
+            token = _stem(word)
+            weights[token] = 1.0
+            for syn in synonyms.get(token, ()):
+                for s in tokenize(syn):
+                    weights.setdefault(s, 0.5)
+        return weights
+
+    def search(self, question: str) -> list[tuple[str, float]]:
+        """Tables with a non-zero BM25 score, best first."""
+        n = len(self._docs)
+        if not n:
+            return []
+        avg_len = self._total_len / n
+        scores: dict[str, float] = {}
+        for term, weight in self._query_terms(question).items():
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for name, tf in posting.items():
+                length = self._docs[name][1]
+                norm = tf * (_BM25_K1 + 1) / (tf + _BM25_K1 * (1 - _BM25_B + _BM25_B * length / avg_len))
+                scores[name] = scores.get(name, 0.0) + weight * idf * norm
+        return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+
+    def select(self, question: str, budget_tokens: int, top_k: int = SCHEMA_TOP_K) -> list[str]:
+        """
+        Names of the tables to show the model: the whole schema if it fits
+        *budget_tokens*, else the best matches plus their FK neighbours,
+        up to *top_k* matches and the budget.
+        """
+        if sum(self._tokens.values()) <= budget_tokens:
+            return list(self._docs)
+
+        ranked = self.search(question)[:top_k]
+        candidates: dict[str, float] = {}
+        for name, score in ranked:
+            candidates[name] = max(candidates.get(name, 0.0), score)
+            for other in self._neighbours.get(name, ()):
+                candidates.setdefault(other, score * SCHEMA_FK_DECAY)
+        order = sorted(candidates, key=lambda name: (-candidates[name], name))
+        if not order:
+            # nothing matched: fall back to the largest tables, which are the
+            # most likely subject of an analytics question
+            order = sorted(
+                self._docs,
+                key=lambda name: (-(self.catalog.tables[name].row_estimate or 0), name),
+            )
+
+        chosen, used = [], 0
+        for name in order:
+            cost = self._tokens[name]
+            if used + cost > budget_tokens:
+                continue
+            chosen.append(name)
+            used += cost
+        return chosen
+
+
+_indexes: dict[str, SchemaIndex] = {}
+
+
+def index_for(workspace: str, catalog: SchemaCatalog) -> SchemaIndex:
+    """The workspace's index, updated to *catalog* if the schema moved on."""
+    index = _indexes.pop(workspace, None)
+    if index is None:
+        index = SchemaIndex()
+    index.update(catalog)
+    _indexes[workspace] = index  # re-insert: dict order doubles as LRU order
+    while len(_indexes) > SCHEMA_INDEXES_MAX:
+        _indexes.pop(next(iter(_indexes)))
+    return index
+
+
+def prune(
+    catalog: SchemaCatalog, question: str, budget_tokens: int, workspace: str | None = None
+) -> str:
+    """Prompt schema text for *question* within *budget_tokens*."""
+    if workspace is not None:
+        index = index_for(workspace, catalog)
+    else:
+        index = SchemaIndex()
+        index.update(catalog)
+    return catalog.render(index.select(question, budget_tokens), sizes=True)
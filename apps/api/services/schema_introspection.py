@@ -1,7 +1,39 @@
+"""
+apps/api/services/schema_introspection.py
+─────────────────────────────────────────
+Introspect a customer schema (as a SchemaCatalog) and cache it across workers.
+
+L1 is a per-process dict, L2 is Redis (shared by every uvicorn worker).
+Instead of a blind TTL, a cheap catalog fingerprint decides whether a full
+re-introspection is needed: an md5 over pg_class/pg_attribute (oid, attnum,
+name, type) for the public schema, or, when the optional event trigger in
+apps/db/ddl_version.sql is installed, its DDL counter.
+
+• concurrent misses for the same DSN share one introspection (single-flight),
+• once an L1 entry is older than the check interval it is still served
+  while a background task re-checks the fingerprint (stale-while-revalidate),
+• the fingerprint ignores row counts, so every re-check also re-reads the
+  planner estimates (pg_class.reltuples only) and swaps in a catalog with
+  the new sizes when they moved; the cost guard and prompts rely on them.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+
 import asyncpg
-from collections import defaultdict
+import redis.asyncio as redis
 import time
 
+from utils import get_redis
+from .catalog import SchemaCatalog, fetch_catalog, fetch_row_estimates
+from .pools import registry
+from .telemetry import log
+
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "30"))
+SCHEMA_REDIS_TTL      = int(os.getenv("SCHEMA_REDIS_TTL", "86400"))
+
 async def fetch_tables_schema(conn: asyncpg.Connection) -> str:
     """
     Returns a newline-separated string like:
@@ -9,39 +41,143 @@ async def fetch_tables_schema(conn: asyncpg.Connection) -> str:
       plans(id, price, …)
     for every table in public.schema, ordered alphabetically.
     """
-    rows = await conn.fetch(
-        """
-        SELECT table_name, column_name
-          FROM information_schema.columns
-         WHERE table_schema = 'public'
-         ORDER BY table_name, ordinal_position
-        """
-    )
-    tables: dict[str, list[str]] = defaultdict(list)
-    for r in rows:
-        tables[r["table_name"]].append(r["column_name"])
-    # build lines
-    lines = [
-        f"{tbl}({', '.join(cols)})"
-        for tbl, cols in sorted(tables.items())
-    ]
-    return "\n".join(lines)
-
-# In-process cache: { dsn_str: (schema_text, timestamp) }
-_schema_cache: dict[str, tuple[str, float]] = {}
-
-async def get_cached_schema(conn: asyncpg.Connection, dsn: str, ttl: int = 300) -> str:
+    return (await fetch_catalog(conn)).to_prompt()
+
+# ── catalog fingerprint ─────────────────────────────────────────────────────
+_FINGERPRINT_SQL = """
+SELECT CASE
+         WHEN to_regclass('askdb.ddl_version') IS NOT NULL
+         -- dynamic read, so the statement still plans when the table is absent
+         THEN 'ddl:' || (xpath('/row/v/text()', query_to_xml(
+                'SELECT version AS v FROM askdb.ddl_version', false, false, ''
+              )))[1]::text
+         ELSE (
+           SELECT 'cat:' || md5(coalesce(string_agg(
+                    c.oid::text || '.' || a.attnum || '.' || a.attname || '.' || a.atttypid,
+                    ',' ORDER BY c.oid, a.attnum), ''))
+             FROM pg_class c
+             JOIN pg_namespace n ON n.oid = c.relnamespace
+             JOIN pg_attribute a ON a.attrelid = c.oid
+                                AND a.attnum > 0 AND NOT a.attisdropped
+            WHERE n.nspname = 'public'
+              AND c.relkind IN ('r', 'v', 'm', 'p', 'f')
+         )
+       END
+"""
+
+
+async def catalog_fingerprint(conn: asyncpg.Connection) -> str:
+    return await conn.fetchval(_FINGERPRINT_SQL)
+
+
+# ── two-tier cache ──────────────────────────────────────────────────────────
+class _Entry:
+    __slots__ = ("catalog", "fingerprint", "checked_at")
+
+    def __init__(self, catalog: SchemaCatalog, fingerprint: str):
+        self.catalog = catalog
+        self.fingerprint = fingerprint
+        self.checked_at = time.monotonic()
+
+
+# In-process cache: { dsn_key: _Entry }
+_schema_cache: dict[str, _Entry] = {}
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def _dsn_key(dsn: str) -> str:
+    # never put credentials into Redis key names
+    return hashlib.sha256(dsn.encode()).hexdigest()[:24]
+
+
+async def _l2_get(key: str) -> dict | None:
+    try:
+        raw = await get_redis().get(f"schema:{key}")
+    except redis.RedisError:
+        return None
+    return json.loads(raw) if raw else None
+
+
+async def _l2_set(key: str, entry: _Entry) -> None:
+    try:
+        await get_redis().set(
+            f"schema:{key}",
+            json.dumps({"catalog": entry.catalog.to_list(), "fingerprint": entry.fingerprint}),
+            ex=SCHEMA_REDIS_TTL,
+        )
+    except redis.RedisError:
+        pass  # cache is best-effort
+
+
+async def _refresh(conn: asyncpg.Connection, key: str) -> _Entry:
+    """Re-check the fingerprint; only re-introspect when the catalog changed."""
+    fingerprint = await catalog_fingerprint(conn)
+
+    current = _schema_cache.get(key)
+    if current is not None and current.fingerprint == fingerprint:
+        await _refresh_estimates(conn, key, current)
+        current.checked_at = time.monotonic()
+        return current
+
+    # another worker may already have done the work
+    shared = await _l2_get(key)
+    if shared is not None and shared["fingerprint"] == fingerprint and "catalog" in shared:
+        entry = _Entry(SchemaCatalog.from_list(shared["catalog"]), fingerprint)
+        await _refresh_estimates(conn, key, entry)
+    else:
+        entry = _Entry(await fetch_catalog(conn), fingerprint)
+        await _l2_set(key, entry)
+    _schema_cache[key] = entry
+    return entry
+
+
+async def _refresh_estimates(conn: asyncpg.Connection, key: str, entry: _Entry) -> None:
+    """Same columns, maybe different sizes: swap in the current row estimates."""
+    catalog = entry.catalog.with_row_estimates(await fetch_row_estimates(conn))
+    if catalog is not entry.catalog:
+        entry.catalog = catalog
+        await _l2_set(key, entry)
+
+
+def _single_flight(key: str, make) -> asyncio.Task:
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(make())
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+    return task
+
+
+async def _refresh_with_pool(dsn: str, key: str) -> _Entry:
+    # own connection: the task can outlive the request that started it
+    async with registry.connection(dsn) as conn:
+        return await _refresh(conn, key)
+
+
+def _log_refresh_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("schema refresh failed", extra={"fields": {"error": repr(task.exception())}})
+
+
+async def get_cached_catalog(dsn: str, ttl: float = SCHEMA_CHECK_INTERVAL) -> SchemaCatalog:
     """
-    Return the cached schema for this DSN, refreshing if older than `ttl` seconds.
+    Return the catalog for this DSN. Entries younger than `ttl` seconds are
+    served as-is; older ones are served stale while the fingerprint is
+    re-checked in the background.
     """
-    entry = _schema_cache.get(dsn)
-    if entry:
-        schema_text, last_fetched = entry
-        if time.time() - last_fetched < ttl:
-            return schema_text
+    key = _dsn_key(dsn)
+    entry = _schema_cache.get(key)
+    if entry is not None:
+        if time.monotonic() - entry.checked_at >= ttl and key not in _inflight:
+            task = _single_flight(key, lambda: _refresh_with_pool(dsn, key))
+            task.add_done_callback(_log_refresh_error)
+        return entry.catalog
+
+    # cold: every concurrent caller waits on the same refresh
+    entry = await asyncio.shield(_single_flight(key, lambda: _refresh_with_pool(dsn, key)))
+    return entry.catalog
 
-    # Cache miss or expired → re‐introspect
-    schema_text = await fetch_tables_schema(conn)
-    _schema_cache[dsn] = (schema_text, time.time())
-    return schema_text
 
+async def get_cached_schema(dsn: str, ttl: float = SCHEMA_CHECK_INTERVAL) -> str:
+    """get_cached_catalog, rendered as the "table(col, ...)" text."""
+    return (await get_cached_catalog(dsn, ttl)).to_prompt()
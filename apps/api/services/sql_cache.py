@@ -0,0 +1,136 @@
+"""
+apps/api/services/sql_cache.py
+──────────────────────────────
+Two-tier cache for NL → validated SQL.
+
+    key = (workspace id, normalized question, schema fingerprint)
+
+L1 is an in-process LRU, L2 is Redis (shared by every uvicorn worker).
+Concurrent misses for the same key are coalesced into a single model call,
+run as a detached task so a disconnecting caller can't cancel it for the
+others.
+Because the schema fingerprint is part of the key, a schema change simply
+stops matching old entries; L1 entries for the old fingerprint are purged
+the first time a workspace is seen with a new one.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from typing import Awaitable, Callable
+
+import redis.asyncio as redis
+
+from utils import get_redis
+from .lru import TTLCache
+
+SQL_CACHE_TTL    = int(os.getenv("SQL_CACHE_TTL", "86400"))
+SQL_CACHE_L1_TTL = float(os.getenv("SQL_CACHE_L1_TTL", "600"))
+SQL_CACHE_SIZE   = int(os.getenv("SQL_CACHE_SIZE", "5000"))
+
+_l1 = TTLCache(SQL_CACHE_L1_TTL, SQL_CACHE_SIZE)
+_inflight: dict[tuple, asyncio.Task] = {}
+_fingerprints: dict[str, str] = {}
+
+
+def normalize_question(question: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive form of *question*."""
+    q = re.sub(r"\s+", " ", question.strip().lower())
+    return q.rstrip(" .?!")
+
+
+def schema_fingerprint(schema: str) -> str:
+    return hashlib.sha256(schema.encode()).hexdigest()[:16]
+
+
+def _redis_key(key: tuple) -> str:
+    workspace, fp, question = key
+    qhash = hashlib.sha256(question.encode()).hexdigest()
+    return f"nl2sql:{workspace}:{fp}:{qhash}"
+
+
+def _note_fingerprint(workspace: str, fp: str) -> None:
+    old = _fingerprints.get(workspace)
+    if old is not None and old != fp:
+        _l1.discard_where(lambda k: k[0] == workspace and k[1] == old)
+    _fingerprints[workspace] = fp
+
+
+async def get_or_generate(
+    workspace: str,
+    question: str,
+    schema: str,
+    generate: Callable[[], Awaitable[tuple[str, str]]],
+) -> tuple[str, str, bool]:
+    """
+    Return (validated_sql, source, cache_hit).
+
+    *generate* is only awaited on a full miss and must return
+    (validated_sql, source); its exceptions are propagated to every
+    coalesced caller and nothing is cached.
+    """
+    fp = schema_fingerprint(schema)
+    _note_fingerprint(workspace, fp)
+    key = (workspace, fp, normalize_question(question))
+
+    hit = _l1.get(key)
+    if hit is not None:
+        return hit[0], hit[1], True
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        sql, source, _ = await asyncio.shield(pending)
+        return sql, source, True
+
+    task = asyncio.create_task(_fill(key, generate))
+    _inflight[key] = task
+    task.add_done_callback(lambda t: _filled(key, t))
+    return await asyncio.shield(task)
+
+
+async def _fill(
+    key: tuple, generate: Callable[[], Awaitable[tuple[str, str]]]
+) -> tuple[str, str, bool]:
+    cached = await _l2_get(key)
+    if cached is not None:
+        _l1.set(key, cached)
+        return cached[0], cached[1], True
+
+    sql, source = await generate()
+    _l1.set(key, (sql, source))
+    await _l2_set(key, sql, source)
+    return sql, source, False
+
+
+def _filled(key: tuple, task: asyncio.Task) -> None:
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # don't warn when every caller went away
+
+
+async def _l2_get(key: tuple) -> tuple[str, str] | None:
+    try:
+        raw = await get_redis().get(_redis_key(key))
+    except redis.RedisError:
+        return None
+    if not raw:
+        return None
+    data = json.loads(raw)
+    return data["sql"], data["source"]
+
+
+async def _l2_set(key: tuple, sql: str, source: str) -> None:
+    try:
+        await get_redis().set(
+            _redis_key(key),
+            json.dumps({"sql": sql, "source": source}),
+            ex=SQL_CACHE_TTL,
+        )
+    except redis.RedisError:
+        pass  # cache is best-effort
+
+
+def stats() -> dict:
+    return {**_l1.stats(), "inflight": len(_inflight)}
@@ -0,0 +1,257 @@
+"""
+apps/api/services/telemetry.py
+──────────────────────────────
+Metrics, product events and logs, kept off the request path.
+
+• `stage(name)` times one pipeline stage (auth, tenant, schema, template,
+  llm per backend, validate, query, dataframe, render) into the
+  askdb_stage_seconds histogram; `metrics_text()` renders every metric in
+  the Prometheus text format for GET /metrics (per process: scrape each
+  worker, or run one worker per container),
+• `capture()` puts a PostHog event on a bounded in-memory queue and returns
+  at once; a background task POSTs batches to PostHog's /batch/ endpoint
+  every TELEMETRY_FLUSH_INTERVAL seconds or TELEMETRY_BATCH_SIZE events.
+  A full queue or a failed batch drops events (counted) instead of
+  blocking,
+• `log` writes one JSON object per line; INFO and below are sampled at
+  TELEMETRY_LOG_SAMPLE, warnings and errors are always kept.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import httpx
+
+from . import http_clients
+
+POSTHOG_API_KEY          = os.getenv("POSTHOG_API_KEY")
+POSTHOG_HOST             = os.getenv("POSTHOG_HOST") or "https://us.i.posthog.com"
+TELEMETRY_QUEUE_MAX      = int(os.getenv("TELEMETRY_QUEUE_MAX", "10000"))
+TELEMETRY_BATCH_SIZE     = int(os.getenv("TELEMETRY_BATCH_SIZE", "100"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "5"))
+TELEMETRY_LOG_SAMPLE     = float(os.getenv("TELEMETRY_LOG_SAMPLE", "0.1"))
+TELEMETRY_LOG_LEVEL      = os.getenv("TELEMETRY_LOG_LEVEL", "INFO")
+
+# seconds; from a cache hit to a slow generation or render
+STAGE_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+# ── metrics ──────────────────────────────────────────────────────────────────
+def _labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set."""
+
+    def __init__(self, name: str, doc: str, buckets: tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labels → [bucket counts..., count, sum]
+
+    def observe(self, seconds: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                series[i] += 1
+                break
+        series[-2] += 1
+        series[-1] += seconds
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series[-2] if series else 0
+
+    def lines(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = _labels(key, f'le="{bound}"')
+                out.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(key, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{le} {series[-2]}")
+            out.append(f"{self.name}_count{_labels(key)} {series[-2]}")
+            out.append(f"{self.name}_sum{_labels(key)} {series[-1]:.6f}")
+        return out
+
+
+class Counter:
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, n: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + n
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def lines(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_labels(key)} {v:g}" for key, v in sorted(self._values.items())]
+        return out
+
+
+stage_seconds = Histogram("askdb_stage_seconds", "Latency of one request pipeline stage.")
+events_total = Counter("askdb_events_total", "PostHog events by outcome (sent, dropped).")
+_metrics = [stage_seconds, events_total]
+
+
+@contextmanager
+def stage(name: str, **labels: str):
+    """Time the enclosed block into askdb_stage_seconds{stage=name, ...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name, **labels)
+
+
+def metrics_text() -> str:
+    return "\n".join(line for m in _metrics for line in m.lines()) + "\n"
+
+
+# ── logs ─────────────────────────────────────────────────────────────────────
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Keep every warning and error, and *rate* of everything else."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def _logger() -> logging.Logger:
+    logger = logging.getLogger("askdb")
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(SampleFilter(TELEMETRY_LOG_SAMPLE))
+        logger.addHandler(handler)
+        logger.setLevel(TELEMETRY_LOG_LEVEL)
+        logger.propagate = False
+    return logger
+
+
+log = _logger()
+
+
+# ── PostHog events ───────────────────────────────────────────────────────────
+class EventExporter:
+    """Bounded queue of PostHog events, flushed in batches by one task."""
+
+    def __init__(
+        self,
+        api_key: str | None = POSTHOG_API_KEY,
+        host: str = POSTHOG_HOST,
+        queue_max: int = TELEMETRY_QUEUE_MAX,
+        batch_size: int = TELEMETRY_BATCH_SIZE,
+        interval: float = TELEMETRY_FLUSH_INTERVAL,
+    ):
+        self.api_key = api_key
+        self.url = host.rstrip("/") + "/batch/"
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: asyncio.Queue = asyncio.Queue(queue_max)
+        self._task: asyncio.Task | None = None
+
+    def capture(self, distinct_id: str, event: str, properties: dict | None = None) -> None:
+        """Queue an event; never blocks, drops it if the queue is full."""
+        if not self.api_key:
+            return
+        try:
+            self._queue.put_nowait({
+                "event": event,
+                "distinct_id": distinct_id,
+                "properties": properties or {},
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            })
+        except asyncio.QueueFull:
+            events_total.inc(outcome="dropped")
+
+    async def _next_batch(self) -> list[dict]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _drain(self) -> list[dict]:
+        batch = []
+        while not self._queue.empty() and len(batch) < self.batch_size:
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def send(self, batch: list[dict]) -> None:
+        try:
+            resp = await http_clients.posthog_client().post(
+                self.url, json={"api_key": self.api_key, "batch": batch}
+            )
+            resp.raise_for_status()
+        except httpx.HTTPError as exc:
+            events_total.inc(len(batch), outcome="dropped")
+            log.warning("posthog batch dropped", extra={"fields": {"events": len(batch), "error": str(exc)}})
+        else:
+            events_total.inc(len(batch), outcome="sent")
+
+    async def _run(self) -> None:
+        while True:
+            await self.send(await self._next_batch())
+
+    def start(self) -> None:
+        if self.api_key and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the flusher and send what is still queued (best effort)."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while batch := self._drain():
+            await self.send(batch)
+
+
+exporter = EventExporter()
+capture = exporter.capture
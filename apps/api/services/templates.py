@@ -0,0 +1,268 @@
+"""
+apps/api/services/templates.py
+──────────────────────────────
+Deterministic NL→SQL for common question shapes, tried before the models.
+
+A question is answered here only when the whole sentence fits one of the
+shapes below and every table/column phrase in it resolves to exactly one
+identifier in the catalog; anything else (filters on values, joins,
+"per plan" across tables, ...) goes to the models as before.
+
+• listing:     "show all plans", "list every user email",
+               "names and emails of users"
+• counting:    "how many users", "number of subscriptions by status",
+               "payment count per user"
+• ordering:    "plans sorted by price descending", "top 5 plans by price",
+               "latest 10 payments", "the oldest user"
+• thresholds:  "payments above $10" ($ picks the table's only money
+               column), "plans with price under 20"
+• time ranges: "subscriptions started in the last 7 days",
+               "projects created this year"
+• missing:     "subscriptions with missing end date"
+
+Phrases are matched on schema_index.tokenize()d words with -ed/-ing/-e
+trimmed and "_at"/"date"/"id"-style words ignored, so "created date" finds
+created_at, "ending" finds ended_at and "user" finds user_id.
+"""
+
+import os
+import re
+from functools import lru_cache
+
+from .catalog import SchemaCatalog, Table
+from .schema_index import tokenize
+
+NL2SQL_TEMPLATES = os.getenv("NL2SQL_TEMPLATES", "1") == "1"
+
+_VERB = r"(?:(?:please )?(?:show(?: me)?|list|get|display|give me|find|return|fetch|what are))"
+_ALL  = r"(?:(?:all|every|each)(?: of)? )?(?:the )?"
+_DIR  = r"(?: (?P<dir>asc|ascending|desc|descending))?"
+
+_FILLER    = frozenset({"at", "on", "date", "time", "timestamp", "id"})
+_TIMESTAMP = ("timestamp", "date")
+_MONEY     = ("numeric", "money", "decimal", "real", "double precision")
+_LINKS     = re.compile(r"^(?:with|whose|where|having|that|which) (?:a |an |the )?")
+_LIST_SEP  = re.compile(r"\s*(?:,|\band\b)\s*")
+
+_COMPARE = {
+    "above": ">", "over": ">", "greater than": ">", "more than": ">", "at least": ">=",
+    "below": "<", "under": "<", "less than": "<", "at most": "<=",
+}
+
+
+# ── identifiers ──────────────────────────────────────────────────────────────
+def _trim(token: str) -> str:
+    for suffix in ("ing", "ed"):
+        if len(token) > len(suffix) + 2 and token.endswith(suffix):
+            token = token[:-len(suffix)]
+            break
+    return token.rstrip("e") or token
+
+
+@lru_cache(maxsize=8192)
+def _terms(text: str) -> tuple[str, ...]:
+    return tuple(_trim(t) for t in tokenize(text) if t not in _FILLER)
+
+
+def _quote(name: str) -> str:
+    return name if re.fullmatch(r"[a-z_][a-z0-9_]*", name) else '"' + name.replace('"', '""') + '"'
+
+
+def _table(phrase: str, catalog: SchemaCatalog) -> Table | None:
+    terms = _terms(phrase)
+    if not terms:
+        return None
+    hits = [t for t in catalog.tables.values() if _terms(t.name) == terms]
+    return hits[0] if len(hits) == 1 else None
+
+
+def _columns(table: Table, kinds: tuple[str, ...] | None) -> list[str]:
+    return [c for c, t in zip(table.columns, table.types) if kinds is None or t.startswith(kinds)]
+
+
+def _column(phrase: str, table: Table, kinds: tuple[str, ...] | None = None) -> str | None:
+    candidates = _columns(table, kinds)
+    phrase = _LINKS.sub("", phrase)
+    if phrase.replace(" ", "_") in candidates:
+        return phrase.replace(" ", "_")
+    terms = _terms(phrase)
+    if not terms:
+        # "date", "time", ...: says nothing about which column
+        return None
+    hits = [c for c in candidates if _terms(c) == terms]
+    return hits[0] if len(hits) == 1 else None
+
+
+def _only(table: Table, kinds: tuple[str, ...]) -> str | None:
+    """The table's single column of one of *kinds*, if there is exactly one."""
+    hits = _columns(table, kinds)
+    return hits[0] if len(hits) == 1 else None
+
+
+def _subject(phrase: str, catalog: SchemaCatalog) -> tuple[Table, str | None] | None:
+    """"users" → (users, None); "user emails" → (users, "emails"); else None."""
+    table = _table(phrase, catalog)
+    if table is not None:
+        return table, None
+    words = phrase.split()
+    for k in range(1, len(words)):
+        table = _table(" ".join(words[:k]), catalog)
+        if table is not None:
+            return table, " ".join(words[k:])
+    return None
+
+
+def _order(column: str, direction: str | None, default_desc: bool = False) -> str:
+    desc = direction.startswith("desc") if direction else default_desc
+    return f"ORDER BY {_quote(column)}{' DESC' if desc else ''}"
+
+
+# ── shapes ───────────────────────────────────────────────────────────────────
+def _count_by(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    table = _table(m["subject"], catalog)
+    column = table and _column(m["group"], table)
+    if not column:
+        return None
+    c = _quote(column)
+    return f"SELECT {c}, COUNT(*) AS count FROM {_quote(table.name)} GROUP BY {c} ORDER BY count DESC"
+
+
+def _count(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    table = _table(m["subject"], catalog)
+    return table and f"SELECT COUNT(*) AS count FROM {_quote(table.name)}"
+
+
+def _top(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    table = _table(m["subject"], catalog)
+    column = table and _column(m["col"], table)
+    if not column:
+        return None
+    order = _order(column, m["dir"], default_desc=m["which"] in ("top", "last"))
+    return f"SELECT * FROM {_quote(table.name)} {order} LIMIT {int(m['n'])}"
+
+
+def _latest(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    table = _table(m["subject"], catalog)
+    column = table and _only(table, _TIMESTAMP)
+    if not column:
+        return None
+    newest = m["which"] not in ("oldest", "earliest")
+    sql = f"SELECT * FROM {_quote(table.name)} {_order(column, None, default_desc=newest)}"
+    if m["n"]:
+        return f"{sql} LIMIT {int(m['n'])}"
+    # "the latest payment" is one row; "the latest payments" are all, newest first
+    last = m["subject"].split()[-1]
+    return f"{sql} LIMIT 1" if tokenize(last) == [last] else sql
+
+
+def _range(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    subject = _subject(m["subject"], catalog)
+    if subject is None:
+        return None
+    table, phrase = subject
+    column = _column(phrase, table, _TIMESTAMP) if phrase else _only(table, _TIMESTAMP)
+    if not column:
+        return None
+    c = _quote(column)
+    if m["n"]:
+        condition = f"{c} >= NOW() - INTERVAL '{int(m['n'])} {m['unit']}'"
+    else:
+        unit = m["cunit"] or "day"
+        start = f"DATE_TRUNC('{unit}', NOW())"
+        if m["cal"] == "this" or m["range"] == "today":
+            condition = f"{c} >= {start} AND {c} < {start} + INTERVAL '1 {unit}'"
+        else:
+            condition = f"{c} >= {start} - INTERVAL '1 {unit}' AND {c} < {start}"
+    return f"SELECT * FROM {_quote(table.name)} WHERE {condition} ORDER BY {c} DESC"
+
+
+def _sorted(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    table = _table(m["subject"], catalog)
+    column = table and _column(m["col"], table)
+    return column and f"SELECT * FROM {_quote(table.name)} {_order(column, m['dir'])}"
+
+
+def _threshold(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    subject = _subject(m["subject"], catalog)
+    if subject is None:
+        return None
+    table, phrase = subject
+    if phrase:
+        column = _column(phrase, table)
+    else:
+        # "payments above $10": only a money amount makes the column obvious
+        column = _only(table, _MONEY) if m["cur"] else None
+    if not column:
+        return None
+    c = _quote(column)
+    return f"SELECT * FROM {_quote(table.name)} WHERE {c} {_COMPARE[m['op']]} {m['value']} ORDER BY {c}"
+
+
+def _missing(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    table = _table(m["subject"], catalog)
+    column = table and _column(m["col"], table)
+    return column and f"SELECT * FROM {_quote(table.name)} WHERE {_quote(column)} IS NULL"
+
+
+def _list(m: re.Match, catalog: SchemaCatalog) -> str | None:
+    if m.groupdict().get("cols") is not None:
+        table, phrases = _table(m["subject"], catalog), m["cols"]
+    else:
+        subject = _subject(m["subject"], catalog)
+        if subject is None:
+            return None
+        table, phrases = subject
+    if table is None:
+        return None
+    if not phrases:
+        return f"SELECT * FROM {_quote(table.name)}"
+    columns = [_column(p, table) for p in _LIST_SEP.split(phrases) if p]
+    if not columns or None in columns:
+        return None
+    return f"SELECT {', '.join(_quote(c) for c in dict.fromkeys(columns))} FROM {_quote(table.name)}"
+
+
+_RANGE = (
+    r"(?P<range>(?:last|past) (?P<n>\d+) (?P<unit>day|week|month|year)s?"
+    r"|(?P<cal>this|last) (?P<cunit>week|month|year)|today|yesterday)"
+)
+_OPS = "|".join(sorted(_COMPARE, key=len, reverse=True))
+
+# first match that resolves wins; the patterns are anchored on both ends
+_RULES = [(re.compile(p), build) for p, build in (
+    (rf"^(?:{_VERB} )?(?:the )?(?:(?:total )?number of|count of|count) (?P<subject>.+?) "
+     rf"(?:by|per|for each|grouped by) (?P<group>.+)$", _count_by),
+    (rf"^how many (?P<subject>.+?) (?:are there |do we have )?(?:by|per|for each) (?P<group>.+)$", _count_by),
+    (rf"^(?:{_VERB} )?(?:the )?(?P<subject>.+?) counts? (?:by|per|for each) (?P<group>.+)$", _count_by),
+    (rf"^how many (?P<subject>.+?)(?: are there| do we have| exist)?$", _count),
+    (rf"^(?:{_VERB} )?(?:the )?(?:(?:total )?number of|count of|count(?: all)?) (?P<subject>.+)$", _count),
+    (rf"^(?:{_VERB} )?(?:the )?(?P<which>top|first|last|bottom) (?P<n>\d+) (?P<subject>.+?) "
+     rf"(?:(?:ordered|sorted|ranked) )?by (?P<col>.+?){_DIR}$", _top),
+    (rf"^(?:{_VERB} )?(?:the )?(?P<which>latest|newest|most recent|oldest|earliest)"
+     rf"(?: (?P<n>\d+))? (?P<subject>.+)$", _latest),
+    (rf"^(?:{_VERB} )?{_ALL}(?P<subject>.+?) (?:(?:in|during|within|over|from) )?(?:the )?{_RANGE}$", _range),
+    (rf"^(?:{_VERB} )?{_ALL}(?P<subject>.+?) (?:ordered|sorted|ranked) by (?P<col>.+?){_DIR}$", _sorted),
+    (rf"^(?:{_VERB} )?{_ALL}(?P<subject>.+?) (?:is |are )?(?P<op>{_OPS}) "
+     rf"(?P<cur>\$)?(?P<value>\d+(?:\.\d+)?)$", _threshold),
+    (rf"^(?:{_VERB} )?{_ALL}(?P<subject>.+?) with (?:a )?(?:missing|no|null|empty) (?P<col>.+)$", _missing),
+    (rf"^(?:{_VERB} )?{_ALL}(?P<cols>.+?) (?:of|for) {_ALL}(?P<subject>.+)$", _list),
+    (rf"^(?:{_VERB} )?{_ALL}(?P<subject>.+)$", _list),
+)]
+
+
+def normalize(question: str) -> str:
+    q = re.sub(r"\s+", " ", question.strip().lower())
+    q = re.sub(r"(?<=\d),(?=\d{3}\b)", "", q)    # $1,000 → $1000
+    return re.sub(r"[\s?.!;]+$", "", q)
+
+
+def match(question: str, catalog: SchemaCatalog) -> str | None:
+    """SQL for *question* if it fits a template unambiguously, else None."""
+    q = normalize(question)
+    for pattern, build in _RULES:
+        m = pattern.match(q)
+        if m is not None:
+            sql = build(m, catalog)
+            if sql:
+                return sql
+    return None
@@ -0,0 +1,113 @@
+"""
+apps/api/services/tenant_cache.py
+─────────────────────────────────
+In-process fast path for tenant resolution.
+
+• workspaces : (slack_team_id, clerk_sub) → (workspace row, plaintext DSN)
+• claims     : sha256(bearer token)       → verified Clerk JWT claims
+
+Workspace entries are dropped as soon as the control plane changes: a
+trigger on `workspaces` (compose/init/05_workspaces_notify.sql) sends
+NOTIFY on WORKSPACES_CHANNEL, and a dedicated LISTEN connection evicts the
+affected team. The TTL is only a safety net for missed notifications.
+Any listener failure drops the whole workspace cache and reconnects with
+exponential backoff (LISTENER_RETRY_MIN → LISTENER_RETRY_MAX seconds).
+"""
+
+import asyncio
+import hashlib
+import os
+
+import asyncpg
+
+from .lru import TTLCache
+from .telemetry import log
+
+TENANT_CACHE_TTL   = float(os.getenv("TENANT_CACHE_TTL", "300"))
+CLAIMS_CACHE_TTL   = float(os.getenv("CLAIMS_CACHE_TTL", "60"))
+TENANT_CACHE_SIZE  = int(os.getenv("TENANT_CACHE_SIZE", "10000"))
+LISTENER_RETRY_MIN = float(os.getenv("LISTENER_RETRY_MIN", "1"))
+LISTENER_RETRY_MAX = float(os.getenv("LISTENER_RETRY_MAX", "60"))
+WORKSPACES_CHANNEL = "workspaces_changed"
+
+workspaces = TTLCache(TENANT_CACHE_TTL, TENANT_CACHE_SIZE)
+claims     = TTLCache(CLAIMS_CACHE_TTL, TENANT_CACHE_SIZE)
+
+
+def token_key(token: str) -> str:
+    # never keep raw bearer tokens around as dict keys
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def invalidate_team(slack_team_id: str | None = None) -> None:
+    """Drop cached workspaces for one team, or everything if no team given."""
+    if not slack_team_id:
+        workspaces.clear()
+    else:
+        workspaces.discard_where(lambda k: k[0] == slack_team_id)
+
+
+# ── LISTEN/NOTIFY invalidation ──────────────────────────────────────────────
+class WorkspaceListener:
+    """Keeps one LISTEN connection to the control plane and evicts on NOTIFY."""
+
+    def __init__(self, dsn: str | None):
+        self.dsn = dsn
+        self._conn: asyncpg.Connection | None = None
+        self._task: asyncio.Task | None = None
+        self._lost = asyncio.Event()
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str) -> None:
+        invalidate_team(payload or None)
+
+    def _on_terminate(self, _conn) -> None:
+        # notifications may have been missed while disconnected
+        invalidate_team()
+        self._lost.set()
+
+    async def _run(self) -> None:
+        delay = LISTENER_RETRY_MIN
+        while True:
+            try:
+                self._lost.clear()
+                self._conn = await asyncpg.connect(self.dsn)
+                self._conn.add_termination_listener(self._on_terminate)
+                await self._conn.add_listener(WORKSPACES_CHANNEL, self._on_notify)
+                delay = LISTENER_RETRY_MIN
+                await self._lost.wait()
+            except Exception as exc:
+                # anything but cancellation: a dead listener would leave
+                # workspaces cached until the TTL, so keep reconnecting
+                log.warning("workspace listener disconnected",
+                            extra={"fields": {"error": repr(exc), "retry_in": delay}})
+                invalidate_team()
+            await self._drop_conn()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LISTENER_RETRY_MAX)
+
+    async def _drop_conn(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            try:
+                await conn.close(timeout=5)
+            except Exception:
+                conn.terminate()
+
+    def start(self) -> None:
+        if self.dsn and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+        self._conn = None
+
+
+listener = WorkspaceListener(os.getenv("DATABASE_URL"))
+
+
+def stats() -> dict:
+    return {"workspaces": workspaces.stats(), "claims": claims.stats()}
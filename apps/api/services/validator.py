@@ -4,71 +4,267 @@ apps/api/services/validator.py
 Validate that an LLM-generated SQL query is
 • syntactically valid Postgres,
 • strictly a single SELECT,
-• touches only whitelisted tables.
+• touches only whitelisted tables,
+• and, given a SchemaCatalog, only columns those tables actually have.
 
 Raises ValueError on any violation and
 returns the (trimmed) SQL string on success.
+
+Per schema a CompiledValidator is built once (prebuilt table whitelist)
+and remembers its verdicts by SQL text; the Guard is built once per
+thread instead of per call. avalidate_sql runs cold
+validations on a small dedicated thread pool so parsing never blocks the
+event loop for other tenants.
 """
 
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import sqlglot
+from sqlglot import exp
 from guardrails import Guard
 from pydantic import BaseModel
 import textwrap
 
+from .catalog import SchemaCatalog, Table
+
 # ── allowed statement types ────────────────────────────────────────────────
 ALLOWED_STATEMENTS = {"SELECT"}
 
+VALIDATOR_THREADS     = int(os.getenv("VALIDATOR_THREADS", "4"))
+VALIDATOR_RESULT_SIZE = int(os.getenv("VALIDATOR_RESULT_SIZE", "2048"))
+VALIDATOR_SCHEMAS     = int(os.getenv("VALIDATOR_SCHEMAS", "256"))
+
 
 # ── tiny Pydantic model so Guardrails can re-ask / coerce consistently ──────
 class _SQL(BaseModel):
     sql: str
 
 
+# Building a Guard costs milliseconds, so build one per thread and reuse it.
+# Guards keep per-call history, hence thread-local and trimmed on reuse.
+_local = threading.local()
+_GUARD_HISTORY_MAX = 16
+
+def _guard() -> Guard:
+    guard = getattr(_local, "guard", None)
+    if guard is None:
+        guard = _local.guard = Guard.from_pydantic(_SQL)
+    elif len(guard.history) > _GUARD_HISTORY_MAX:
+        guard.history.clear()
+    return guard
+
+
+# ── parsing ──────────────────────────────────────────────────────────────────
+@lru_cache(maxsize=VALIDATOR_RESULT_SIZE)
+def parse_sql(sql: str) -> sqlglot.expressions.Expression:
+    """
+    Parse *sql* as Postgres; raises ValueError on syntax errors.
+    Memoized: callers must copy the AST before mutating it.
+    """
+    try:
+        return sqlglot.parse_one(sql, dialect="postgres")
+    except sqlglot.errors.ParseError as exc:
+        raise ValueError("❌ SQL syntax error") from exc
+
+
+# ── compiled per-schema validator ───────────────────────────────────────────
+# bare words Postgres resolves without a FROM entry
+_PSEUDO_COLUMNS = frozenset({
+    "current_user", "session_user", "user", "current_role",
+    "current_schema", "current_catalog", "localtime", "localtimestamp",
+})
+
+
+def _ident(node: exp.Expression) -> str:
+    """Name as Postgres sees it: unquoted identifiers fold to lower case."""
+    ident = node.this if isinstance(node, (exp.Column, exp.Table)) else node
+    if isinstance(ident, exp.Identifier):
+        return ident.this if ident.quoted else ident.this.lower()
+    return node.name
+
+
+class CompiledValidator:
+    """
+    Prebuilt table whitelist for one schema plus an LRU of verdicts.
+    Built from a SchemaCatalog it also checks column references.
+    """
+
+    def __init__(self, schema: "str | SchemaCatalog"):
+        self.catalog = schema if isinstance(schema, SchemaCatalog) else None
+        if self.catalog is not None:
+            self.allowed_tables = frozenset(self.catalog.tables)
+        else:
+            # schema is lines like "users(id, name, ...)"
+            self.allowed_tables = frozenset(
+                line.split("(")[0]
+                for line in schema.splitlines()
+                if line.strip()
+            )
+        self._results: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, sql: str) -> tuple | None:
+        with self._lock:
+            hit = self._results.get(sql)
+            if hit is not None:
+                self._results.move_to_end(sql)
+            return hit
+
+    def _remember(self, sql: str, verdict: tuple) -> None:
+        with self._lock:
+            self._results[sql] = verdict
+            while len(self._results) > VALIDATOR_RESULT_SIZE:
+                self._results.popitem(last=False)
+
+    def validate(self, sql: str) -> tuple[str, sqlglot.expressions.Expression]:
+        verdict = self.cached(sql)
+        if verdict is None:
+            try:
+                verdict = ("ok", *self._validate(sql))
+            except ValueError as exc:
+                verdict = ("error", str(exc))
+            self._remember(sql, verdict)
+        if verdict[0] == "error":
+            raise ValueError(verdict[1])
+        return verdict[1], verdict[2]
+
+    def _validate(self, sql: str) -> tuple[str, sqlglot.expressions.Expression]:
+        # Strip markdown fences or stray backticks
+        sql = sql.strip().strip("`")
+
+        # 0) Prevent multiple statements
+        if ";" in sql and not sql.strip().endswith(";"):
+            raise ValueError("❌ Multiple SQL statements detected")
+
+        # 1) Ensure it ends with a semicolon
+        if not sql.endswith(";"):
+            sql += ";"
+
+        # 2) Parse with SQLGlot (Postgres dialect)
+        parsed = parse_sql(sql)
+
+        # 3) Ensure it’s a pure SELECT
+        if parsed.key.upper() not in ALLOWED_STATEMENTS:
+            raise ValueError("❌ Only SELECT statements are allowed")
+
+        # 4) Dynamic table whitelist from the schema
+        if self.catalog is not None:
+            self._check_references(parsed)
+        else:
+            tables_in_query = {
+                t.name for t in parsed.find_all(exp.Table)
+            }
+            unknown = tables_in_query - self.allowed_tables
+            if unknown:
+                raise ValueError(f"❌ Unknown tables: {', '.join(sorted(unknown))}")
+
+        # 5) Final Guardrails pass (optional re-ask/coercion)
+        outcome = _guard().parse(sql)
+        if outcome.validated_output:
+            return outcome.validated_output["sql"], parsed
+
+        return sql, parsed
+
+
+    def _check_references(self, parsed: exp.Expression) -> None:
+        """Tables and columns against the catalog, in one walk of the AST."""
+        tables = self.catalog.tables
+        sources: dict[str, Table | None] = {}  # alias or name → catalog Table
+        unknown_tables: set[str] = set()
+        columns: list[exp.Column] = []
+        aliases: set[str] = set()
+        derived = False                   # FROM entries whose columns we can't know
+
+        for node in parsed.find_all(exp.Table, exp.Column, exp.Alias, exp.TableAlias):
+            if isinstance(node, exp.Column):
+                columns.append(node)
+            elif isinstance(node, exp.Table):
+                name = node.name
+                if name not in self.allowed_tables:
+                    unknown_tables.add(name)
+                sources[node.alias_or_name.lower() if node.alias else _ident(node)] = tables.get(name)
+            elif isinstance(node, exp.Alias):
+                aliases.add(node.alias.lower())
+            else:  # TableAlias: subquery / CTE / function aliases and their column lists
+                aliases.add(node.name.lower())
+                aliases.update(c.name.lower() for c in node.columns)
+                if not isinstance(node.parent, exp.Table):
+                    derived = True
+
+        if unknown_tables:
+            raise ValueError(f"❌ Unknown tables: {', '.join(sorted(unknown_tables))}")
+
+        if derived:
+            visible = self.catalog.column_names
+        else:
+            visible = frozenset(c for t in sources.values() if t is not None for c in t.columns)
+
+        unknown: set[str] = set()
+        for col in columns:
+            name = _ident(col)
+            if name == "*" or isinstance(col.this, exp.Star):
+                continue
+            qualifier = col.table
+            if qualifier:
+                table = sources.get(qualifier.lower()) or sources.get(qualifier)
+                if table is not None and name not in table.columns:
+                    unknown.add(f"{qualifier}.{name}")
+            elif name not in visible and name not in aliases and name not in _PSEUDO_COLUMNS:
+                unknown.add(name)
+        if unknown:
+            raise ValueError(f"❌ Unknown columns: {', '.join(sorted(unknown))}")
+
+
+_compiled: OrderedDict[tuple, CompiledValidator] = OrderedDict()
+_compiled_lock = threading.Lock()
+
+def compiled_for(schema: "str | SchemaCatalog") -> CompiledValidator:
+    """
+    Return the CompiledValidator for *schema*: a schema string or a
+    SchemaCatalog (keyed by its cached prompt text, so this stays cheap).
+    """
+    if isinstance(schema, SchemaCatalog):
+        key = (schema.to_prompt(), True)
+    else:
+        key = (schema, False)
+    with _compiled_lock:
+        validator = _compiled.get(key)
+        if validator is not None:
+            _compiled.move_to_end(key)
+            return validator
+    validator = CompiledValidator(schema)
+    with _compiled_lock:
+        _compiled[key] = validator
+        while len(_compiled) > VALIDATOR_SCHEMAS:
+            _compiled.popitem(last=False)
+    return validator
+
+
 # ── main entrypoint ──────────────────────────────────────────────────────────
-def validate_sql(sql: str, schema: str) -> str:
+def validate_sql(sql: str, schema: "str | SchemaCatalog") -> str:
     """
-    Validate *sql* against the provided *schema* string and return
+    Validate *sql* against the provided *schema* (string or catalog) and return
     the cleaned string. Raises ValueError on any safety or syntax issue.
     """
-    # Strip markdown fences or stray backticks
-    sql = sql.strip().strip("`")
+    return validate_sql_ast(sql, schema)[0]
 
-    # 0) Prevent multiple statements
-    if ";" in sql and not sql.strip().endswith(";"):
-        raise ValueError("❌ Multiple SQL statements detected")
 
-    # 1) Ensure it ends with a semicolon
-    if not sql.endswith(";"):
-        sql += ";"
+def validate_sql_ast(sql: str, schema: "str | SchemaCatalog") -> tuple[str, sqlglot.expressions.Expression]:
+    """Like validate_sql, but also return the parsed AST for later stages."""
+    return compiled_for(schema).validate(sql)
 
-    # 2) Parse with SQLGlot (Postgres dialect)
-    try:
-        parsed = sqlglot.parse_one(sql, dialect="postgres")
-    except sqlglot.errors.ParseError as exc:
-        raise ValueError("❌ SQL syntax error") from exc
 
-    # 3) Ensure it’s a pure SELECT
-    if parsed.key.upper() not in ALLOWED_STATEMENTS:
-        raise ValueError("❌ Only SELECT statements are allowed")
-
-    # 4) Dynamic table whitelist from the schema
-    #    schema is lines like "users(id, name, ...)"
-    allowed_tables = {
-        line.split("(")[0]
-        for line in schema.splitlines()
-        if line.strip()
-    }
-    tables_in_query = {
-        t.name for t in parsed.find_all(sqlglot.expressions.Table)
-    }
-    unknown = tables_in_query - allowed_tables
-    if unknown:
-        raise ValueError(f"❌ Unknown tables: {', '.join(sorted(unknown))}")
-
-    # 5) Final Guardrails pass (optional re-ask/coercion)
-    guard = Guard.from_pydantic(_SQL)
-    outcome = guard.parse(sql)
-    if outcome.validated_output:
-        return outcome.validated_output["sql"]
-
-    return sql
\ No newline at end of file
+_pool = ThreadPoolExecutor(max_workers=VALIDATOR_THREADS, thread_name_prefix="validator")
+
+async def avalidate_sql(sql: str, schema: "str | SchemaCatalog") -> str:
+    """validate_sql for async code: cache hits inline, cold validations on a worker thread."""
+    validator = compiled_for(schema)
+    if validator.cached(sql) is not None:
+        return validator.validate(sql)[0]
+    loop = asyncio.get_running_loop()
+    return (await loop.run_in_executor(_pool, validator.validate, sql))[0]
@@ -1,18 +1,103 @@
-import io, hashlib, duckdb, pandas as pd, plotly.express as px
+import io, os, hashlib, duckdb, numpy as np, pandas as pd, plotly.express as px
 
-def df_to_png(df: pd.DataFrame) -> bytes:
-    """Return a PNG (in-memory bytes) from a DataFrame using a simple heuristic."""
-    time_cols = [c for c in df.columns if df[c].dtype == "datetime64[ns]"]
+# bump whenever df_to_png's output changes so cached PNGs are not reused
+CHART_SPEC = "auto:v3"
+
+# point budget per chart: longer lines are LTTB-downsampled, bars with more
+# categories keep the top N and fold the rest into "other"
+CHART_MAX_POINTS     = int(os.getenv("CHART_MAX_POINTS", "2000"))
+CHART_MAX_CATEGORIES = int(os.getenv("CHART_MAX_CATEGORIES", "30"))
+
+def _chart_kind(df: pd.DataFrame) -> tuple[str, str | None, str | None]:
+    """("line" | "bar" | "heatmap", x column, y column) for a DataFrame."""
+    # any resolution, naive or tz-aware (timestamptz arrives as UTC)
+    time_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
     num_cols  = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
 
     if time_cols and num_cols:
-        fig = px.line(df, x=time_cols[0], y=num_cols[0])
-    elif num_cols:
-        fig = px.bar(df, x=df.columns[0], y=num_cols[0])
+        return "line", time_cols[0], num_cols[0]
+    if num_cols:
+        return "bar", df.columns[0], num_cols[0]
+    return "heatmap", None, None
+
+def lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of *n* points of the series
+    (x sorted ascending) that keep its visual shape. First and last points
+    are always kept.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+
+    # n-2 buckets over the interior points
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        nxt_end = edges[i + 2] if i + 2 < n - 1 else size
+        avg_x = x[end:nxt_end].mean()
+        avg_y = y[end:nxt_end].mean()
+        # twice the triangle area (a, candidate, next bucket's mean)
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def top_n_other(df: pd.DataFrame, x: str, y: str, n: int) -> pd.DataFrame:
+    """Sum *y* per *x*, keep the *n*-1 largest and fold the rest into "other"."""
+    totals = df.groupby(x, sort=False, dropna=False)[y].sum()
+    if len(totals) <= n:
+        return totals.reset_index()
+    top = totals.nlargest(n - 1)
+    rest = totals.drop(top.index).sum()
+    top.index = top.index.astype(str)
+    return pd.concat([top, pd.Series({"other": rest})]).rename_axis(x).rename(y).reset_index()
+
+def downsample(df: pd.DataFrame, max_points: int = CHART_MAX_POINTS,
+               max_categories: int = CHART_MAX_CATEGORIES) -> pd.DataFrame:
+    """The rows actually worth plotting, within the chart's point budget."""
+    kind, x, y = _chart_kind(df)
+    if kind == "line" and len(df) > max_points:
+        df = df[[x, y]].dropna(subset=[x]).sort_values(x, kind="stable")
+        keep = lttb(df[x].astype("int64").to_numpy(), df[y].to_numpy(np.float64, na_value=np.nan), max_points)
+        return df.iloc[keep].reset_index(drop=True)
+    if kind == "bar" and x == y:
+        # a numeric first column plotted against itself: nothing to group by
+        return df.head(max_points)
+    if kind == "bar" and (len(df) > max_points or df[x].nunique(dropna=False) > max_categories):
+        return top_n_other(df[[x, y]], x, y, max_categories)
+    return df
+
+def df_to_png(df: pd.DataFrame) -> bytes:
+    """Return a PNG (in-memory bytes) from a DataFrame using a simple heuristic."""
+    df = downsample(df)
+    kind, x, y = _chart_kind(df)
+
+    if kind == "line":
+        fig = px.line(df, x=x, y=y)
+    elif kind == "bar":
+        fig = px.bar(df, x=x, y=y)
     else:
         fig = px.imshow(df.head(20))
 
     return fig.to_image(format="png", engine="kaleido")
 
-def cache_key(question: str) -> str:
-    return hashlib.sha256(question.encode()).hexdigest()
+def cache_key(df: pd.DataFrame, spec: str = CHART_SPEC) -> str:
+    """Content hash of the data (values, column names, dtypes) plus the chart spec."""
+    h = hashlib.sha256(spec.encode())
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    except TypeError:
+        # unhashable cells (Postgres arrays, json lists/objects): hash a
+        # stable serialization instead
+        h.update(df.to_json(orient="values", date_format="iso", default_handler=str).encode())
+    return h.hexdigest()
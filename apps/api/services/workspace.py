@@ -1,40 +1,55 @@
 from fastapi import HTTPException
 from fastapi import Request
 from utils import get_control_pool, decrypt_dsn
+from .pools import registry
+from . import tenant_cache, telemetry
 import asyncpg
-async def get_workspace(slack_team_id: str, clerk_sub: str):
+
+
+async def _resolve_workspace(slack_team_id: str, clerk_sub: str) -> tuple[asyncpg.Record, str]:
+    """Return (workspace row, plaintext DSN), served from the tenant cache when possible."""
+    key = (slack_team_id, clerk_sub)
+    hit = tenant_cache.workspaces.get(key)
+    if hit is not None:
+        return hit
+
     pool = await get_control_pool()
     row = await pool.fetchrow(
-        "SELECT * FROM workspaces WHERE slack_team_id=$1",
-        slack_team_id
+        "SELECT * FROM workspaces WHERE slack_team_id=$1", slack_team_id
     )
     if not row or row["clerk_id"] != clerk_sub:
         raise HTTPException(403, "Workspace not onboarded")
+
+    resolved = (row, decrypt_dsn(row["db_url_enc"]))
+    tenant_cache.workspaces.set(key, resolved)
+    return resolved
+
+
+async def resolve_workspace(slack_team_id: str, clerk_sub: str) -> tuple[asyncpg.Record, str]:
+    """(workspace row, DSN) outside a request, e.g. for background jobs."""
+    return await _resolve_workspace(slack_team_id, clerk_sub)
+
+
+async def get_workspace(slack_team_id: str, clerk_sub: str):
+    row, _ = await _resolve_workspace(slack_team_id, clerk_sub)
     return row
 
-async def get_user_conn(request: Request):
+async def resolve_tenant(request: Request) -> tuple[asyncpg.Record, str]:
     # 1) grab both bits from request.state
     clerk_sub    = request.state.uid
     slack_team_id = request.state.slack_team_id
 
-    # 2) lookup control-plane workspace
-    pool = await get_control_pool()
-    row = await pool.fetchrow(
-        "SELECT * FROM workspaces WHERE slack_team_id=$1", slack_team_id
-    )
-    if not row or row["clerk_id"] != clerk_sub:
-        raise HTTPException(403, "Workspace not onboarded")
-
-    # 3) decrypt and connect
-    dsn = decrypt_dsn(row["db_url_enc"])
-    # stash it so handlers can see it
+    # 2) lookup control-plane workspace + decrypted DSN (cached)
+    with telemetry.stage("tenant"):
+        row, dsn = await _resolve_workspace(slack_team_id, clerk_sub)
+    # stash them so handlers can see them
+    request.state.workspace = row
     request.state.dsn = dsn
-    
-    print(row["db_url_enc"])
-    print(dsn)
-    conn = await asyncpg.connect(dsn)
-    try:
-        yield conn
-    finally:
-        await conn.close()
+    return row, dsn
 
+async def get_user_conn(request: Request):
+    _, dsn = await resolve_tenant(request)
+
+    # 3) borrow a connection from the per-DSN pool
+    async with registry.connection(dsn) as conn:
+        yield conn
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+from cryptography.fernet import Fernet
+
+# utils builds its Fernet cipher at import time, before any fixture runs
+os.environ.setdefault("FERNET_KEY", Fernet.generate_key().decode())
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Point every module that caches in Redis at one in-memory server."""
+    server = fakeredis.FakeServer()
+    text = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    binary = fakeredis.aioredis.FakeRedis(server=server)
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("services.") or module is None:
+            continue
+        if hasattr(module, "get_redis"):
+            monkeypatch.setattr(module, "get_redis", lambda: text)
+        if hasattr(module, "get_redis_bytes"):
+            monkeypatch.setattr(module, "get_redis_bytes", lambda: binary)
+    return text
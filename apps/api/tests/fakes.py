@@ -0,0 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class FakeConn:
+    """Just enough of asyncpg.Connection for the units under test."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def fetchval(self, sql, *args):
+        return await self.pool.answer(sql, args)
+
+    async def fetch(self, sql, *args):
+        return await self.pool.answer(sql, args)
+
+
+class FakePool:
+    """asyncpg.Pool stand-in with real max_size semantics for acquire()."""
+
+    def __init__(self, dsn, min_size=0, max_size=5, answer=None):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.closed = False
+        self._slots = asyncio.Semaphore(max_size)
+        self._answer = answer
+
+    async def answer(self, sql, args):
+        if self._answer is None:
+            return 1
+        return await self._answer(sql, args)
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        assert not self.closed, "acquire() on a closed pool"
+        await asyncio.wait_for(self._slots.acquire(), timeout)
+        try:
+            yield FakeConn(self)
+        finally:
+            self._slots.release()
+
+    async def fetchval(self, sql, *args):
+        async with self.acquire() as conn:
+            return await conn.fetchval(sql, *args)
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        self.closed = True
@@ -0,0 +1,72 @@
+import asyncio
+from contextlib import aclosing
+
+import pytest
+from fastapi import HTTPException
+
+from services import batch
+
+
+def test_equivalent_questions_are_answered_once():
+    groups = batch.distinct(["Show all plans.", "List users", "show  all plans", "SHOW ALL PLANS?"])
+    assert groups == {"Show all plans.": [0, 2, 3], "List users": [1]}
+    assert batch.cost(groups) == 2 * batch.ASK_BATCH_QUESTION_COST
+
+
+async def _collect(groups, answer, concurrency=8):
+    async with aclosing(batch.run(groups, answer, concurrency)) as outcomes:
+        return [item async for item in outcomes]
+
+
+@pytest.mark.asyncio
+async def test_outcomes_arrive_as_they_complete_within_the_cap():
+    running = peak = 0
+
+    async def answer(question):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(float(question))
+        running -= 1
+        return {"answer": question}
+
+    groups = {"0.03": [0], "0.01": [1], "0.02": [2]}
+    outcomes = await _collect(groups, answer, concurrency=2)
+    assert peak == 2
+    assert [indexes for indexes, _ in outcomes] == [[1], [0], [2]]
+
+
+@pytest.mark.asyncio
+async def test_a_failed_question_does_not_stop_the_batch():
+    async def answer(question):
+        if question == "bad":
+            raise HTTPException(400, "❌ Invalid SQL")
+        if question == "boom":
+            raise RuntimeError("driver exploded")
+        return {"answer": question}
+
+    outcomes = dict(
+        (tuple(i), o) for i, o in await _collect({"ok": [0], "bad": [1], "boom": [2]}, answer)
+    )
+    assert outcomes[(0,)] == {"answer": "ok"}
+    assert outcomes[(1,)] == {"error": "❌ Invalid SQL", "status": 400}
+    assert outcomes[(2,)]["status"] == 500
+
+
+@pytest.mark.asyncio
+async def test_closing_early_cancels_questions_in_flight():
+    cancelled = []
+
+    async def answer(question):
+        try:
+            await asyncio.sleep(0 if question == "fast" else 10)
+        except asyncio.CancelledError:
+            cancelled.append(question)
+            raise
+        return {"answer": question}
+
+    async with aclosing(batch.run({"fast": [0], "slow": [1]}, answer)) as outcomes:
+        async for indexes, _ in outcomes:
+            assert indexes == [0]
+            break
+    assert cancelled == ["slow"]
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from services import cost_guard
+from services.catalog import SchemaCatalog, Table
+from services.cost_guard import Budget, admit
+from services.validator import validate_sql
+
+CATALOG = SchemaCatalog({
+    "users": Table(
+        "users", ("id", "email", "name", "created_at"),
+        ("integer", "text", "text", "timestamp with time zone"), ("id",), (), 1000.0,
+    ),
+    "plans": Table(
+        "plans", ("id", "name", "price", "user_id"),
+        ("integer", "text", "numeric", "integer"), ("id",),
+        ((("user_id",), "users", ("id",)),), 12.0,
+    ),
+    "events": Table("events", ("id", "user_id", "kind"), ("bigint", "integer", "text"), ("id",), (), 5e7),
+})
+
+
+class _PassThroughGuard:
+    def parse(self, sql):
+        return type("Outcome", (), {"validated_output": None})()
+
+
+@pytest.fixture(autouse=True)
+def _no_guardrails(monkeypatch):
+    monkeypatch.setattr("services.validator._guard", _PassThroughGuard)
+
+
+def test_round_trips_through_json():
+    again = SchemaCatalog.from_list(json.loads(json.dumps(CATALOG.to_list())))
+    assert again.to_prompt() == CATALOG.to_prompt()
+    assert again.tables["plans"].fks == ((("user_id",), "users", ("id",)),)
+    assert again.row_estimate("events") == 5e7
+
+
+def test_prompt_text_and_sizes():
+    assert CATALOG.to_prompt().splitlines()[0] == "events(id, user_id, kind)"
+    sized = CATALOG.to_prompt(sizes=True)
+    assert "events(id, user_id, kind)  -- ~50M rows" in sized
+    assert "users(id, email, name, created_at)  -- ~1k rows" in sized
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT email FROM users",
+    "SELECT u.email, p.name FROM users u JOIN plans p ON p.user_id = u.id",
+    "SELECT users.email FROM users",
+    "SELECT u.Email FROM users AS u",
+    "SELECT name, COUNT(*) AS n FROM plans GROUP BY name ORDER BY n DESC",
+    "SELECT x.e FROM (SELECT email AS e FROM users) x WHERE x.e LIKE '%@%'",
+    "SELECT date_trunc('month', created_at) AS m, count(*) FROM users GROUP BY m",
+    "SELECT * FROM users u",
+])
+def test_known_references_pass(sql):
+    validate_sql(sql, CATALOG)
+
+
+@pytest.mark.parametrize("sql, unknown", [
+    ("SELECT emial FROM users", "emial"),
+    ("SELECT u.price FROM users u", "u.price"),
+    ("SELECT users.kind FROM users JOIN events ON events.user_id = users.id", "users.kind"),
+    ("SELECT price FROM users", "price"),
+])
+def test_unknown_columns_are_rejected(sql, unknown):
+    with pytest.raises(ValueError, match=f"Unknown columns: {unknown}"):
+        validate_sql(sql, CATALOG)
+
+
+def test_unknown_tables_still_rejected():
+    with pytest.raises(ValueError, match="Unknown tables: secrets"):
+        validate_sql("SELECT * FROM secrets", CATALOG)
+
+
+class _NoExplain:
+    async def fetchval(self, sql, *args):
+        raise AssertionError("EXPLAIN should have been skipped")
+
+
+@pytest.mark.asyncio
+async def test_small_tables_skip_explain():
+    admission = await admit(_NoExplain(), "SELECT * FROM plans", Budget(), catalog=CATALOG)
+    assert admission.limited
+
+
+@pytest.mark.asyncio
+async def test_large_tables_still_explained():
+    with pytest.raises(AssertionError):
+        await admit(_NoExplain(), "SELECT * FROM events", Budget(), catalog=CATALOG)
+
+
+@pytest.mark.asyncio
+async def test_joins_of_small_tables_skip_explain_only_if_their_product_is_small():
+    await admit(_NoExplain(), "SELECT * FROM plans a CROSS JOIN plans b", Budget(), catalog=CATALOG)
+    # 1,000 x 12 rows: a bad join condition could produce more than the threshold
+    with pytest.raises(AssertionError):
+        await admit(
+            _NoExplain(), "SELECT * FROM users u JOIN plans p ON p.user_id = u.id",
+            Budget(), catalog=CATALOG,
+        )
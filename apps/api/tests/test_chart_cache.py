@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from services import cache
+from services.viz import cache_key
+
+
+def test_cache_key_is_content_addressed():
+    df = pd.DataFrame({"plan": ["a", "b"], "n": [1, 2]})
+    assert cache_key(df) == cache_key(df.copy())
+    assert cache_key(df) != cache_key(df.assign(n=[1, 3]))
+    assert cache_key(df) != cache_key(df, spec="auto:v0")
+
+
+def test_cache_key_handles_array_and_json_columns():
+    df = pd.DataFrame({"tags": [["a", "b"], []], "meta": [{"k": 1}, None]})
+    assert cache_key(df) == cache_key(df.copy())
+    assert cache_key(df) != cache_key(pd.DataFrame({"tags": [["a"], []], "meta": [{"k": 1}, None]}))
+
+
+@pytest.mark.asyncio
+async def test_png_round_trip_and_byte_budget(fake_redis, monkeypatch):
+    monkeypatch.setattr(cache, "CHART_CACHE_MAX_BYTES", 25)
+    await cache.set_png("a", b"x" * 10)
+    await cache.set_png("a", b"x" * 10)   # re-set: counted once
+    await cache.set_png("b", b"y" * 10)
+    assert int(await fake_redis.get(cache._TOTAL)) == 20
+
+    await cache.get_png("a")               # a is now the most recently used
+    await cache.set_png("c", b"z" * 10)
+    assert await cache.get_png("b") is None
+    assert await cache.get_png("a") == b"x" * 10
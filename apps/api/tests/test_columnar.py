@@ -0,0 +1,57 @@
+import datetime as dt
+import decimal
+
+import numpy as np
+import pandas as pd
+
+from services.columnar import to_frame
+from services.executor import QueryResult
+from services.viz import _chart_kind
+
+UTC = dt.timezone.utc
+
+
+def _result(rows, types, columns=None):
+    columns = columns or [f"c{i}" for i in range(len(types))]
+    return QueryResult(columns, rows, types=types)
+
+
+def test_columns_are_typed_from_postgres_types():
+    df = to_frame(_result(
+        [(1, 1.5, decimal.Decimal("2.50"), True, dt.date(2024, 1, 2), "a"),
+         (2, 2.5, decimal.Decimal("3"), False, dt.date(2024, 1, 3), "b")],
+        ["int8", "float8", "numeric", "bool", "date", "text"],
+    ))
+    assert [str(t) for t in df.dtypes[:5]] == [
+        "int64", "float64", "float64", "bool", "datetime64[s]",
+    ]
+    assert df["c5"].tolist() == ["a", "b"]
+    assert df["c2"].tolist() == [2.5, 3.0]
+
+
+def test_nulls_use_nullable_dtypes():
+    df = to_frame(_result([(None, None, None, None), (1, 2.0, True, dt.datetime(2024, 1, 1))],
+                          ["int4", "float4", "bool", "timestamp"]))
+    assert str(df.dtypes["c0"]) == "Int64" and df["c0"].isna().tolist() == [True, False]
+    assert np.isnan(df["c1"][0])
+    assert str(df.dtypes["c2"]) == "boolean"
+    assert pd.isna(df["c3"][0]) and str(df.dtypes["c3"]) == "datetime64[us]"
+
+
+def test_timestamptz_is_tz_aware_and_charted_as_a_line():
+    df = to_frame(_result(
+        [(dt.datetime(2024, 1, d, tzinfo=UTC), d) for d in range(1, 4)],
+        ["timestamptz", "int4"], ["day", "n"],
+    ))
+    assert str(df.dtypes["day"]) == "datetime64[us, UTC]"
+    assert _chart_kind(df) == ("line", "day", "n")
+
+
+def test_array_cells_duplicate_names_and_untyped_results():
+    df = to_frame(_result([(["x", "y"], 1)], ["_text", "int4"], ["id", "id"]))
+    assert list(df.columns) == ["id", "id"]
+    assert df.iloc[0, 0] == ["x", "y"]
+
+    untyped = to_frame(QueryResult(["n"], [(1,), (2,)]))
+    assert untyped["n"].tolist() == [1, 2]
+    assert list(to_frame(_result([], ["int4"], ["n"])).dtypes) == [np.int64]
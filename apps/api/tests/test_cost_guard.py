@@ -0,0 +1,98 @@
+import json
+import re
+
+import pytest
+
+from services import cost_guard, executor
+from services.cost_guard import Budget, QueryRejected, admit, clamp_limit
+from services.validator import parse_sql
+
+
+class _ExplainConn:
+    """EXPLAIN answers from a cost function of the query's LIMIT."""
+
+    def __init__(self, cost_for_limit, plan_rows=100.0):
+        self.cost_for_limit = cost_for_limit
+        self.plan_rows = plan_rows
+        self.explained = []
+
+    async def fetchval(self, sql, *args):
+        assert sql.startswith("EXPLAIN (FORMAT JSON)")
+        self.explained.append(sql)
+        m = re.search(r"LIMIT (\d+)", sql)
+        limit = int(m.group(1)) if m else None
+        plan = {
+            "Total Cost": self.cost_for_limit(limit),
+            "Plan Rows": min(limit or 1e12, self.plan_rows),
+            "Plans": [{"Plan Rows": self.plan_rows}],
+        }
+        return json.dumps([{"Plan": plan}])
+
+
+def _limit(sql):
+    return parse_sql(sql).args["limit"].expression.this
+
+
+def test_clamp_limit_injects_lowers_and_keeps():
+    assert _limit(clamp_limit(parse_sql("SELECT * FROM t"), 100).sql()) == "100"
+    assert _limit(clamp_limit(parse_sql("SELECT * FROM t LIMIT 5000"), 100).sql()) == "100"
+    tree = parse_sql("SELECT * FROM t LIMIT 5")
+    assert clamp_limit(tree, 100) is tree
+
+
+@pytest.mark.asyncio
+async def test_cheap_query_is_limited_but_not_downgraded():
+    conn = _ExplainConn(lambda limit: 10.0)
+    admission = await admit(conn, "SELECT * FROM t;", Budget(max_limit=100))
+    assert _limit(admission.sql) == "100"
+    assert admission.limited and not admission.downgraded
+    assert len(conn.explained) == 1
+
+
+@pytest.mark.asyncio
+async def test_own_small_limit_is_not_reported_as_limited():
+    conn = _ExplainConn(lambda limit: 10.0)
+    admission = await admit(conn, "SELECT * FROM t LIMIT 3;", Budget(max_limit=100))
+    assert not admission.limited
+
+
+@pytest.mark.asyncio
+async def test_expensive_query_is_downgraded_and_flagged():
+    conn = _ExplainConn(lambda limit: 1e9 if limit > cost_guard.COST_GUARD_DOWNGRADE_LIMIT else 10.0)
+    admission = await admit(conn, "SELECT * FROM t", Budget(max_limit=10_000))
+    assert _limit(admission.sql) == str(cost_guard.COST_GUARD_DOWNGRADE_LIMIT)
+    assert admission.downgraded and admission.limited
+
+
+@pytest.mark.asyncio
+async def test_too_expensive_or_too_wide_is_rejected():
+    with pytest.raises(QueryRejected):
+        await admit(_ExplainConn(lambda limit: 1e9), "SELECT * FROM t", Budget())
+    with pytest.raises(QueryRejected):
+        await admit(_ExplainConn(lambda limit: 1.0, plan_rows=1e12), "SELECT * FROM t", Budget())
+
+
+@pytest.mark.asyncio
+async def test_streaming_uses_its_own_cap():
+    conn = _ExplainConn(lambda limit: 10.0)
+    budget = Budget(max_limit=10_000, max_stream_rows=1_000_000)
+    admission = await admit(conn, "SELECT * FROM t", budget, stream=True)
+    assert _limit(admission.sql) == "1000000"
+
+
+@pytest.mark.asyncio
+async def test_result_cache_hit_skips_explain(fake_redis, monkeypatch):
+    conn = _ExplainConn(lambda limit: 10.0)
+
+    async def fetch_result(conn, sql, **kw):
+        return executor.QueryResult(["n"], [(1,)])
+
+    monkeypatch.setattr(executor, "fetch_result", fetch_result)
+    workspace = {"id": 7, "result_cache_ttl": 60, "result_cache_probe": False}
+
+    first, cached = await executor.run_query(conn, "SELECT n FROM t", "dsn", workspace)
+    assert not cached and first.limited
+    second, cached = await executor.run_query(conn, "SELECT n FROM t", "dsn", workspace)
+    assert cached and second.rows == [(1,)]
+    assert second.sql == first.sql and second.limited
+    assert len(conn.explained) == 1
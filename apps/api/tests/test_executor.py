@@ -0,0 +1,112 @@
+from contextlib import aclosing, asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from services import executor
+from services.executor import fetch_result, stream_rows
+
+
+class _Cursor:
+    def __init__(self, rows, log):
+        self.rows = rows
+        self.pos = 0
+        self.log = log
+
+    async def forward(self, n):
+        self.pos += n
+
+    async def fetch(self, n):
+        self.log.append(("fetch", n))
+        batch = self.rows[self.pos:self.pos + n]
+        self.pos += n
+        return batch
+
+
+class _Statement:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get_attributes(self):
+        return [
+            SimpleNamespace(name=c, type=SimpleNamespace(name=t))
+            for c, t in zip(self.conn.columns, self.conn.types)
+        ]
+
+    async def cursor(self, *args):
+        return _Cursor(self.conn.rows, self.conn.log)
+
+
+class _Conn:
+    def __init__(self, columns, rows, types=None):
+        self.columns = columns
+        self.rows = rows
+        self.types = types or ["int4", "text"]
+        self.log = []
+
+    @asynccontextmanager
+    async def transaction(self, readonly=False):
+        self.log.append(("begin", readonly))
+        try:
+            yield
+        finally:
+            self.log.append(("end",))
+
+    async def execute(self, sql, *args):
+        self.log.append(("execute", sql, args))
+
+    async def prepare(self, sql):
+        return _Statement(self)
+
+
+def _conn(n=25):
+    return _Conn(["id", "name"], [(i, f"user{i}") for i in range(n)])
+
+
+@pytest.mark.asyncio
+async def test_fetch_result_reads_one_extra_row_to_detect_more():
+    conn = _conn(25)
+    result = await fetch_result(conn, "SELECT ...", max_rows=20)
+    assert result.columns == ["id", "name"]
+    assert len(result) == 20 and result.truncated
+
+    result = await fetch_result(conn, "SELECT ...", max_rows=25)
+    assert len(result) == 25 and not result.truncated
+
+
+@pytest.mark.asyncio
+async def test_offset_pages_and_batches(monkeypatch):
+    monkeypatch.setattr(executor, "FETCH_BATCH", 4)
+    conn = _conn(25)
+    result = await fetch_result(conn, "SELECT ...", offset=20, max_rows=10)
+    assert [r[0] for r in result.rows] == [20, 21, 22, 23, 24]
+    assert not result.truncated
+    assert all(n <= 4 for op, *rest in conn.log if op == "fetch" for n in rest)
+
+
+@pytest.mark.asyncio
+async def test_byte_budget_stops_the_cursor():
+    conn = _conn(1000)
+    result = await fetch_result(conn, "SELECT ...", max_rows=1000, max_bytes=200)
+    assert result.truncated and len(result) < 20
+
+
+@pytest.mark.asyncio
+async def test_settings_are_local_and_early_close_ends_transaction():
+    conn = _conn(100)
+    async with aclosing(stream_rows(
+        conn, "SELECT ...", settings={"statement_timeout": "1000", "work_mem": "8MB"}
+    )) as it:
+        await anext(it)
+        await anext(it)
+    assert conn.log[0] == ("begin", True)
+    op, sql, args = conn.log[1]
+    assert "set_config($1, $2, true)" in sql
+    assert args == ("statement_timeout", "1000", "work_mem", "8MB")
+    assert conn.log[-1] == ("end",)
+
+
+@pytest.mark.asyncio
+async def test_fetch_result_reports_postgres_column_types():
+    result = await fetch_result(_conn(3), "SELECT ...")
+    assert result.types == ["int4", "text"]
@@ -0,0 +1,164 @@
+import datetime as dt
+import decimal
+
+import duckdb
+import pytest
+
+from services import followup, result_handles
+from services.catalog import SchemaCatalog, Table
+from services.validator import parse_sql
+
+CATALOG = SchemaCatalog({
+    "payments": Table(
+        "payments", ("id", "user_id", "amount", "status"),
+        ("integer", "integer", "numeric", "text"), ("id",), (), 10.0,
+    ),
+    "users": Table("users", ("id", "email"), ("integer", "text"), ("id",), (), 5.0),
+})
+
+# amount has ties and NULLs, so pages must split inside a run of equal keys
+ROWS = [
+    (i, i % 4, None if i % 7 == 0 else (i * 37) % 5, "paid" if i % 3 else "failed")
+    for i in range(1, 41)
+]
+
+
+@pytest.fixture
+def db():
+    conn = duckdb.connect()
+    # Postgres NULL order, which the rendered SQL leaves implicit
+    conn.execute("SET default_null_order = 'nulls_last_on_asc_first_on_desc'")
+    conn.execute("CREATE TABLE payments (id INTEGER, user_id INTEGER, amount INTEGER, status TEXT)")
+    conn.executemany("INSERT INTO payments VALUES (?, ?, ?, ?)", ROWS)
+    yield conn
+    conn.close()
+
+
+def _walk(db, sql: str, page_size: int) -> list[tuple]:
+    """All rows of *sql*, fetched page by page through keyset cursors."""
+    tree = parse_sql(sql)
+    first = db.execute(sql).fetchall()
+    columns = [d[0] for d in db.description]
+    keys = followup.order_keys(tree, columns, ["int4"] * len(columns))
+    assert keys is not None
+
+    seen = first[:page_size]
+    cursor = followup.next_cursor(seen, keys, None) if len(first) > page_size else None
+    while cursor is not None:
+        prev = followup.decode_cursor(cursor, keys, ["int4"] * len(columns))
+        page_sql, args = followup.page_query(tree, keys, prev, page_size, 1000)
+        if page_sql is None:
+            break
+        rows = db.execute(page_sql, list(args)).fetchall()
+        seen += rows[:page_size]
+        cursor = followup.next_cursor(rows[:page_size], keys, prev) if len(rows) > page_size else None
+    return seen
+
+
+@pytest.mark.parametrize("order", [
+    "amount ASC NULLS LAST, id",
+    "amount DESC NULLS FIRST, id DESC",
+    "amount ASC NULLS FIRST, id",
+    "amount DESC NULLS LAST, id",
+])
+@pytest.mark.parametrize("page_size", [1, 3, 7])
+def test_keyset_pages_match_the_full_result(db, order, page_size):
+    sql = f"SELECT id, amount FROM payments ORDER BY {order}"
+    assert _walk(db, sql, page_size) == db.execute(sql).fetchall()
+
+
+def test_keyset_paging_stops_at_the_query_limit(db):
+    sql = "SELECT id, amount FROM payments ORDER BY amount NULLS LAST, id LIMIT 10"
+    assert _walk(db, sql, 3) == db.execute(sql).fetchall()
+
+
+def test_aggregate_pages_go_through_having(db):
+    sql = "SELECT user_id, COUNT(*) AS n FROM payments GROUP BY user_id ORDER BY n DESC, user_id"
+    tree = parse_sql(sql)
+    keys = followup.order_keys(tree, ["user_id", "n"], ["int4", "int8"])
+    page_sql, _ = followup.page_query(tree, keys, ([10, 1], 1, 2), 2, 1000)
+    assert "HAVING" in page_sql and "WHERE" not in page_sql
+    assert _walk(db, sql, 1) == db.execute(sql).fetchall()
+
+
+@pytest.mark.parametrize("sql, columns", [
+    ("SELECT id FROM payments", ["id"]),
+    ("SELECT id FROM payments ORDER BY amount", ["id"]),
+    ("SELECT id FROM payments ORDER BY id OFFSET 5", ["id"]),
+    ("SELECT id, ROW_NUMBER() OVER (ORDER BY amount) AS r FROM payments ORDER BY r", ["id", "r"]),
+    ("SELECT id FROM payments UNION SELECT id FROM users ORDER BY 1", ["id"]),
+])
+def test_no_keyset_when_the_order_is_not_in_the_output(sql, columns):
+    assert followup.order_keys(parse_sql(sql), columns, ["int4"] * len(columns)) is None
+
+
+def test_order_keys_resolve_ordinals_and_aliases():
+    tree = parse_sql("SELECT status, SUM(amount) AS total FROM payments GROUP BY 1 ORDER BY total DESC, 1")
+    keys = followup.order_keys(tree, ["status", "total"], ["text", "numeric"])
+    assert [(k["expr"], k["index"], k["desc"], k["nulls_first"]) for k in keys] == [
+        ("SUM(amount)", 1, True, True),
+        ("status", 0, False, False),
+    ]
+
+
+def test_unsupported_key_type_falls_back_to_offset():
+    tree = parse_sql("SELECT id FROM payments ORDER BY id")
+    assert followup.order_keys(tree, ["id"], ["jsonb"]) is None
+
+
+def test_cursor_round_trip_and_tampering():
+    keys = [{"expr": "paid_at", "index": 0, "desc": False, "nulls_first": False},
+            {"expr": "amount", "index": 1, "desc": False, "nulls_first": False}]
+    types = ["timestamptz", "numeric"]
+    last = (dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc), decimal.Decimal("9.99"))
+    cursor = followup.next_cursor([last, last], keys, None)
+    assert followup.decode_cursor(cursor, keys, types) == (list(last), 2, 2)
+    # a page that ends on the same key carries the ties forward
+    again = followup.next_cursor([last], keys, (list(last), 2, 2))
+    assert followup.decode_cursor(again, keys, types) == (list(last), 3, 3)
+    for bad in ("", "not-base64!", cursor[:-4]):
+        with pytest.raises(ValueError):
+            followup.decode_cursor(bad, keys, types)
+
+
+# ── refinements ──────────────────────────────────────────────────────────────
+def test_refine_filters_source_columns_and_outputs():
+    tree = parse_sql(
+        "SELECT p.user_id, SUM(p.amount) AS total FROM payments p "
+        "JOIN users u ON u.id = p.user_id GROUP BY p.user_id ORDER BY total DESC LIMIT 100"
+    )
+    sql = followup.refine(tree, [
+        {"column": "status", "op": "=", "value": "paid"},
+        {"column": "total", "op": ">=", "value": 50},
+        {"column": "users.email", "op": "in", "value": ["a@x.io", "b@x.io"]},
+    ], 10, CATALOG)
+    assert "WHERE p.status = 'paid' AND u.email IN ('a@x.io', 'b@x.io')" in sql
+    assert "HAVING SUM(p.amount) >= 50" in sql
+    assert sql.endswith("LIMIT 10")
+
+
+def test_refine_rejects_unknown_and_ambiguous_columns():
+    tree = parse_sql("SELECT p.amount FROM payments p JOIN users u ON u.id = p.user_id")
+    with pytest.raises(ValueError, match="Unknown column"):
+        followup.refine(tree, [{"column": "nope", "op": "=", "value": 1}], None, CATALOG)
+    with pytest.raises(ValueError, match="Ambiguous column"):
+        followup.refine(tree, [{"column": "id", "op": "=", "value": 1}], None, CATALOG)
+    with pytest.raises(ValueError, match="between"):
+        followup.refine(tree, [{"column": "amount", "op": "between", "value": [1]}], None, CATALOG)
+
+
+def test_refine_does_not_touch_the_memoized_tree():
+    sql = "SELECT id, amount FROM payments"
+    followup.refine(parse_sql(sql), [{"column": "amount", "op": "is_null"}], 5, CATALOG)
+    assert parse_sql(sql).sql(dialect="postgres") == sql
+
+
+@pytest.mark.asyncio
+async def test_handle_round_trips_the_ast(fake_redis):
+    tree = parse_sql("SELECT id FROM payments WHERE status = 'paid' ORDER BY id")
+    keys = followup.order_keys(tree, ["id"], ["int4"])
+    handle = await result_handles.create(1, "u1", tree.sql(), ["id"], ["int4"], keys, tree)
+    data = await result_handles.load(handle, 1, "u1")
+    assert data["keys"] == keys
+    assert result_handles.tree_of(data) == tree
+    assert await result_handles.load(handle, 1, "someone-else") is None
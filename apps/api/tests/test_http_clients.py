@@ -0,0 +1,25 @@
+import pytest
+
+from services import http_clients
+
+
+@pytest.mark.asyncio
+async def test_hf_client_is_shared_and_recreated_after_close(monkeypatch):
+    monkeypatch.setenv("HF_ACCESS_TOKEN", "hf_test")
+    await http_clients.close()
+
+    first = http_clients.hf_client()
+    assert http_clients.hf_client() is first
+    assert first.headers["Authorization"] == "Bearer hf_test"
+
+    await http_clients.close()
+    assert first.is_closed
+    second = http_clients.hf_client()
+    assert second is not first and not second.is_closed
+    await http_clients.close()
+
+
+def test_pool_wait_covers_a_whole_generation():
+    # a burst must queue for a connection, not fail fast with PoolTimeout
+    assert http_clients.HF_TIMEOUT.pool >= http_clients.HF_TIMEOUT.read
+    assert http_clients.OPENAI_TIMEOUT.pool >= http_clients.OPENAI_TIMEOUT.read
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services import jobs
+
+
+@pytest.fixture
+def queue(fake_redis, monkeypatch):
+    monkeypatch.setattr(jobs, "runners", {})
+    monkeypatch.setattr(jobs, "JOB_REQUEUE_DELAY", 0)
+    return fake_redis
+
+
+async def _drain(r, worker="w1"):
+    while await jobs._work_once(r, pop_timeout=0.01, processing=jobs._processing_key(worker)):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_submit_deduplicates_the_same_question(queue):
+    first, dup = await jobs.submit("chart", 1, "T1", "u1", "MRR by month")
+    again, dup_again = await jobs.submit("chart", 1, "T1", "u1", "  mrr by month? ")
+    other, _ = await jobs.submit("chart", 1, "T1", "u2", "MRR by month")
+    assert not dup and dup_again and again == first
+    assert other != first
+    assert await queue.llen(jobs.QUEUE) == 2
+    assert (await jobs.get(first, 1, "u1"))["status"] == "queued"
+    assert await jobs.get(first, 1, "u2") is None       # not the owner
+
+
+@pytest.mark.asyncio
+async def test_worker_runs_jobs_and_stores_results(queue):
+    async def chart(job):
+        return {"headers": {"ETag": '"x"'}}, b"PNG:" + job["question"].encode()
+
+    async def ask(job):
+        raise HTTPException(404, "No data to plot")
+
+    jobs.runners.update(chart=chart, ask=ask)
+    ok, _ = await jobs.submit("chart", 1, "T1", "u1", "q1")
+    bad, _ = await jobs.submit("ask", 1, "T1", "u1", "q2")
+    await _drain(queue)
+
+    done = await jobs.get(ok, 1, "u1")
+    assert done["status"] == "done" and await jobs.blob(ok) == b"PNG:q1"
+    failed = jobs.public(await jobs.get(bad, 1, "u1"))
+    assert failed == {"job_id": bad, "kind": "ask", "status": "failed", "error": "No data to plot"}
+
+    # a failed job does not block resubmitting the same question
+    retry, dup = await jobs.submit("ask", 1, "T1", "u1", "q2")
+    assert retry != bad and not dup
+
+
+@pytest.mark.asyncio
+async def test_per_workspace_concurrency_cap(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_WORKSPACE_CONCURRENCY", 1)
+    running: dict[str, int] = {}
+    peak: dict[str, int] = {}
+
+    async def ask(job):
+        ws = job["workspace_id"]
+        running[ws] = running.get(ws, 0) + 1
+        peak[ws] = max(peak.get(ws, 0), running[ws])
+        await asyncio.sleep(0.05)
+        running[ws] -= 1
+        return {"answer": "ok"}, None
+
+    jobs.runners["ask"] = ask
+    ids = [(await jobs.submit("ask", ws, "T", "u", f"q{i}"))[0]
+           for i, ws in enumerate((1, 1, 1, 2))]
+    await asyncio.gather(*(_drain(queue, f"w{n}") for n in range(4)))
+
+    assert peak == {"1": 1, "2": 1}
+    statuses = [(await jobs.get(i, ws, "u"))["status"] for i, ws in zip(ids, (1, 1, 1, 2))]
+    assert statuses == ["done"] * 4
+    assert await queue.zcard(jobs._running_key("1")) == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_requeues_and_wait_long_polls(queue):
+    attempts = []
+
+    async def chart(job):
+        attempts.append(job["id"])
+        if len(attempts) == 1:
+            raise jobs.Retry()
+        return {"headers": {}}, b"png"
+
+    jobs.runners["chart"] = chart
+    job_id, _ = await jobs.submit("chart", 1, "T1", "u1", "q")
+    await jobs._work_once(queue, pop_timeout=0.01, processing=jobs._processing_key("w1"))
+    assert (await jobs.get(job_id, 1, "u1"))["status"] == "queued"
+    assert await queue.llen(jobs._processing_key("w1")) == 0
+
+    waiter = asyncio.ensure_future(jobs.wait(job_id, 1, "u1", timeout=5))
+    await _drain(queue)
+    assert (await waiter)["status"] == "done"
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_jobs_of_a_dead_worker_are_requeued_by_the_reaper(queue):
+    job_id, _ = await jobs.submit("ask", 1, "T1", "u1", "q")
+    # a worker claims the job and is killed before recording anything
+    dead = jobs._processing_key("dead")
+    assert await queue.blmove(jobs.QUEUE, dead, 0.01, "RIGHT", "LEFT") == job_id
+    await queue.sadd(jobs.PROCESSING, dead)
+
+    assert await jobs.reap(queue, timeout=0) == 0           # first sighting starts the clock
+    assert await jobs.reap(queue) == 0                      # still within JOB_TIMEOUT
+    assert await jobs.reap(queue, timeout=0) == 1
+    assert await queue.lrange(jobs.QUEUE, 0, -1) == [job_id]
+    assert await queue.llen(dead) == 0
+    assert (await jobs.get(job_id, 1, "u1"))["status"] == "queued"
+
+    async def ask(job):
+        return {"answer": "ok"}, None
+
+    jobs.runners["ask"] = ask
+    await _drain(queue)
+    assert (await jobs.get(job_id, 1, "u1"))["status"] == "done"
+    # a live worker's list is empty again, and the dead one's is forgotten
+    await jobs.reap(queue)
+    assert await queue.llen(jobs._processing_key("w1")) == 0
+    assert await queue.smembers(jobs.PROCESSING) == set()
+
+
+@pytest.mark.asyncio
+async def test_reaper_drops_finished_and_expired_claims(queue):
+    done, _ = await jobs.submit("ask", 1, "T1", "u1", "q1")
+    await queue.hset(jobs._key(done), "status", "done")
+    processing = jobs._processing_key("dead")
+    await queue.delete(jobs.QUEUE)
+    await queue.lpush(processing, done, "expired-job")
+    await queue.sadd(jobs.PROCESSING, processing)
+
+    assert await jobs.reap(queue, timeout=0) == 0
+    assert await queue.llen(processing) == 0
+    assert await queue.llen(jobs.QUEUE) == 0
@@ -1,7 +1,22 @@
-import pytest, asyncio
-from apps.api.services.gpt4_fallback import to_sql
+import os
+
+import pytest
+from services.nl2sql import to_sql
 from services.validator import validate_sql
 
+# data/sample_saas_dump.sql
+SCHEMA = """plans(id, name, price, created_at)
+users(id, email, name, password_hash, created_at)
+projects(id, user_id, name, description, created_at)
+subscriptions(id, user_id, plan_id, status, started_at, ended_at)
+payments(id, user_id, amount, status, paid_at)"""
+
+# calls the real models: needs the HF endpoint or an OpenAI key
+pytestmark = pytest.mark.skipif(
+    not (os.getenv("HF_ENDPOINT_URL") or os.getenv("OPENAI_API_KEY")),
+    reason="no NL→SQL backend configured",
+)
+
 # 30-question golden set
 QUESTIONS = [
     # ── plans ───────────────────────────────────────────────
@@ -46,6 +61,7 @@ QUESTIONS = [
 @pytest.mark.parametrize("q", QUESTIONS)
 async def test_sql_snapshot(snapshot, q):
     """NL → SQL → validated SQL should stay stable."""
-    sql = validate_sql(await to_sql(q))
+    raw, _source = await to_sql(q, SCHEMA)
+    sql = validate_sql(raw, SCHEMA)
     snapshot.assert_match(sql, q) # <-- FIX: Pass the question as snapshot name
     
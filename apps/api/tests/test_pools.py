@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from services import pools
+from services.pools import PoolRegistry
+from tests.fakes import FakePool
+
+
+@pytest.fixture
+def created(monkeypatch):
+    """Replace asyncpg.create_pool; returns the list of pools it made."""
+    made = []
+
+    async def create_pool(dsn, min_size=0, max_size=5):
+        await asyncio.sleep(0.01)
+        pool = FakePool(dsn, min_size, max_size)
+        made.append(pool)
+        return pool
+
+    monkeypatch.setattr(pools.asyncpg, "create_pool", create_pool)
+    return made
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_use_creates_one_pool(created):
+    reg = PoolRegistry()
+    got = await asyncio.gather(*(reg.get("dsn-a") for _ in range(10)))
+    assert len(created) == 1
+    assert all(p is created[0] for p in got)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_creator_does_not_fail_followers(created):
+    reg = PoolRegistry()
+    leader = asyncio.create_task(reg.get("dsn-a"))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(reg.get("dsn-a"))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    pool = await follower
+    assert pool is created[0] and not pool.closed
+    assert len(created) == 1
+
+
+@pytest.mark.asyncio
+async def test_overflow_never_evicts_the_new_pool(created):
+    reg = PoolRegistry(max_open=1)
+    async with reg.connection("dsn-a"):
+        # dsn-a is busy, so dsn-b overflows; it must still come back usable
+        async with reg.connection("dsn-b") as conn:
+            assert await conn.fetchval("SELECT 1") == 1
+    assert not created[1].closed
+
+
+@pytest.mark.asyncio
+async def test_overflow_evicts_least_recently_used_idle_pool(created):
+    reg = PoolRegistry(max_open=2)
+    for dsn in ("dsn-a", "dsn-b", "dsn-c"):
+        await reg.get(dsn)
+    assert [p.closed for p in created] == [True, False, False]
+    assert reg.stats()["open_pools"] == 2
+
+
+@pytest.mark.asyncio
+async def test_idle_pools_are_reaped_but_busy_ones_kept(created):
+    reg = PoolRegistry(idle_ttl=0)
+    await reg.get("dsn-a")
+    async with reg.connection("dsn-b"):
+        await reg._evict_idle()
+        assert created[0].closed and not created[1].closed
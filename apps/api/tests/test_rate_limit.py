@@ -0,0 +1,75 @@
+import pytest
+
+from services import rate_limit
+from services.rate_limit import Quota, RateLimiter, quota_for
+
+
+def test_quotas_come_from_the_plan_or_the_override():
+    assert quota_for({"plan": "team"}).user_per_min == 60
+    assert quota_for({"plan": None}).user_per_min == 5          # default plan
+    assert quota_for({"plan": "nope"}).workspace_per_min == 20
+    q = quota_for({"plan": "free", "rate_limit_per_min": 50})
+    assert (q.user_per_min, q.workspace_per_min) == (50, 50)
+
+
+@pytest.mark.asyncio
+async def test_user_bucket_empties_then_reports_retry_after(fake_redis):
+    limiter = RateLimiter()
+    quota = Quota(user_per_min=3, workspace_per_min=100)
+    decisions = [await limiter.take(1, "u1", quota) for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    # one token every 20 s
+    assert 0 < decisions[-1].retry_after <= 20
+    # someone else in the workspace is unaffected
+    assert (await limiter.take(1, "u2", quota)).allowed
+    assert 0 < await fake_redis.pttl("rl:1:u:u1") <= 61_000
+
+
+@pytest.mark.asyncio
+async def test_workspace_bucket_is_shared_by_its_users(fake_redis):
+    limiter = RateLimiter()
+    quota = Quota(user_per_min=10, workspace_per_min=2)
+    assert (await limiter.take(1, "a", quota)).allowed
+    assert (await limiter.take(1, "b", quota)).allowed
+    assert not (await limiter.take(1, "c", quota)).allowed
+    assert (await limiter.take(2, "c", quota)).allowed          # other workspace
+
+
+@pytest.mark.asyncio
+async def test_denied_callers_are_turned_away_locally(fake_redis, monkeypatch):
+    limiter = RateLimiter()
+    quota = Quota(user_per_min=1, workspace_per_min=100)
+    await limiter.take(1, "u1", quota)
+    assert not (await limiter.take(1, "u1", quota)).allowed
+
+    def boom():
+        raise AssertionError("Redis must not be called")
+
+    monkeypatch.setattr(rate_limit, "get_redis", boom)
+    decision = await limiter.take(1, "u1", quota)
+    assert not decision.allowed and decision.retry_after > 0
+
+
+@pytest.mark.asyncio
+async def test_cost_debits_several_tokens(fake_redis):
+    limiter = RateLimiter()
+    quota = Quota(user_per_min=10, workspace_per_min=100)
+    assert (await limiter.take(1, "u1", quota, cost=8)).allowed
+    assert not (await limiter.take(1, "u1", quota, cost=3)).allowed
+
+
+@pytest.mark.asyncio
+async def test_an_oversized_batch_is_paid_back_at_the_plan_rate(fake_redis):
+    limiter = RateLimiter()
+    quota = quota_for({"plan": "free"})                 # 5/min per user, 20/min workspace
+    # from full buckets the batch goes through, leaving the user 45 tokens in debt
+    assert (await limiter.take(1, "u1", quota, cost=50)).allowed
+    decision = await limiter.take(1, "u1", quota)
+    assert not decision.allowed
+    # 46 tokens at 5/min before the next question
+    assert 550 <= decision.retry_after <= 553
+    # the debt outlives the usual one-minute TTL
+    assert await fake_redis.pttl("rl:1:u:u1") > 550_000
+    # and a second batch has to wait for a full bucket, not just its own cost
+    other = RateLimiter()
+    assert not (await other.take(1, "u1", quota, cost=50)).allowed
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.render_pool import RenderBusy, RenderPool
+from services.viz import downsample, lttb, top_n_other
+
+
+def _fake_render(df):
+    # stands in for kaleido: slow enough to queue behind, reports the worker
+    time.sleep(0.2)
+    return f"{os.getpid()}:{len(df)}".encode()
+
+
+def _no_warm():
+    pass
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(10_000)
+    y = np.zeros(10_000)
+    y[4321] = 100.0
+    keep = lttb(x, y, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 9_999
+    assert 4321 in keep
+    assert (np.diff(keep) > 0).all()
+
+
+def test_line_is_downsampled_to_the_point_budget():
+    df = pd.DataFrame({
+        "day": pd.date_range("2020-01-01", periods=5_000, freq="h", tz="UTC"),
+        "n": np.random.default_rng(0).random(5_000),
+    }).sample(frac=1, random_state=0)  # unordered, as SQL may return it
+    out = downsample(df, max_points=500)
+    assert len(out) == 500
+    assert out["day"].is_monotonic_increasing
+    assert out["day"].iloc[0] == df["day"].min()
+
+
+def test_categories_beyond_top_n_are_folded_into_other():
+    df = pd.DataFrame({"plan": [f"p{i}" for i in range(50)], "n": range(50)})
+    out = top_n_other(df, "plan", "n", 5)
+    assert list(out["plan"]) == ["p49", "p48", "p47", "p46", "other"]
+    assert out["n"].sum() == df["n"].sum()
+    # small results are left alone
+    small = df.head(3)
+    assert downsample(small) is small
+
+
+@pytest.mark.asyncio
+async def test_pool_renders_in_warm_processes_with_back_pressure():
+    pool = RenderPool(workers=1, queue_max=2, render=_fake_render, warm=_no_warm)
+    await pool.start()
+    try:
+        df = pd.DataFrame({"x": ["a"], "y": [1]})
+        first = asyncio.ensure_future(pool.render(df))
+        second = asyncio.ensure_future(pool.render(df))
+        await asyncio.sleep(0)
+        assert pool.pending == 2
+        with pytest.raises(RenderBusy):
+            await pool.render(df)
+
+        pngs = await asyncio.gather(first, second)
+        assert {p.split(b":")[0] for p in pngs} != {str(os.getpid()).encode()}
+        assert pool.pending == 0
+        assert await pool.render(df)  # accepted again once drained
+    finally:
+        await pool.close()
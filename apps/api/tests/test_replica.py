@@ -0,0 +1,162 @@
+import datetime as dt
+import decimal
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import duckdb
+import pytest
+
+from services import executor, replica
+from services.catalog import SchemaCatalog, Table
+from services.cost_guard import Budget
+
+UTC = dt.timezone.utc
+T0 = dt.datetime(2024, 1, 1, tzinfo=UTC)
+
+CATALOG = SchemaCatalog({
+    "payments": Table(
+        "payments", ("id", "plan", "amount", "updated_at"),
+        ("integer", "text", "numeric(10,2)", "timestamp with time zone"), ("id",), (), 3.0,
+    ),
+    "events": Table("events", ("id", "kind"), ("bigint", "text"), ("id",), (), 2.0),
+    "users": Table("users", ("id", "email"), ("integer", "text"), ("id",), (), 2.0),
+})
+PG_TYPES = {"integer": "int4", "bigint": "int8", "text": "text",
+            "numeric(10,2)": "numeric", "timestamp with time zone": "timestamptz"}
+WORKSPACE = {"id": 1, "replica_tables": ["payments", "events"]}
+
+
+class _Customer:
+    """Just enough of an asyncpg connection for executor.stream_rows."""
+
+    def __init__(self):
+        self.tables = {
+            "payments": [
+                (1, "pro", decimal.Decimal("10.00"), T0),
+                (2, "pro", decimal.Decimal("5.50"), T0),
+                (3, "free", decimal.Decimal("0.00"), T0),
+            ],
+            "events": [(1, "signup"), (2, "login")],
+        }
+        self.queries = []
+
+    @asynccontextmanager
+    async def transaction(self, readonly=False):
+        yield
+
+    async def prepare(self, sql):
+        self.queries.append(sql)
+        name = sql.split(" FROM ")[1].split()[0].strip('"')
+        table = CATALOG.tables[name]
+        conn = self
+
+        class _Statement:
+            def get_attributes(self):
+                return [SimpleNamespace(name=c, type=SimpleNamespace(name=PG_TYPES[t]))
+                        for c, t in zip(table.columns, table.types)]
+
+            async def cursor(self, *args):
+                rows = conn.tables[name]
+                if '"id" >' in sql:
+                    rows = [r for r in rows if r[0] > int(args[0])]
+                elif '"updated_at" >=' in sql:
+                    since = dt.datetime.fromisoformat(args[0]) - dt.timedelta(seconds=60)
+                    rows = [r for r in rows if r[3] >= since]
+                return _Cursor(rows)
+
+        return _Statement()
+
+    async def fetchval(self, sql, *args):
+        raise AssertionError("replica answers must not touch the customer database")
+
+
+class _Cursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    async def fetch(self, n):
+        batch, self.rows = self.rows[:n], self.rows[n:]
+        return batch
+
+
+@pytest.fixture
+def customer(tmp_path, monkeypatch):
+    monkeypatch.setattr(replica, "REPLICA_DIR", str(tmp_path))
+    scheduled = []
+    monkeypatch.setattr(replica, "_schedule_sync", lambda *a: scheduled.append(a))
+    db = _Customer()
+    db.scheduled = scheduled
+    return db
+
+
+async def _ask(sql, workspace=WORKSPACE):
+    return await replica.try_run(workspace, "dsn", sql, CATALOG, Budget(), 1000)
+
+
+TOTALS = "SELECT plan, sum(amount) AS total FROM payments GROUP BY plan ORDER BY plan"
+
+
+@pytest.mark.asyncio
+async def test_aggregates_are_answered_from_the_snapshot(customer):
+    state = await replica.sync(customer, replica.config_for(WORKSPACE), CATALOG)
+    assert state["payments"]["rows"] == 3 and state["payments"]["mark"] == "updated_at"
+    assert state["events"]["mark"] == "id"
+
+    result = await _ask(TOTALS)
+    assert result.columns == ["plan", "total"]
+    assert [(p, float(t)) for p, t in result.rows] == [("free", 0.0), ("pro", 15.5)]
+    assert result.as_of == state["payments"]["synced_at"]
+    assert result.limited and "LIMIT" in result.sql and result.types[0] == "text"
+    assert not customer.scheduled
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_upserts_and_appends(customer):
+    config = replica.config_for(WORKSPACE)
+    await replica.sync(customer, config, CATALOG)
+
+    later = T0 + dt.timedelta(hours=1)
+    customer.tables["payments"][0] = (1, "pro", decimal.Decimal("20.00"), later)
+    customer.tables["payments"].append((4, "team", decimal.Decimal("99.00"), later))
+    customer.tables["events"].append((3, "login"))
+    customer.queries.clear()
+    state = await replica.sync(customer, config, CATALOG)
+
+    assert all("WHERE" in q for q in customer.queries)
+    assert state["payments"]["rows"] == 4 and state["events"]["rows"] == 3
+    result = await _ask(TOTALS)
+    assert [(p, float(t)) for p, t in result.rows] == [
+        ("free", 0.0), ("pro", 25.5), ("team", 99.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_ineligible_or_stale_queries_fall_through(customer):
+    await replica.sync(customer, replica.config_for(WORKSPACE), CATALOG)
+    assert await _ask("SELECT plan FROM payments") is None               # no aggregate
+    assert await _ask("SELECT count(*) FROM users") is None              # not replicated
+    stale = dict(WORKSPACE, replica_max_lag=-1)
+    assert await _ask(TOTALS, stale) is None
+    assert await _ask(TOTALS, {"id": 1}) is None                         # replica off
+
+
+@pytest.mark.asyncio
+async def test_missing_snapshot_schedules_a_sync(customer):
+    assert await _ask(TOTALS) is None
+    assert len(customer.scheduled) == 1
+
+
+@pytest.mark.asyncio
+async def test_replica_sql_cannot_read_other_files(customer):
+    await replica.sync(customer, replica.config_for(WORKSPACE), CATALOG)
+    with pytest.raises(duckdb.Error, match="disabled by configuration"):
+        replica._query("1", {"payments"}, "SELECT * FROM read_text('/etc/hostname')", 10)
+
+
+@pytest.mark.asyncio
+async def test_run_query_routes_to_the_replica(customer):
+    await replica.sync(customer, replica.config_for(WORKSPACE), CATALOG)
+    result, cached = await executor.run_query(
+        customer, TOTALS, "dsn", WORKSPACE, catalog=CATALOG
+    )
+    assert not cached and result.as_of is not None and len(result) == 2
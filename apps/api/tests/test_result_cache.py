@@ -0,0 +1,77 @@
+import datetime as dt
+import decimal
+import uuid
+
+import pytest
+
+from services import result_cache
+from services.result_cache import Policy
+
+
+def test_dumps_loads_round_trip_keeps_types():
+    row = (
+        1, "a", None, True, 2.5,
+        decimal.Decimal("12.30"),
+        dt.datetime(2024, 5, 1, 12, 30, tzinfo=dt.timezone.utc),
+        dt.date(2024, 5, 1),
+        dt.time(8, 15),
+        dt.timedelta(hours=2),
+        uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        b"\x00\xff",
+    )
+    blob = result_cache.dumps(["x"] * len(row), [row], True, {"sql": "SELECT 1"})
+    columns, rows, truncated, meta = result_cache.loads(blob)
+    assert rows == [row] and truncated is True and meta == {"sql": "SELECT 1"}
+    assert columns == ["x"] * len(row)
+
+
+def test_canonical_sql_ignores_case_and_whitespace():
+    a, tables = result_cache.canonical_sql("select  ID from Users where id=1")
+    b, _ = result_cache.canonical_sql("SELECT id FROM users WHERE id = 1")
+    assert a == b and tables == {"users"}
+
+
+def test_policy_is_opt_in():
+    assert result_cache.policy_for({"id": 1, "result_cache_ttl": None}) is None
+    policy = result_cache.policy_for({"id": 1, "result_cache_ttl": 60, "result_cache_probe": True})
+    assert (policy.workspace, policy.ttl, policy.probe) == ("1", 60, True)
+
+
+async def _used(r, ws="ws"):
+    return int(await r.get(f"rc:bytes:{ws}") or 0)
+
+
+@pytest.mark.asyncio
+async def test_rewriting_a_key_does_not_double_count(fake_redis):
+    policy = Policy("ws", 60, False)
+    for _ in range(3):
+        assert await result_cache.put("rc:ws:a", policy, ["n"], [(1,)])
+    size = len(result_cache.dumps(["n"], [(1,)]))
+    assert await _used(fake_redis) == size
+    assert await result_cache.get("rc:ws:a") == (["n"], [(1,)], False, {})
+
+
+@pytest.mark.asyncio
+async def test_expired_payloads_are_trimmed_from_the_budget(fake_redis):
+    policy = Policy("ws", 60, False)
+    await result_cache.put("rc:ws:a", policy, ["n"], [(1,)])
+    await fake_redis.zadd("rc:idx:ws", {"rc:ws:a": 0})  # written long ago…
+    await fake_redis.delete("rc:ws:a")                  # …and since expired
+
+    await result_cache.put("rc:ws:b", policy, ["n"], [(2,)])
+    assert await _used(fake_redis) == len(result_cache.dumps(["n"], [(2,)]))
+    assert await fake_redis.zrange("rc:idx:ws", 0, -1) == ["rc:ws:b"]
+
+
+@pytest.mark.asyncio
+async def test_workspace_budget_evicts_oldest(fake_redis, monkeypatch):
+    rows = [(i, "x" * 50) for i in range(20)]
+    size = len(result_cache.dumps(["i", "s"], rows))
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_MAX_WORKSPACE_BYTES", size * 2)
+    policy = Policy("ws", 60, False)
+    for key in ("rc:ws:a", "rc:ws:b", "rc:ws:c"):
+        await result_cache.put(key, policy, ["i", "s"], rows)
+
+    assert await result_cache.get("rc:ws:a") is None
+    assert await result_cache.get("rc:ws:c") is not None
+    assert await _used(fake_redis) == size * 2
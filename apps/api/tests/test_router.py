@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from services.router import AllBackendsFailed, ModelRouter
+
+
+async def _ok(_raw):
+    return True
+
+
+async def _selects(raw):
+    return raw.startswith("SELECT")
+
+
+def _call(result, delay=0.0, exc=None):
+    async def _run():
+        await asyncio.sleep(delay)
+        if exc:
+            raise exc
+        return result
+    return lambda: _run()
+
+
+@pytest.mark.asyncio
+async def test_primary_wins_when_fast():
+    router = ModelRouter(["a", "b"])
+    raw, source = await router.route(
+        ["a", "b"], {"a": _call("SELECT 1"), "b": _call("SELECT 2")}, _ok
+    )
+    assert (raw, source) == ("SELECT 1", "a")
+
+
+@pytest.mark.asyncio
+async def test_hedge_beats_slow_primary(monkeypatch):
+    monkeypatch.setattr("services.router.ROUTER_DEFAULT_HEDGE_S", 0.05)
+    router = ModelRouter(["a", "b"])
+    raw, source = await router.route(
+        ["a", "b"], {"a": _call("SELECT 1", delay=1), "b": _call("SELECT 2")}, _ok
+    )
+    assert source == "b"
+
+
+@pytest.mark.asyncio
+async def test_invalid_sql_falls_through():
+    router = ModelRouter(["a", "b"])
+    raw, source = await router.route(
+        ["a", "b"], {"a": _call("DROP"), "b": _call("SELECT 2")}, _selects
+    )
+    assert source == "b"
+
+
+@pytest.mark.asyncio
+async def test_breaker_skips_failing_backend():
+    router = ModelRouter(["a", "b"])
+    calls = {"a": _call(None, exc=RuntimeError("down")), "b": _call("SELECT 2")}
+    for _ in range(3):
+        await router.route(["a", "b"], calls, _ok)
+    assert router.backends["a"].breaker.state == "open"
+    assert [b.name for b in router.order(["a", "b"])] == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_all_backends_failed():
+    router = ModelRouter(["a"])
+    with pytest.raises(AllBackendsFailed):
+        await router.route(["a"], {"a": _call(None, exc=RuntimeError("x"))}, _ok)
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from services import pools, schema_introspection
+from services.pools import PoolRegistry
+from tests.fakes import FakePool
+
+
+class _Customer:
+    """A customer database: catalog fingerprint, estimates and catalog query rows."""
+
+    def __init__(self):
+        self.fingerprint = "cat:1"
+        self.columns = [("plans", "id"), ("plans", "price"), ("users", "id")]
+        self.rows = {"plans": 10.0, "users": 10.0}
+        self.introspections = 0
+
+    async def answer(self, sql, args):
+        await asyncio.sleep(0.01)
+        if "AS columns" in sql:
+            self.introspections += 1
+            tables = {}
+            for t, c in self.columns:
+                tables.setdefault(t, []).append(c)
+            return [
+                {"table_name": t, "row_estimate": self.rows[t], "columns": cols,
+                 "types": ["integer"] * len(cols), "pk": ["id"], "fks": "[]"}
+                for t, cols in tables.items()
+            ]
+        if "reltuples" in sql:
+            return [{"table_name": t, "row_estimate": n} for t, n in self.rows.items()]
+        return self.fingerprint
+
+
+@pytest.fixture
+def customer(monkeypatch, fake_redis):
+    db = _Customer()
+
+    async def create_pool(dsn, min_size=0, max_size=5):
+        return FakePool(dsn, min_size, max_size, answer=db.answer)
+
+    monkeypatch.setattr(pools.asyncpg, "create_pool", create_pool)
+    monkeypatch.setattr(schema_introspection, "registry", PoolRegistry(max_size=1))
+    schema_introspection._schema_cache.clear()
+    yield db
+    schema_introspection._schema_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_cold_storm_on_a_one_connection_pool_does_not_deadlock(customer):
+    registry = schema_introspection.registry
+
+    async def request():
+        # the handler order: schema first, then borrow the query connection
+        schema = await schema_introspection.get_cached_schema("dsn")
+        async with registry.connection("dsn") as conn:
+            await conn.fetchval("SELECT 1")
+        return schema
+
+    schemas = await asyncio.wait_for(asyncio.gather(*(request() for _ in range(8))), 5)
+    assert set(schemas) == {"plans(id, price)\nusers(id)"}
+    assert customer.introspections == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_while_revalidating(customer):
+    first = await schema_introspection.get_cached_schema("dsn")
+    customer.columns.append(("users", "email"))
+    customer.fingerprint = "cat:2"
+
+    # past the check interval: old schema now, refreshed in the background
+    assert await schema_introspection.get_cached_schema("dsn", ttl=0) == first
+    while schema_introspection._inflight:
+        await asyncio.sleep(0.01)
+    assert "email" in await schema_introspection.get_cached_schema("dsn")
+
+
+@pytest.mark.asyncio
+async def test_unchanged_fingerprint_skips_introspection(customer):
+    await schema_introspection.get_cached_schema("dsn")
+    await schema_introspection.get_cached_schema("dsn", ttl=0)
+    while schema_introspection._inflight:
+        await asyncio.sleep(0.01)
+    assert customer.introspections == 1
+
+
+@pytest.mark.asyncio
+async def test_row_estimates_follow_the_data_without_reintrospection(customer):
+    before = await schema_introspection.get_cached_catalog("dsn")
+    customer.rows["users"] = 2_000_000.0        # ANALYZE after a bulk load; same DDL
+    await schema_introspection.get_cached_catalog("dsn", ttl=0)
+    while schema_introspection._inflight:
+        await asyncio.sleep(0.01)
+
+    after = await schema_introspection.get_cached_catalog("dsn")
+    assert customer.introspections == 1
+    assert after.row_estimate("users") == 2_000_000.0
+    assert "~2M rows" in after.to_prompt(sizes=True)
+    # the catalog handed out earlier is left alone
+    assert before.row_estimate("users") == 10.0
+    assert after.tables["plans"] is before.tables["plans"]
+
+    # and other workers pick the new sizes up from Redis
+    schema_introspection._schema_cache.clear()
+    assert (await schema_introspection.get_cached_catalog("dsn")).row_estimate("users") == 2_000_000.0
+    assert customer.introspections == 1
+
+
+@pytest.mark.asyncio
+async def test_other_workers_reuse_the_redis_copy(customer):
+    await schema_introspection.get_cached_schema("dsn")
+    schema_introspection._schema_cache.clear()  # a fresh worker process
+    catalog = await schema_introspection.get_cached_catalog("dsn")
+    assert customer.introspections == 1
+    assert catalog.tables["plans"].columns == ("id", "price")
+    assert catalog.row_estimate("users") == 10.0
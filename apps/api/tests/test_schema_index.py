@@ -0,0 +1,61 @@
+from services.catalog import SchemaCatalog, Table
+from services.schema_index import SchemaIndex, estimate_tokens, index_for, prune, tokenize
+
+
+def _table(name, columns, fks=(), rows=1000.0):
+    return Table(name, tuple(columns), ("text",) * len(columns), ("id",), tuple(fks), rows)
+
+
+def _catalog(extra=()):
+    tables = [
+        _table("users", ["id", "email", "created_at"]),
+        _table("plans", ["id", "name", "price"]),
+        _table("subscriptions", ["id", "user_id", "plan_id", "status", "started_at"],
+               fks=[(("user_id",), "users", ("id",)), (("plan_id",), "plans", ("id",))]),
+        _table("payments", ["id", "user_id", "amount", "paid_at"],
+               fks=[(("user_id",), "users", ("id",))]),
+        *extra,
+    ]
+    filler = [_table(f"audit_log_{i}", ["id", "actor", "action", "payload"]) for i in range(200)]
+    return SchemaCatalog({t.name: t for t in tables + filler})
+
+
+def test_tokenize_splits_identifiers_and_stems():
+    assert tokenize("createdAt") == ["created", "at"]
+    assert tokenize("user_subscriptions") == ["user", "subscription"]
+
+
+def test_synonyms_find_the_right_table():
+    index = SchemaIndex()
+    index.update(_catalog())
+    assert index.search("total revenue by month")[0][0] == "payments"
+    assert index.search("how many customers signed up")[0][0] == "users"
+
+
+def test_selection_pulls_in_fk_neighbours_within_budget():
+    index = SchemaIndex()
+    index.update(_catalog())
+    chosen = index.select("active subscriptions", budget_tokens=120)
+    assert {"subscriptions", "users", "plans"} <= set(chosen)
+    assert not any(name.startswith("audit_log") for name in chosen)
+
+
+def test_small_schema_is_sent_whole():
+    catalog = SchemaCatalog({"users": _table("users", ["id", "email"])})
+    assert prune(catalog, "anything", 1000) == catalog.to_prompt(sizes=True)
+
+
+def test_pruned_prompt_respects_budget():
+    text = prune(_catalog(), "payments per user", 60)
+    assert "payments(" in text
+    assert estimate_tokens(text) <= 60
+
+
+def test_incremental_update_only_reindexes_changes():
+    index = index_for("ws-inc", _catalog())
+    changed = index.update(_catalog(extra=[_table("invoices", ["id", "amount", "due_at"])]))
+    assert changed == 1
+    assert index.search("unpaid invoices")[0][0] == "invoices"
+
+    assert index.update(_catalog()) == 1          # invoices dropped again
+    assert all(name != "invoices" for name, _ in index.search("invoices"))
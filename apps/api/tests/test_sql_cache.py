@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from services import sql_cache
+
+SCHEMA = "users(id, email)"
+
+
+@pytest.fixture(autouse=True)
+def _fresh(fake_redis):
+    sql_cache._l1.clear()
+    sql_cache._fingerprints.clear()
+    yield
+    sql_cache._l1.clear()
+
+
+def _generator(sql="SELECT email FROM users;", delay=0.02, exc=None):
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if exc:
+            raise exc
+        return sql, "sqlcoder"
+
+    return generate, calls
+
+
+def test_normalize_question():
+    assert sql_cache.normalize_question("  List   Users?! ") == "list users"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_generation():
+    generate, calls = _generator()
+    results = await asyncio.gather(*(
+        sql_cache.get_or_generate("ws", "list users", SCHEMA, generate)
+        for _ in range(5)
+    ))
+    assert len(calls) == 1
+    assert sorted(hit for *_, hit in results) == [False, True, True, True, True]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_fail_followers():
+    generate, calls = _generator(delay=0.05)
+    leader = asyncio.create_task(sql_cache.get_or_generate("ws", "q", SCHEMA, generate))
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(sql_cache.get_or_generate("ws", "q", SCHEMA, generate))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    sql, source, hit = await follower
+    assert sql == "SELECT email FROM users;" and hit
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller_and_are_not_cached():
+    generate, calls = _generator(exc=ValueError("❌ bad"))
+    results = await asyncio.gather(
+        *(sql_cache.get_or_generate("ws", "q", SCHEMA, generate) for _ in range(3)),
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, ValueError) for r in results)
+
+    ok, _ = _generator()
+    assert (await sql_cache.get_or_generate("ws", "q", SCHEMA, ok))[2] is False
+
+
+@pytest.mark.asyncio
+async def test_l2_is_shared_and_schema_change_misses():
+    generate, calls = _generator()
+    await sql_cache.get_or_generate("ws", "q", SCHEMA, generate)
+
+    sql_cache._l1.clear()  # another worker: only Redis has it
+    assert (await sql_cache.get_or_generate("ws", "q", SCHEMA, generate))[2] is True
+
+    await sql_cache.get_or_generate("ws", "q", SCHEMA + "\nplans(id)", generate)
+    assert len(calls) == 2
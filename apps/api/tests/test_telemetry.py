@@ -0,0 +1,94 @@
+import asyncio
+import json
+import logging
+
+import httpx
+import pytest
+
+from services import http_clients, telemetry
+from services.telemetry import Counter, EventExporter, Histogram, JsonFormatter, SampleFilter
+
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    h = Histogram("t_seconds", "test", buckets=(0.1, 1.0))
+    for s in (0.05, 0.5, 0.7, 5.0):
+        h.observe(s, stage="query")
+    lines = h.lines()
+    assert 't_seconds_bucket{stage="query",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="query",le="1.0"} 3' in lines
+    assert 't_seconds_bucket{stage="query",le="+Inf"} 4' in lines
+    assert 't_seconds_count{stage="query"} 4' in lines
+    assert any(l.startswith('t_seconds_sum{stage="query"} 6.25') for l in lines)
+
+
+def test_stage_records_even_when_the_block_raises():
+    before = telemetry.stage_seconds.count(stage="t-fail")
+    with pytest.raises(ValueError):
+        with telemetry.stage("t-fail"):
+            raise ValueError
+    assert telemetry.stage_seconds.count(stage="t-fail") == before + 1
+    assert 'askdb_stage_seconds_count{stage="t-fail"}' in telemetry.metrics_text()
+
+
+def test_counter_lines():
+    c = Counter("t_total", "test")
+    c.inc(outcome="sent")
+    c.inc(2, outcome="sent")
+    assert c.lines()[-1] == 't_total{outcome="sent"} 3'
+
+
+def test_sampled_json_logs_keep_every_warning():
+    f = SampleFilter(0.0)
+    info = logging.LogRecord("askdb", logging.INFO, "", 0, "ask", None, None)
+    warn = logging.LogRecord("askdb", logging.WARNING, "", 0, "slow", None, None)
+    assert not f.filter(info) and f.filter(warn)
+
+    warn.fields = {"backend": "gpt4"}
+    entry = json.loads(JsonFormatter().format(warn))
+    assert entry["msg"] == "slow" and entry["level"] == "warning" and entry["backend"] == "gpt4"
+
+
+@pytest.fixture
+def posthog(monkeypatch):
+    batches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        batches.append(json.loads(request.content))
+        return httpx.Response(200, json={"status": 1})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_clients, "posthog_client", lambda: client)
+    return batches
+
+
+@pytest.mark.asyncio
+async def test_exporter_sends_batches_in_the_background(posthog):
+    exporter = EventExporter(api_key="phc_test", host="https://ph.test", batch_size=3, interval=0.05)
+    exporter.start()
+    for i in range(5):
+        exporter.capture("u1", "query_executed", {"i": i})
+    await asyncio.sleep(0.2)
+    await exporter.close()
+
+    assert [len(b["batch"]) for b in posthog] == [3, 2]
+    assert posthog[0]["api_key"] == "phc_test"
+    assert posthog[0]["batch"][0]["properties"] == {"i": 0}
+
+
+@pytest.mark.asyncio
+async def test_exporter_drops_instead_of_blocking(posthog):
+    exporter = EventExporter(api_key="phc_test", queue_max=2)
+    dropped = telemetry.events_total.value(outcome="dropped")
+    for _ in range(5):
+        exporter.capture("u1", "query_executed")  # no flusher running
+    assert telemetry.events_total.value(outcome="dropped") == dropped + 3
+
+    await exporter.close()  # drains what was queued
+    assert sum(len(b["batch"]) for b in posthog) == 2
+
+
+def test_exporter_without_a_key_is_a_no_op():
+    exporter = EventExporter(api_key=None)
+    exporter.capture("u1", "query_executed")
+    exporter.start()
+    assert exporter._queue.empty() and exporter._task is None
@@ -0,0 +1,112 @@
+import pytest
+
+from services import nl2sql, templates
+from services.catalog import SchemaCatalog, Table
+from services.validator import validate_sql
+
+TS = "timestamp without time zone"
+
+# data/sample_saas_dump.sql
+CATALOG = SchemaCatalog({
+    "plans": Table(
+        "plans", ("id", "name", "price", "created_at"),
+        ("integer", "character varying(50)", "numeric(10,2)", TS), ("id",), (), 4.0,
+    ),
+    "users": Table(
+        "users", ("id", "email", "name", "password_hash", "created_at"),
+        ("integer", "character varying(255)", "character varying(255)", "character varying(255)", TS),
+        ("id",), (), 100.0,
+    ),
+    "projects": Table(
+        "projects", ("id", "user_id", "name", "description", "created_at"),
+        ("integer", "integer", "character varying(255)", "text", TS), ("id",), (), 200.0,
+    ),
+    "subscriptions": Table(
+        "subscriptions", ("id", "user_id", "plan_id", "status", "started_at", "ended_at"),
+        ("integer", "integer", "integer", "character varying(20)", TS, TS), ("id",), (), 100.0,
+    ),
+    "payments": Table(
+        "payments", ("id", "user_id", "amount", "status", "paid_at"),
+        ("integer", "integer", "numeric(10,2)", "character varying(20)", TS), ("id",), (), 500.0,
+    ),
+})
+
+
+@pytest.mark.parametrize("question, sql", [
+    ("Show all plans.", "SELECT * FROM plans"),
+    ("List every user email.", "SELECT email FROM users"),
+    ("names and emails of users", "SELECT name, email FROM users"),
+    ("How many users?", "SELECT COUNT(*) AS count FROM users"),
+    ("Show number of subscriptions by status.",
+     "SELECT status, COUNT(*) AS count FROM subscriptions GROUP BY status ORDER BY count DESC"),
+    ("Show count of projects per user.",
+     "SELECT user_id, COUNT(*) AS count FROM projects GROUP BY user_id ORDER BY count DESC"),
+    ("Show all plans sorted by price descending.", "SELECT * FROM plans ORDER BY price DESC"),
+    ("Show first 5 users ordered by created date.", "SELECT * FROM users ORDER BY created_at LIMIT 5"),
+    ("Top 3 plans by price", "SELECT * FROM plans ORDER BY price DESC LIMIT 3"),
+    ("latest 10 payments", "SELECT * FROM payments ORDER BY paid_at DESC LIMIT 10"),
+    ("Show the latest payment", "SELECT * FROM payments ORDER BY paid_at DESC LIMIT 1"),
+    ("Show the oldest user", "SELECT * FROM users ORDER BY created_at LIMIT 1"),
+    ("Show the latest payments", "SELECT * FROM payments ORDER BY paid_at DESC"),
+    ("List payments above $10.", "SELECT * FROM payments WHERE amount > 10 ORDER BY amount"),
+    ("Show plans priced above $1,000.", "SELECT * FROM plans WHERE price > 1000 ORDER BY price"),
+    ("Show subscriptions started in the last 7 days.",
+     "SELECT * FROM subscriptions WHERE started_at >= NOW() - INTERVAL '7 day' ORDER BY started_at DESC"),
+    ("Show projects created this year.",
+     "SELECT * FROM projects WHERE created_at >= DATE_TRUNC('year', NOW()) "
+     "AND created_at < DATE_TRUNC('year', NOW()) + INTERVAL '1 year' ORDER BY created_at DESC"),
+    ("Show subscriptions with missing end date.", "SELECT * FROM subscriptions WHERE ended_at IS NULL"),
+])
+def test_common_shapes_are_answered_locally(question, sql):
+    assert templates.match(question, CATALOG) == sql
+    validate_sql(sql, CATALOG)
+
+
+@pytest.mark.parametrize("question", [
+    "List the top 3 most expensive plans.",       # "expensive" is not a column
+    "List users without projects.",               # needs a join
+    "List all active subscriptions.",             # a value filter
+    "Show payments marked as paid.",
+    "Show count of users per plan.",              # group column on another table
+    "Show latest payment for each user.",
+    "Show users over 30.",                        # no column named, no $
+    "Show subscriptions in the last 7 days.",     # two timestamp columns
+    "Which users churned after the price change?",
+    "Show users sorted by date",                  # "date" names no column
+    "Top 5 payments by date",
+    "Show the date of payments",
+])
+def test_anything_else_is_left_to_the_models(question):
+    assert templates.match(question, CATALOG) is None
+
+
+def test_ambiguous_names_are_not_guessed():
+    catalog = SchemaCatalog({
+        **CATALOG.tables,
+        "user": Table("user", ("id",), ("integer",), ("id",), (), 1.0),
+    })
+    # "users" and "user" are the same word once stemmed
+    assert templates.match("Show all users", catalog) is None
+
+
+@pytest.mark.asyncio
+async def test_to_sql_skips_the_models_for_a_template(monkeypatch):
+    async def route(*args, **kwargs):
+        raise AssertionError("model called")
+
+    monkeypatch.setattr(nl2sql.router, "route", route)
+    assert await nl2sql.to_sql("How many users?", CATALOG) == (
+        "SELECT COUNT(*) AS count FROM users", "template"
+    )
+
+
+@pytest.mark.asyncio
+async def test_to_sql_falls_back_to_the_models(monkeypatch):
+    async def route(policy, backends, validate):
+        return "SELECT id FROM users", "gpt4"
+
+    monkeypatch.setattr(nl2sql.router, "route", route)
+    assert await nl2sql.to_sql("List users without projects.", CATALOG) == ("SELECT id FROM users", "gpt4")
+    assert await nl2sql.to_sql("How many users?", CATALOG, use_templates=False) == (
+        "SELECT id FROM users", "gpt4"
+    )
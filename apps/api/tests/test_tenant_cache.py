@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from services import tenant_cache, workspace
+from services.lru import TTLCache
+
+
+class _ControlPool:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    async def fetchrow(self, _sql, team):
+        self.queries += 1
+        return self.rows.get(team)
+
+
+@pytest.fixture
+def control(monkeypatch):
+    tenant_cache.workspaces.clear()
+    pool = _ControlPool({
+        "T1": {"slack_team_id": "T1", "clerk_id": "user_1", "db_url_enc": "enc-1"},
+        "T2": {"slack_team_id": "T2", "clerk_id": "user_2", "db_url_enc": "enc-2"},
+    })
+
+    async def get_control_pool():
+        return pool
+
+    monkeypatch.setattr(workspace, "get_control_pool", get_control_pool)
+    monkeypatch.setattr(workspace, "decrypt_dsn", lambda enc: f"postgres://{enc}")
+    yield pool
+    tenant_cache.workspaces.clear()
+
+
+@pytest.mark.asyncio
+async def test_resolution_is_cached(control):
+    first = await workspace._resolve_workspace("T1", "user_1")
+    second = await workspace._resolve_workspace("T1", "user_1")
+    assert first == second and first[1] == "postgres://enc-1"
+    assert control.queries == 1
+
+
+@pytest.mark.asyncio
+async def test_wrong_owner_is_rejected_and_not_cached(control):
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await workspace._resolve_workspace("T1", "someone_else")
+    assert control.queries == 2
+
+
+@pytest.mark.asyncio
+async def test_notify_evicts_only_that_team(control):
+    await workspace._resolve_workspace("T1", "user_1")
+    await workspace._resolve_workspace("T2", "user_2")
+
+    tenant_cache.listener._on_notify(None, 0, tenant_cache.WORKSPACES_CHANNEL, "T1")
+    await workspace._resolve_workspace("T1", "user_1")
+    await workspace._resolve_workspace("T2", "user_2")
+    assert control.queries == 3
+
+
+@pytest.mark.asyncio
+async def test_lost_listener_connection_drops_everything(control):
+    await workspace._resolve_workspace("T1", "user_1")
+    tenant_cache.listener._on_terminate(None)
+    assert tenant_cache.workspaces.stats()["size"] == 0
+
+
+@pytest.mark.asyncio
+async def test_listener_reconnects_with_backoff_after_any_error(control, monkeypatch):
+    monkeypatch.setattr(tenant_cache, "LISTENER_RETRY_MIN", 0.001)
+    monkeypatch.setattr(tenant_cache, "LISTENER_RETRY_MAX", 0.004)
+    attempts = []
+    connected = asyncio.Event()
+
+    class _Conn:
+        def add_termination_listener(self, callback):
+            pass
+
+        async def add_listener(self, channel, callback):
+            connected.set()
+
+        def is_closed(self):
+            return False
+
+        async def close(self, timeout=None):
+            pass
+
+    async def connect(dsn):
+        attempts.append(time.monotonic())
+        if len(attempts) <= 4:
+            raise ValueError("invalid DSN")         # not an OSError/PostgresError
+        return _Conn()
+
+    monkeypatch.setattr(tenant_cache.asyncpg, "connect", connect)
+    listener = tenant_cache.WorkspaceListener("postgres://control")
+    await workspace._resolve_workspace("T1", "user_1")
+    listener.start()
+    try:
+        await asyncio.wait_for(connected.wait(), 1)
+    finally:
+        await listener.close()
+    assert len(attempts) == 5
+    gaps = [b - a for a, b in zip(attempts, attempts[1:])]
+    assert gaps[2] >= 0.004 and gaps[3] >= 0.004    # 1, 2, 4, then capped at 4 ms
+    assert tenant_cache.workspaces.stats()["size"] == 0
+
+
+def test_ttl_cache_expiry_and_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("services.lru.time.monotonic", lambda: now[0])
+    cache = TTLCache(ttl=10, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)                   # evicts b, the least recently used
+    assert cache.get("b") is None and cache.get("a") == 1
+
+    cache.set("d", 4, ttl=60)           # per-entry ttl never exceeds the cache ttl
+    now[0] += 11
+    assert cache.get("d") is None
+    assert cache.stats()["hits"] == 2
+
+
+def test_token_key_does_not_keep_the_token():
+    key = tenant_cache.token_key("secret-bearer")
+    assert "secret" not in key and len(key) == 64
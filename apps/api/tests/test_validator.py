@@ -0,0 +1,70 @@
+import pytest
+
+from services import validator
+from services.validator import CompiledValidator, avalidate_sql, compiled_for, validate_sql
+
+SCHEMA = "plans(id, name, price)\nusers(id, email, name, created_at)"
+
+
+class _CountingGuard:
+    def __init__(self):
+        self.calls = 0
+
+    def parse(self, sql):
+        self.calls += 1
+        return type("Outcome", (), {"validated_output": None})()
+
+
+@pytest.fixture
+def guard(monkeypatch):
+    g = _CountingGuard()
+    monkeypatch.setattr(validator, "_guard", lambda: g)
+    return g
+
+
+def test_accepts_select_and_appends_semicolon(guard):
+    assert validate_sql("SELECT * FROM plans", SCHEMA) == "SELECT * FROM plans;"
+
+
+@pytest.mark.parametrize("sql, message", [
+    ("DELETE FROM plans", "Only SELECT"),
+    ("SELECT 1; DROP TABLE plans", "Multiple SQL statements"),
+    ("SELECT * FROM secrets", "Unknown tables"),
+    ("SELEC * FROM plans", "syntax error"),
+])
+def test_rejections(guard, sql, message):
+    with pytest.raises(ValueError, match=message):
+        validate_sql(sql, SCHEMA)
+
+
+def test_verdicts_are_memoized_including_errors(guard):
+    v = CompiledValidator(SCHEMA)
+    for _ in range(3):
+        v.validate("SELECT email FROM users")
+    assert guard.calls == 1
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            v.validate("SELECT * FROM secrets")
+    assert v.cached("SELECT * FROM secrets")[0] == "error"
+
+
+def test_compiled_validator_is_shared_per_schema():
+    assert compiled_for(SCHEMA) is compiled_for(SCHEMA)
+    assert compiled_for(SCHEMA) is not compiled_for(SCHEMA + "\nteams(id)")
+
+
+def test_verdict_lru_is_bounded(guard, monkeypatch):
+    monkeypatch.setattr(validator, "VALIDATOR_RESULT_SIZE", 2)
+    v = CompiledValidator(SCHEMA)
+    for n in range(4):
+        v.validate(f"SELECT {n} FROM plans")
+    assert v.cached("SELECT 0 FROM plans") is None
+    assert v.cached("SELECT 3 FROM plans") is not None
+
+
+@pytest.mark.asyncio
+async def test_async_validation_matches_sync(guard):
+    assert await avalidate_sql("SELECT id FROM plans", SCHEMA) == "SELECT id FROM plans;"
+    with pytest.raises(ValueError):
+        await avalidate_sql("SELECT * FROM secrets", SCHEMA)
@@ -1,5 +1,6 @@
 import os
 import asyncpg
+import redis.asyncio as redis
 from cryptography.fernet import Fernet
 from urllib.parse import urlparse, urlunparse
 
@@ -12,7 +13,28 @@ async def get_control_pool() -> asyncpg.Pool:
         _control_pool = await asyncpg.create_pool(os.getenv("DATABASE_URL"))
     return _control_pool
 
+async def close_control_pool() -> None:
+    global _control_pool
+    if _control_pool:
+        await _control_pool.close()
+        _control_pool = None
+
 # 2) Decrypt a DSN
 _cipher = Fernet(os.getenv("FERNET_KEY"))  # generate one and store in .env
 def decrypt_dsn(enc: str) -> str:
     return _cipher.decrypt(enc.encode()).decode()
+
+# 3) Shared Redis clients (text, and binary for cached payloads)
+_redis: redis.Redis | None = None
+_redis_bytes: redis.Redis | None = None
+def get_redis() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+    return _redis
+
+def get_redis_bytes() -> redis.Redis:
+    global _redis_bytes
+    if _redis_bytes is None:
+        _redis_bytes = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    return _redis_bytes
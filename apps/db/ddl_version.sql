@@ -0,0 +1,25 @@
+-- apps/db/ddl_version.sql
+-- Optional, installed on a customer database by its owner.
+-- Bumps a counter on every DDL command so AskDB's schema cache can detect
+-- changes with a single-row read instead of hashing pg_attribute.
+CREATE SCHEMA IF NOT EXISTS askdb;
+
+CREATE TABLE IF NOT EXISTS askdb.ddl_version (
+  version BIGINT NOT NULL
+);
+INSERT INTO askdb.ddl_version (version)
+SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM askdb.ddl_version);
+
+CREATE OR REPLACE FUNCTION askdb.bump_ddl_version() RETURNS event_trigger AS $$
+BEGIN
+  UPDATE askdb.ddl_version SET version = version + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP EVENT TRIGGER IF EXISTS askdb_ddl_version;
+CREATE EVENT TRIGGER askdb_ddl_version ON ddl_command_end
+  EXECUTE FUNCTION askdb.bump_ddl_version();
+
+-- the read-only AskDB role needs to see the counter
+GRANT USAGE ON SCHEMA askdb TO PUBLIC;
+GRANT SELECT ON askdb.ddl_version TO PUBLIC;
@@ -1,20 +1,133 @@
 import os
 import io
+import time
+import asyncio
 import httpx
+import redis.asyncio as redis
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
+from slack_bolt.response import BoltResponse
 from fastapi import FastAPI, Request
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 
 # somewhere at top of file
-CHART_TIMEOUT = httpx.Timeout(
-    # keep your connect timeout small so you don’t wait forever to establish a socket
-    connect=5.0,
-    # but allow plenty of time for the server to respond
-    read=120.0,
-    write=60.0,
-    pool=1.0
-)
+# pool == the call's own budget: with one shared client a burst waits for a
+# free connection instead of failing fast with PoolTimeout
+ASK_TIMEOUT = httpx.Timeout(30.0, connect=5.0, pool=30.0)
+
+# /jobs mode: submit, then long-poll the job status in short requests
+# instead of holding one connection for the whole pipeline
+JOB_POLL_WAIT = float(os.getenv("ASKDB_JOB_POLL_WAIT", "25"))
+JOB_DEADLINE  = float(os.getenv("ASKDB_JOB_DEADLINE", "600"))
+JOB_TIMEOUT   = httpx.Timeout(connect=5.0, read=JOB_POLL_WAIT + 10.0, write=10.0, pool=30.0)
+
+# One keep-alive client for every call to the AskDB API (created in lifespan)
+_api_client: httpx.AsyncClient | None = None
+
+def api_client() -> httpx.AsyncClient:
+    global _api_client
+    if _api_client is None or _api_client.is_closed:
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        _api_client = httpx.AsyncClient(
+            timeout=ASK_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("API_MAX_CONNECTIONS", "50")),
+                max_keepalive_connections=int(os.getenv("API_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=60.0,
+            ),
+            http2=http2,
+        )
+    return _api_client
+
+# Slow work (API round trip, chart upload) runs on a bounded pool after ack();
+# when the queue is full the user is told to retry instead of piling on
+SLACK_WORKERS     = int(os.getenv("SLACK_WORKERS", "8"))
+SLACK_QUEUE_MAX   = int(os.getenv("SLACK_QUEUE_MAX", "100"))
+# Slack re-delivers events it thinks timed out; each id is handled once
+SLACK_DEDUPE_TTL  = int(os.getenv("SLACK_DEDUPE_TTL", "600"))
+# channels the bot has joined, so charts don't call conversations.join every time
+SLACK_JOIN_TTL    = float(os.getenv("SLACK_JOIN_TTL", "3600"))
+SLACK_JOIN_MAX    = int(os.getenv("SLACK_JOIN_MAX", "10000"))
+
+
+class TaskPool:
+    """N worker tasks draining a bounded queue of slow Slack work."""
+
+    def __init__(self, size: int = SLACK_WORKERS, queue_max: int = SLACK_QUEUE_MAX):
+        self.size = size
+        self._queue: asyncio.Queue = asyncio.Queue(queue_max)
+        self._tasks: list[asyncio.Task] = []
+
+    def submit(self, fn, *args) -> bool:
+        """Queue `await fn(*args)`; False if the queue is full."""
+        try:
+            self._queue.put_nowait((fn, args))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            fn, args = await self._queue.get()
+            try:
+                await fn(*args)
+            except Exception as e:
+                print(f"⚠️ Slack task {getattr(fn, '__name__', fn)} failed: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.size)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+tasks = TaskPool()
+
+_redis: redis.Redis | None = None
+
+def get_redis() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True)
+    return _redis
+
+
+async def first_delivery(delivery_id: str) -> bool:
+    """True the first time *delivery_id* is seen within SLACK_DEDUPE_TTL."""
+    try:
+        return bool(await get_redis().set(
+            f"slack:seen:{delivery_id}", 1, nx=True, ex=SLACK_DEDUPE_TTL
+        ))
+    except redis.RedisError as e:
+        print(f"⚠️ Slack dedupe unavailable, handling anyway: {e}")
+        return True
+
+
+_joined: dict[str, float] = {}   # channel id → monotonic expiry
+
+async def ensure_joined(channel_id: str) -> None:
+    if _joined.get(channel_id, 0.0) > time.monotonic():
+        return
+    try:
+        await slack_app.client.conversations_join(channel=channel_id)
+    except Exception as e:
+        print("join failed:", e)
+        return
+    _joined.pop(channel_id, None)
+    _joined[channel_id] = time.monotonic() + SLACK_JOIN_TTL
+    while len(_joined) > SLACK_JOIN_MAX:
+        _joined.pop(next(iter(_joined)))
 
 # Load local .env.dev if running in dev
 load_dotenv(".env.dev")
@@ -28,8 +141,80 @@ async def custom_error_handler(error, body, logger):
     logger.exception("Uncaught exception in Slack handler")
     logger.error("Request body: %r", body)
 
-askdb_api_url = os.getenv("ASKDB_API_URL", "http://127.0.0.1:8001/ask")
-askdb_chart_api_url = os.getenv("ASKDB_CHART_API_URL", "http://127.0.0.1:8001/chart")
+
+@slack_app.middleware
+async def drop_redeliveries(req, body, next):
+    # events carry an event_id that survives Slack's retries; commands and
+    # interactions a trigger_id per invocation
+    delivery_id = body.get("event_id") or body.get("trigger_id")
+    if delivery_id and not await first_delivery(delivery_id):
+        retry = (req.headers.get("x-slack-retry-num") or ["-"])[0]
+        print(f"🔁 Dropping Slack redelivery {delivery_id} (retry {retry})")
+        return BoltResponse(status=200, body="")
+    return await next()
+
+askdb_jobs_api_url = os.getenv("ASKDB_JOBS_API_URL", "http://127.0.0.1:8001/jobs")
+
+
+def _api_headers(body) -> dict:
+    return {
+        "Authorization": body.get("token", ""),          # your auth-bypass header if dev
+        "x-slack-team": body["team_id"],                 # ⚡ send the Slack team
+    }
+
+
+def _error_message(resp: httpx.Response) -> str:
+    if resp.status_code == 401:
+        return "🔒 Authorization error. Please sign in."
+    if resp.status_code == 429:
+        return "⏳ Rate limit exceeded. Please wait a minute and try again."
+    try:
+        error_detail = resp.json().get("detail", "Unknown error.")
+    except Exception:
+        error_detail = resp.text
+    return f"⚠️ {error_detail}"
+
+
+async def run_job(kind: str, body, question: str) -> httpx.Response | str:
+    """
+    Submit *question* as an AskDB job and wait for it to finish.
+    Returns the job's result response, or a message to show the user.
+    """
+    headers = _api_headers(body)
+    try:
+        resp = await api_client().post(
+            askdb_jobs_api_url,
+            json={"user_id": body["user_id"], "question": question, "kind": kind},
+            headers=headers,
+            timeout=ASK_TIMEOUT,
+        )
+        if resp.status_code != 202:
+            return _error_message(resp)
+        job_url = f"{askdb_jobs_api_url}/{resp.json()['job_id']}"
+
+        deadline = time.monotonic() + JOB_DEADLINE
+        while True:
+            resp = await api_client().get(
+                job_url, params={"wait": JOB_POLL_WAIT}, headers=headers, timeout=JOB_TIMEOUT
+            )
+            if resp.status_code != 200:
+                return _error_message(resp)
+            if resp.json()["status"] in ("done", "failed"):
+                break
+            if time.monotonic() >= deadline:
+                return "⏳ Still working on it. Please try again in a few minutes."
+
+        resp = await api_client().get(f"{job_url}/result", headers=headers, timeout=ASK_TIMEOUT)
+    except httpx.RequestError as e:
+        return f"🚨 Error reaching AskDB API: {e}"
+    if resp.status_code != 200:
+        return _error_message(resp)
+    return resp
+
+
+BUSY_MESSAGE = "⏳ AskDB is busy right now. Please try again in a minute."
+
+
 @slack_app.command("/askdb")
 async def handle_askdb(ack, body, respond):
     await ack()
@@ -41,35 +226,16 @@ async def handle_askdb(ack, body, respond):
         await respond("⚠️ Missing user ID or question.")
         return
 
-    try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            # resp = await client.post(
-            #     askdb_api_url,
-            #     json={"user_id": user_id, "question": question},
-            #     headers={"Authorization": body.get("token", "dummy-token")},
-            # )
-            resp = await client.post(
-            askdb_api_url,
-            json={"user_id": user_id, "question": question},
-            headers={
-            "Authorization": body.get("token", ""),          # your auth-bypass header if dev
-            "x-slack-team": body["team_id"],                 # ⚡ send the Slack team
-            },)
-    except httpx.RequestError as e:
-        await respond(f"🚨 Error reaching AskDB API: {e}")
-        return
-    if resp.status_code == 401:
-        await respond("🔒 Authorization error. Please sign in.")
-        return
-    if resp.status_code == 429:
-        await respond("⏳ Rate limit exceeded. Please wait a minute and try again.")
+    if not tasks.submit(answer_askdb, body, respond, question):
+        await respond(BUSY_MESSAGE)
+
+
+async def answer_askdb(body, respond, question: str) -> None:
+    # the answer is posted through response_url once the job is done
+    resp = await run_job("ask", body, question)
+    if isinstance(resp, str):
+        await respond(resp)
         return
-    if resp.status_code != 200:
-        try:
-            error_detail = resp.json().get("detail", "Unknown error.")
-        except Exception:
-            error_detail = resp.text
-        return await respond(f"⚠️ {error_detail}")
 
     try:
         answer = resp.json().get("answer", "🤖 Sorry, no answer available.")
@@ -79,7 +245,20 @@ async def handle_askdb(ack, body, respond):
     await respond(answer)
 
 # Create FastAPI app
-api = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    api_client()
+    tasks.start()
+    try:
+        yield
+    finally:
+        await tasks.close()
+        if _api_client is not None:
+            await _api_client.aclose()
+        if _redis is not None:
+            await _redis.close()
+
+api = FastAPI(lifespan=lifespan)
 
 # Create Slack request handler
 handler = AsyncSlackRequestHandler(slack_app)
@@ -94,40 +273,22 @@ async def slack_events(req: Request):
 async def handle_chart(ack, body, respond):
     await ack()
 
+    question = body.get("text") or "Show MRR by month"
+    if not tasks.submit(post_chart, body, respond, question):
+        await respond(BUSY_MESSAGE)
+
+
+async def post_chart(body, respond, question: str) -> None:
     channel_id = body["channel_id"]
-    question   = body.get("text", "Show MRR by month")
-    user_id    = body["user_id"]
 
-    # join
-    try:
-        join_resp = await slack_app.client.conversations_join(channel=channel_id)
-        #print("join response:", join_resp)
-    except Exception as e:
-        print("join failed:", e)
+    # 1) join (once per SLACK_JOIN_TTL)
+    await ensure_joined(channel_id)
+
+    # 2) Run the /chart pipeline as a job; upload when it completes
+    resp = await run_job("chart", body, question)
+    if isinstance(resp, str):
+        return await respond(resp)
 
-    # 2) Hit your /chart endpoint…
-    async with httpx.AsyncClient(timeout=CHART_TIMEOUT) as client:
-        # resp = await client.post(
-        #     askdb_chart_api_url,
-        #     json={"user_id": user_id, "question": question},
-        #     headers={"Authorization": body.get("token", "")},
-        # )
-        resp = await client.post(
-            askdb_chart_api_url,
-            json={"user_id": user_id, "question": question},
-            headers={
-            "Authorization": body.get("token", ""),          # your auth-bypass header if dev
-            "x-slack-team": body["team_id"],                 # ⚡ send the Slack team
-            },)
-    # if resp.status_code != 200:
-    #     return await respond(f"Chart error: {resp.text}")
-    if resp.status_code != 200:
-        try:
-            error_detail = resp.json().get("detail", "Unknown error.")
-        except Exception:
-            error_detail = resp.text
-        return await respond(f"⚠️ {error_detail}")
-        
     # 3) Upload via the v2 API
     fileobj = io.BytesIO(resp.content)
     fileobj.name = "chart.png"
@@ -135,13 +296,14 @@ async def handle_chart(ack, body, respond):
 
     try:
         upload_resp = await slack_app.client.files_upload_v2(
-            channel=body["channel_id"],  
+            channel=channel_id,
             file=fileobj,
             filename="chart.png",
             title=question[:80],
         )
         #print("upload response:", upload_resp)
     except Exception as e:
+        _joined.pop(channel_id, None)   # maybe removed from the channel: re-join next time
         await respond(f"❌ Slack upload failed: {e}")
 
 
@@ -0,0 +1,19 @@
+-- compose/init/05_workspaces_notify.sql
+-- Tell API processes to drop cached tenant entries when a workspace changes.
+CREATE OR REPLACE FUNCTION notify_workspaces_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    PERFORM pg_notify('workspaces_changed', OLD.slack_team_id);
+  ELSE
+    PERFORM pg_notify('workspaces_changed', NEW.slack_team_id);
+    IF TG_OP = 'UPDATE' AND OLD.slack_team_id <> NEW.slack_team_id THEN
+      PERFORM pg_notify('workspaces_changed', OLD.slack_team_id);
+    END IF;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER workspaces_changed
+AFTER INSERT OR UPDATE OR DELETE ON workspaces
+FOR EACH ROW EXECUTE FUNCTION notify_workspaces_changed();
@@ -0,0 +1,7 @@
+-- compose/init/06_result_cache.sql
+-- Per-workspace, opt-in query result cache.
+--   result_cache_ttl   : seconds a cached result may be served (NULL = off)
+--   result_cache_probe : also key on pg_stat_user_tables write counters
+ALTER TABLE workspaces
+  ADD COLUMN result_cache_ttl   INTEGER,
+  ADD COLUMN result_cache_probe BOOLEAN NOT NULL DEFAULT false;
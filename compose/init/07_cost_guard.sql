@@ -0,0 +1,7 @@
+-- compose/init/07_cost_guard.sql
+-- Per-workspace execution limits for the cost guard (NULL = API default).
+ALTER TABLE workspaces
+  ADD COLUMN max_query_cost       DOUBLE PRECISION,
+  ADD COLUMN max_result_rows      INTEGER,
+  ADD COLUMN statement_timeout_ms INTEGER,
+  ADD COLUMN work_mem             TEXT;
@@ -0,0 +1,7 @@
+-- compose/init/08_replica.sql
+-- Per-workspace, opt-in analytical replica (DuckDB over local Parquet).
+--   replica_tables  : customer tables to snapshot (NULL = off)
+--   replica_max_lag : seconds a snapshot may be behind and still answer
+ALTER TABLE workspaces
+  ADD COLUMN replica_tables  TEXT[],
+  ADD COLUMN replica_max_lag INTEGER;
@@ -0,0 +1,7 @@
+-- compose/init/09_rate_limits.sql
+-- Per-workspace rate-limit quotas.
+--   plan               : picks user/workspace requests per minute from RATE_LIMIT_PLANS
+--   rate_limit_per_min : per-user override (NULL = the plan's quota)
+ALTER TABLE workspaces
+  ADD COLUMN plan               TEXT NOT NULL DEFAULT 'free',
+  ADD COLUMN rate_limit_per_min INTEGER;